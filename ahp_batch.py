@@ -0,0 +1,121 @@
+"""
+Пакетный пересчет сохраненных проектов AHP без интерфейса.
+
+Пример:
+  python ahp_batch.py sessions/ "archive/**/*.ahp" -o results.csv --workers 8
+
+Принимает каталоги (берутся все .json/.ahp/.npz внутри, рекурсивно) и glob-шаблоны.
+Не импортирует streamlit и plotly - только numpy и модули расчета.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import ahp_engine
+import ahp_format
+
+PROJECT_EXTENSIONS = ('.json', '.ahp', '.npz')
+RESULT_COLUMNS = ['path', 'status', 'error', 'n_criteria', 'n_alternatives', 'winner', 'winner_weight', 'max_cr',
+                  'final_weights', 'criteria_weights', 'cr']
+
+
+# --- 1. Поиск файлов ---
+def collect_paths(patterns):
+    """Раскрывает каталоги и glob-шаблоны в отсортированный список файлов проектов без повторов."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for ext in PROJECT_EXTENSIONS:
+                paths.update(glob.glob(os.path.join(pattern, '**', f'*{ext}'), recursive=True))
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True) if p.endswith(PROJECT_EXTENSIONS))
+    return sorted(paths)
+
+
+# --- 2. Расчет одного проекта (выполняется в процессе пула) ---
+def score_file(path, precision=4):
+    """Решает один файл сессии (.json, любой модели) или иерархии (.ahp/.npz) и возвращает строку результата."""
+    row = dict.fromkeys(RESULT_COLUMNS)
+    row['path'] = path
+    try:
+        if path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                results = ahp_engine.solve_any_session(json.load(f), precision=precision)
+        else:
+            results = ahp_format.load_hierarchy(path).solve(precision=precision)
+        final_weights, criteria_weights, cr_data, _, criteria = results
+        winner = next(iter(final_weights))
+        row.update(status='ok', error='', n_criteria=len(criteria), n_alternatives=len(final_weights),
+                   winner=winner, winner_weight=final_weights[winner], max_cr=max(cr_data.values()),
+                   final_weights=final_weights, criteria_weights=criteria_weights, cr=cr_data)
+    except Exception as e:
+        row.update(status='error', error=f"{type(e).__name__}: {e}")
+    return row
+
+
+# --- 3. Запись результатов ---
+def _flat(row):
+    """Словари (веса, CR) сериализуются в JSON-строки для табличных форматов."""
+    return {k: json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else v for k, v in row.items()}
+
+
+def write_results(rows, output, fmt):
+    if fmt == 'jsonl':
+        with open(output, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    elif fmt == 'csv':
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(_flat(row) for row in rows)
+    elif fmt == 'parquet':
+        # pandas/pyarrow нужны только для Parquet, поэтому импорт ленивый
+        import pandas as pd
+        pd.DataFrame([_flat(row) for row in rows], columns=RESULT_COLUMNS).to_parquet(output, index=False)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+
+def run(paths, workers=None, precision=4, chunksize=16):
+    """Решает все файлы в пуле процессов (workers=1 - в текущем процессе)."""
+    if workers == 1 or len(paths) <= 1:
+        return [score_file(path, precision) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(score_file, paths, [precision] * len(paths), chunksize=chunksize))
+
+
+# --- 4. Точка входа ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный пересчет проектов AHP (.json сессии, .ahp, .npz).")
+    parser.add_argument("inputs", nargs='+', help="каталоги или glob-шаблоны")
+    parser.add_argument("-o", "--output", required=True, help="файл результатов (.csv, .jsonl, .parquet)")
+    parser.add_argument("--format", choices=['csv', 'jsonl', 'parquet'], help="по умолчанию - по расширению --output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="число процессов (1 - без пула)")
+    parser.add_argument("--precision", type=int, default=4)
+    parser.add_argument("--chunksize", type=int, default=16, help="файлов на одну задачу пула")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    paths = collect_paths(args.inputs)
+    if not paths:
+        print("Не найдено ни одного файла проекта.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    rows = run(paths, args.workers, args.precision, args.chunksize)
+    elapsed = time.perf_counter() - start
+    write_results(rows, args.output, fmt)
+
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print(f"Проектов: {len(rows)} (ошибок: {failed}) за {elapsed:.2f} с - {len(rows) / elapsed:.1f} проектов/с. "
+          f"Результаты: {args.output}", file=sys.stderr)
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+"""
+Бенчмарк путей расчета AHP на синтетических иерархиях.
+
+Пример:
+  python ahp_bench.py -o bench.json
+  python ahp_bench.py --criteria 3 10 30 --alternatives 3 10 50 --experts 10 1000 -o bench.json
+  python ahp_bench.py --quick -o new.json --compare bench.json
+
+Случайные обратносимметричные матрицы строятся из "истинных" весов с управляемой
+несогласованностью (--noise - СКО логарифмического шума суждений). Для каждого размера
+замеряются время (лучшее из --repeat), пиковая память (tracemalloc) и расхождение
+бэкендов с эталоном numpy eig. Результаты пишутся в JSON для сравнения между запусками.
+Не импортирует streamlit и plotly.
+"""
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import ahp_engine
+import ahp_fuzzy
+import ahp_group
+import ahp_session
+import calculate_weights
+
+HIERARCHY_BACKENDS = ("ahpy", "eig", "power", "geometric")
+MATRIX_METHODS = ("eig", "power", "geometric")
+
+
+# --- 1. Синтетические данные ---
+def random_upper_triangles(k, n, noise=0.1, rng=None):
+    """
+    k верхних треугольников (k, n*(n-1)/2) матриц n x n: a_ij = w_i / w_j * exp(N(0, noise)),
+    обрезанные до шкалы [1/9, 9]. noise=0 дает идеально согласованные матрицы.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    weights = np.exp(rng.normal(0.0, 0.6, size=(k, n)))
+    rows, cols = np.triu_indices(n, 1)
+    upper = weights[:, rows] / weights[:, cols] * np.exp(rng.normal(0.0, noise, size=(k, rows.size)))
+    return np.clip(upper, 1/9, 9)
+
+
+def synthetic_store(n_crit, n_alt, noise=0.1, rng=None):
+    """Проект с n_crit критериями и n_alt альтернативами (ahp_session.JudgmentStore)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    criteria = [f"К{i}" for i in range(n_crit)]
+    alternatives = [f"Alt{i}" for i in range(n_alt)]
+    return ahp_session.JudgmentStore(criteria, alternatives, random_upper_triangles(1, n_crit, noise, rng)[0],
+                                     random_upper_triangles(n_crit, n_alt, noise, rng))
+
+
+def reduced_store(n_crit, n_alt, noise=0.1, share=0.5, rng=None):
+    """
+    Проект сокращенного опроса: в каждой матрице есть первая строка (остовное дерево - веса определены)
+    и случайная доля share остальных суждений, прочие - пропуски.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    store = synthetic_store(n_crit, n_alt, noise, rng)
+    store.elicitation_mode = 'reduced'
+    for upper, n in ((store.criteria_upper, n_crit), (store.alternatives_upper, n_alt)):
+        blank = rng.random(upper.shape) >= share
+        blank[..., :n - 1] = False
+        upper[blank] = np.nan
+    return store
+
+
+def synthetic_tree(branching, depth, n_alt, noise=0.1, distinct=16, rng=None):
+    """
+    Полное дерево критериев: depth уровней по branching узлов у каждого родителя.
+    Матрицы узлов и листьев берутся из пула distinct вариантов - так моделируются общие поддеревья.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    criteria = [f"К{i}" for i in range(branching)]
+    children, level = {}, criteria
+    for _ in range(depth - 1):
+        next_level = []
+        for node in level:
+            children[node] = [f"{node}.{i}" for i in range(branching)]
+            next_level.extend(children[node])
+        level = next_level
+    store = ahp_session.JudgmentStore(criteria, [f"Alt{i}" for i in range(n_alt)], children=children)
+    store.criteria_upper[:] = random_upper_triangles(1, branching, noise, rng)[0]
+    pool = random_upper_triangles(distinct, branching, noise, rng)
+    store.subcriteria_upper[:] = pool[rng.integers(0, distinct, len(store.internal))].ravel()
+    pool = random_upper_triangles(distinct, n_alt, noise, rng)
+    store.alternatives_upper[:] = pool[rng.integers(0, distinct, len(store.leaves))]
+    return store
+
+
+def synthetic_ballots(n_experts, n_crit, n_alt, noise=0.1, rng=None):
+    """
+    Бюллетени экспертов одного проекта: общий "истинный" проект плюс индивидуальный шум.
+    Возвращает список словарей сессии (компактный формат).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    base = synthetic_store(n_crit, n_alt, 0.0, rng)
+    ballots = []
+    for _ in range(n_experts):
+        crit_noise = np.exp(rng.normal(0.0, noise, size=base.criteria_upper.shape))
+        alt_noise = np.exp(rng.normal(0.0, noise, size=base.alternatives_upper.shape))
+        store = ahp_session.JudgmentStore(base.criteria, base.alternatives,
+                                          np.clip(base.criteria_upper * crit_noise, 1/9, 9),
+                                          np.clip(base.alternatives_upper * alt_noise, 1/9, 9))
+        ballots.append(store.to_dict())
+    return ballots
+
+
+# --- 2. Замеры ---
+def measure(func, repeat=3):
+    """
+    Лучшее и медианное время из repeat запусков, затем отдельный запуск под tracemalloc
+    (трассировка замедляет код, поэтому в замер времени она не попадает).
+    Возвращает (результат, {'wall_s', 'wall_median_s', 'peak_mb'}).
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"wall_s": min(times), "wall_median_s": float(np.median(times)), "peak_mb": peak / 2**20}
+
+
+def _weights_vector(weights, names):
+    return np.array([weights[name] for name in names], dtype=float)
+
+
+def agreement(results, reference, names):
+    """Расхождение итоговых весов и CR с эталонным кортежем calculate_ahp."""
+    weights, ref_weights = _weights_vector(results[0], names), _weights_vector(reference[0], names)
+    cr, ref_cr = np.array(list(results[2].values()), dtype=float), np.array(list(reference[2].values()), dtype=float)
+    return {
+        "max_weight_error": float(np.max(np.abs(weights - ref_weights))),
+        "max_cr_error": float(np.max(np.abs(cr - ref_cr))),
+        "same_ranking": bool(np.array_equal(np.argsort(-weights, kind='stable'), np.argsort(-ref_weights, kind='stable'))),
+    }
+
+
+# --- 3. Сценарии ---
+def bench_hierarchy(n_crit, n_alt, noise, repeat, rng, ahpy_max=12):
+    """Полная иерархия (calculate_ahp): ahpy против пакетного движка с разными методами."""
+    session_data = synthetic_store(n_crit, n_alt, noise, rng).to_dict()
+    # Точность 10 знаков: сравниваем сами методы, а не округление до 4 знаков
+    reference = ahp_engine.solve_session(session_data, precision=10, method="eig")
+    mean_cr = float(np.mean(list(reference[2].values())))
+    rows = []
+    for backend in HIERARCHY_BACKENDS:
+        if backend == "ahpy":
+            if max(n_crit, n_alt) > ahpy_max:
+                continue
+            try:
+                import ahpy  # noqa: F401
+            except ImportError:
+                continue
+            func = lambda: ahp_engine.solve_session_ahpy(session_data, precision=10)
+        else:
+            func = lambda method=backend: ahp_engine.solve_session(session_data, precision=10, method=method)
+        results, stats = measure(func, repeat)
+        rows.append({"case": "hierarchy", "backend": backend, "n_criteria": n_crit, "n_alternatives": n_alt,
+                     "noise": noise, "mean_cr": mean_cr, **stats,
+                     **agreement(results, reference, ahp_engine.parse_items(session_data['alternatives_input']))})
+    return rows
+
+
+def bench_matrix(n, noise, repeat, rng):
+    """Одна матрица (calculate_weights.calculate_ahp_matrix) разными методами."""
+    matrix = ahp_engine.build_reciprocal_matrices(random_upper_triangles(1, n, noise, rng), n)[0]
+    ref_weights, _, ref_cr = calculate_weights.calculate_ahp_matrix(matrix, method="eig")
+    rows = []
+    for method in MATRIX_METHODS:
+        (weights, _, cr), stats = measure(lambda: calculate_weights.calculate_ahp_matrix(matrix, method=method), repeat)
+        rows.append({"case": "matrix", "backend": method, "n": n, "noise": noise, "cr": float(ref_cr), **stats,
+                     "max_weight_error": float(np.max(np.abs(weights - ref_weights))),
+                     "max_cr_error": float(abs(cr - ref_cr)),
+                     "same_ranking": bool(np.array_equal(np.argsort(-weights), np.argsort(-ref_weights)))})
+    return rows
+
+
+def bench_tree(branching, depth, n_alt, noise, repeat, rng):
+    """Многоуровневая иерархия (ahp_engine.solve_tree) с общими поддеревьями."""
+    session_data = synthetic_tree(branching, depth, n_alt, noise, rng=rng).to_dict()
+    results, stats = measure(lambda: ahp_engine.solve_session(session_data, precision=10), repeat)
+    return [{"case": "tree", "backend": "eig", "n_nodes": len(results[2]) - 1, "n_alternatives": n_alt, "noise": noise,
+             **stats}]
+
+
+def bench_fuzzy(n_crit, n_alt, noise, repeat, rng, spread=0.3):
+    """
+    Нечеткий AHP (ahp_fuzzy): у всех суждений границы m * exp(-/+ spread).
+    Расхождение - с четким расчетом модальных суждений средним геометрическим.
+    """
+    store = synthetic_store(n_crit, n_alt, noise, rng)
+    store.model = "fuzzy"
+    values = store.flat_values()
+    store.fuzzy_bounds[:] = np.stack([values * np.exp(-spread), values * np.exp(spread)])
+    session_data = store.to_dict()
+    reference = ahp_engine.solve_session(dict(session_data, model="ahp"), precision=10, method="geometric")
+    rows = []
+    for method in ahp_fuzzy.FUZZY_METHODS:
+        results, stats = measure(lambda: ahp_fuzzy.solve_session(session_data, precision=10, method=method), repeat)
+        rows.append({"case": "fuzzy", "backend": method, "n_criteria": n_crit, "n_alternatives": n_alt, "noise": noise,
+                     **stats, **agreement(results, reference, store.alternatives)})
+    return rows
+
+
+def bench_group(n_experts, n_crit, n_alt, noise, repeat, rng):
+    """
+    Групповой расчет: AIJ (aggregate_expert_data - потоковое среднее геометрическое по файлам,
+    включая разбор JSON) и AIP (решение иерархии каждого эксперта).
+    """
+    ballots = synthetic_ballots(n_experts, n_crit, n_alt, noise, rng)
+    texts = [json.dumps(ballot) for ballot in ballots]
+    alternatives = ahp_engine.parse_items(ballots[0]['alternatives_input'])
+
+    def aij():
+        return ahp_engine.solve_session(ahp_group.aggregate_streams(io.StringIO(t) for t in texts).result(), precision=10)
+
+    def aip():
+        return ahp_group.aggregate_individual_priorities(ballots, precision=10)[0]
+
+    rows = []
+    aij_results, stats = measure(aij, repeat)
+    rows.append({"case": "group", "backend": "aij", "n_experts": n_experts, "n_criteria": n_crit,
+                 "n_alternatives": n_alt, "noise": noise, **stats})
+    aip_results, stats = measure(aip, repeat)
+    # Для групп эталона нет: AIJ и AIP - разные методы, сравниваем их между собой
+    rows.append({"case": "group", "backend": "aip", "n_experts": n_experts, "n_criteria": n_crit,
+                 "n_alternatives": n_alt, "noise": noise, **stats,
+                 **agreement(aip_results, aij_results, alternatives)})
+    return rows
+
+
+def bench_group_reduced(n_experts, n_crit, n_alt, noise, repeat, rng):
+    """
+    Групповой расчет сокращенных бюллетеней: n_experts одинаковых бюллетеней должны давать
+    тот же результат, что и один бюллетень (пропуски остаются пропусками, веса - LLSM).
+    """
+    store = reduced_store(n_crit, n_alt, noise, rng=rng)
+    ballot = store.to_dict()
+    text = json.dumps(ballot)
+    reference = ahp_engine.solve_any_session(ballot, precision=10)
+
+    def aij():
+        return ahp_engine.solve_any_session(ahp_group.aggregate_streams(io.StringIO(text) for _ in range(n_experts)).result(),
+                                            precision=10)
+
+    def aip():
+        return ahp_group.aggregate_individual_priorities([ballot] * n_experts, precision=10)[0]
+
+    rows = []
+    for backend, func in (("aij", aij), ("aip", aip)):
+        results, stats = measure(func, repeat)
+        rows.append({"case": "group_reduced", "backend": backend, "n_experts": n_experts, "n_criteria": n_crit,
+                     "n_alternatives": n_alt, "noise": noise, **stats, **agreement(results, reference, store.alternatives)})
+    return rows
+
+
+def run(criteria_counts, alternative_counts, expert_counts, noise=0.1, repeat=3, seed=0, ahpy_max=12,
+        trees=((4, 3), (7, 4))):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n in sorted(set(criteria_counts) | set(alternative_counts)):
+        rows.extend(bench_matrix(n, noise, repeat, rng))
+    for n_crit in criteria_counts:
+        for n_alt in alternative_counts:
+            rows.extend(bench_hierarchy(n_crit, n_alt, noise, repeat, rng, ahpy_max))
+    for branching, depth in trees:
+        rows.extend(bench_tree(branching, depth, alternative_counts[0], noise, repeat, rng))
+    for n_crit in criteria_counts:
+        rows.extend(bench_fuzzy(n_crit, alternative_counts[-1], noise, repeat, rng))
+    for n_experts in expert_counts:
+        rows.extend(bench_group(n_experts, criteria_counts[0], alternative_counts[0], noise, repeat, rng))
+        rows.extend(bench_group_reduced(n_experts, criteria_counts[0], alternative_counts[0], noise, repeat, rng))
+    return rows
+
+
+# --- 4. Сравнение с прошлым запуском ---
+def _row_id(row):
+    return tuple((k, row[k]) for k in ("case", "backend", "n", "n_nodes", "n_criteria", "n_alternatives", "n_experts", "noise")
+                 if k in row)
+
+
+def compare(rows, baseline_rows, threshold=1.25):
+    """Строки, где время выросло больше чем в threshold раз относительно baseline: [(id, было, стало)]."""
+    baseline = {_row_id(row): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        old = baseline.get(_row_id(row))
+        if old and row["wall_s"] > threshold * old["wall_s"]:
+            regressions.append((dict(_row_id(row)), old["wall_s"], row["wall_s"]))
+    return regressions
+
+
+# --- 5. Точка входа ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк расчетов AHP на синтетических иерархиях.")
+    parser.add_argument("--criteria", type=int, nargs='+', default=[3, 5, 10, 20])
+    parser.add_argument("--alternatives", type=int, nargs='+', default=[3, 5, 10, 30])
+    parser.add_argument("--experts", type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument("--trees", nargs='+', default=["4x3", "7x4"],
+                        help="деревья критериев 'ветвлениеxглубина' (7x4 - 2800 узлов)")
+    parser.add_argument("--noise", type=float, default=0.1, help="СКО логарифмического шума суждений")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ahpy-max", type=int, default=12, help="ahpy только для матриц не больше этого размера")
+    parser.add_argument("--quick", action="store_true", help="малые размеры для быстрой проверки")
+    parser.add_argument("-o", "--output", default="ahp_bench.json")
+    parser.add_argument("--compare", help="JSON прошлого запуска: вывести замедления")
+    parser.add_argument("--threshold", type=float, default=1.25, help="порог замедления для --compare")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.criteria, args.alternatives, args.experts, args.trees, args.repeat = [3, 5], [3, 5], [10, 100], ["3x3"], 1
+
+    trees = [tuple(int(v) for v in tree.split("x")) for tree in args.trees]
+    rows = run(args.criteria, args.alternatives, args.experts, args.noise, args.repeat, args.seed, args.ahpy_max, trees)
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor(),
+                 "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}},
+        "results": rows,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for row in rows:
+        size = "x".join(str(row[k]) for k in ("n", "n_nodes", "n_experts", "n_criteria", "n_alternatives") if k in row)
+        error = f"  ошибка весов {row['max_weight_error']:.1e}" if "max_weight_error" in row else ""
+        print(f"{row['case']:<14}{row['backend']:<10}{size:<14}{row['wall_s'] * 1000:10.3f} мс"
+              f"{row['peak_mb']:9.2f} МБ{error}")
+    print(f"Результаты: {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(rows, json.load(f)["results"], args.threshold)
+        for row_id, old, new in regressions:
+            print(f"Замедление {new / old:.2f}x: {row_id} ({old * 1000:.3f} -> {new * 1000:.3f} мс)")
+        return 2 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import ahp_engine
+import ahp_metrics
+
+# Меняется при изменении формата результатов или логики расчета,
+# чтобы старые записи на диске не подхватывались
+CACHE_VERSION = 3
+
+
+# --- 1. Канонический ключ набора суждений ---
+def judgments_key(session_data, precision=4):
+    """
+    SHA-256 от канонического вида проекта: дерево критериев и список альтернатив
+    плюс значения всех нужных для расчета суждений (отсутствующие = 1, как в calculate_ahp,
+    или NaN для сессий сокращенного опроса).
+    Посторонние ключи сессии (слайдеры, флаги интерфейса) на ключ не влияют.
+    """
+    # В сокращенном опросе пропуск (NaN) и явная единица дают разные результаты
+    incomplete = ahp_engine.is_reduced_session(session_data)
+    criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = \
+        ahp_engine.session_hierarchy(session_data, np.nan if incomplete else 1)
+    tree = [[node, children[node]] for node in ahp_engine.tree_order(criteria, children)[1]]
+    header = json.dumps([CACHE_VERSION, precision, incomplete, criteria, tree, alternatives], ensure_ascii=False)
+    digest = hashlib.sha256(header.encode('utf-8'))
+    # Значения приводятся к float32 - точности компактного формата сессии,
+    # чтобы старый JSON и его компактная копия давали один ключ
+    for values in (criteria_upper, subcriteria_upper, alternatives_upper):
+        digest.update(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+    # Сеть ANP - другая модель: в ключ входят взаимовлияния и доля кластера критериев
+    if ahp_engine.is_network_session(session_data):
+        digest.update(json.dumps(['anp', session_data.get('anp_dependence_weight')]).encode('utf-8'))
+        digest.update(np.ascontiguousarray(ahp_engine.session_network(session_data), dtype=np.float32).tobytes())
+    # Нечеткий AHP: в ключ входят метод и границы суждений
+    if ahp_engine.is_fuzzy_session(session_data):
+        digest.update(json.dumps(['fuzzy', session_data.get('fuzzy_method')]).encode('utf-8'))
+        digest.update(np.ascontiguousarray(ahp_engine.session_fuzzy_bounds(session_data), dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+# --- 2. Кэш результатов: LRU в памяти + необязательный уровень на диске ---
+class ResultsCache:
+    """
+    Отображает ключ judgments_key() в кортеж результатов calculate_ahp.
+    maxsize - сколько результатов держать в памяти (вытесняются самые старые по обращению).
+    cache_dir - каталог для общего дискового уровня (между сессиями и процессами); None - только память.
+    """
+
+    def __init__(self, maxsize=256, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key, results):
+        with self._lock:
+            self._memory[key] = results
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Возвращает результаты или None. Находка на диске поднимается в память."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                ahp_metrics.count("cache.hit")
+                return self._memory[key]
+        if self.cache_dir:
+            try:
+                with ahp_metrics.span("io.cache_read"), open(self._path(key), encoding='utf-8') as f:
+                    results = tuple(json.load(f))
+            except (OSError, ValueError):
+                results = None
+            if results is not None:
+                self._remember(key, results)
+                self.hits += 1
+                ahp_metrics.count("cache.hit_disk")
+                return results
+        self.misses += 1
+        ahp_metrics.count("cache.miss")
+        return None
+
+    def put(self, key, results):
+        self._remember(key, results)
+        if self.cache_dir:
+            # Пишем во временный файл и атомарно переименовываем,
+            # чтобы другой процесс не прочитал недописанный JSON
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with ahp_metrics.span("io.cache_write"), os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(list(results), f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(key))
+            except OSError:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    def get_or_compute(self, session_data, compute, precision=4):
+        """Возвращает результаты из кэша или вызывает compute(session_data) и запоминает их."""
+        key = judgments_key(session_data, precision)
+        results = self.get(key)
+        if results is None:
+            results = compute(session_data)
+            # Ошибки расчета (кортеж из None) не кэшируем
+            if results[0] is not None:
+                self.put(key, results)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
@@ -0,0 +1,204 @@
+import argparse
+import json
+import numpy as np
+import ahp_engine
+import ahp_metrics
+import ahp_sensitivity
+
+# До какого числа кандидатов (пар x значений) на матрицу все они пересчитываются точно
+EXACT_CANDIDATES = 512
+
+
+# --- 1. Триады и отклонения ячеек ---
+def triad_tensor(matrices):
+    """
+    Несогласованность всех триад стека (k, n, n) одним тензором (k, n, n, n):
+    |log(a_ij * a_jl * a_li)| - ноль, если a_ij * a_jl = a_il.
+    """
+    log_a = np.log(np.asarray(matrices, dtype=float))
+    return np.abs(log_a[:, :, :, np.newaxis] + log_a[:, np.newaxis, :, :] + log_a.transpose(0, 2, 1)[:, :, np.newaxis, :])
+
+
+def koczkodaj(log_deviation):
+    """Индекс Кочкодая триады: 1 - min(t, 1/t), где t = a_ij * a_jl / a_il."""
+    return 1.0 - np.exp(-np.asarray(log_deviation))
+
+
+def worst_triads(matrices, top=3):
+    """
+    top самых несогласованных триад i < j < l каждой матрицы стека.
+    Возвращает индексы (k, top, 3) и индексы Кочкодая (k, top) по убыванию.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    k, n = matrices.shape[0], matrices.shape[-1]
+    i, j, l = np.indices((n, n, n)).reshape(3, -1)
+    ordered = (i < j) & (j < l)
+    i, j, l = i[ordered], j[ordered], l[ordered]
+    top = min(top, i.size)
+    if top == 0:
+        return np.empty((k, 0, 3), dtype=int), np.empty((k, 0))
+    values = triad_tensor(matrices)[:, i, j, l]
+    best = np.argpartition(-values, top - 1, axis=1)[:, :top]
+    best = np.take_along_axis(best, np.argsort(-np.take_along_axis(values, best, axis=1), axis=1), axis=1)
+    return np.stack([i[best], j[best], l[best]], axis=-1), koczkodaj(np.take_along_axis(values, best, axis=1))
+
+
+def cell_deviations(matrices, weights):
+    """Отклонения суждений от весов: e_ij = a_ij * w_j / w_i (1 - суждение согласовано с весами)."""
+    weights = np.asarray(weights, dtype=float)
+    return np.asarray(matrices, dtype=float) * weights[:, np.newaxis, :] / weights[:, :, np.newaxis]
+
+
+# --- 2. Лучшее исправление одного суждения ---
+def best_single_fix(matrices, weights, candidates=ahp_sensitivity.SAATY_SCALE, editable=None, refine=8,
+                    tol=1e-10, max_iter=500):
+    """
+    Для каждой матрицы стека ищет одно изменение суждения a_ij (i < j) на значение из candidates,
+    после которого CR меньше всего.
+    Если кандидатов не больше EXACT_CANDIDATES (при шкале Саати - всегда для n <= 11), все они пересчитываются точно.
+    Иначе:
+    1) Все пары и все значения сразу оцениваются по теории возмущений:
+       d(lambda_max) = (v_i w_j da_ij + v_j w_i da_ji) / (v . w), v - левый вектор Перрона.
+    2) Для refine пар с лучшей оценкой точно пересчитываются все значения candidates: оценка первого порядка
+       надежно выделяет пару, но не лучшее значение для нее. refine=None - точный пересчет всех кандидатов.
+    Точный пересчет - степенной метод со стартом с текущих весов. Замена a_ij/a_ji - поправка ранга 2:
+    A' w = A w + поправка в двух компонентах, матрицы не копируются.
+    editable (k, m) - какие суждения можно менять (например, только заданные экспертом).
+    Возвращает словарь массивов: pair (k, 2) (-1, если менять нечего), value (k,), cr (k,), cr_before (k,).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    candidates = np.asarray(candidates, dtype=float)
+    k, n = matrices.shape[0], matrices.shape[-1]
+    rows, cols = np.triu_indices(n, 1)
+    m, c = rows.size, candidates.size
+    lambda_before = np.einsum('kij,kj->k', matrices, weights)
+    cr_before = ahp_engine.consistency_ratios(lambda_before, n)
+    result = {"pair": np.full((k, 2), -1), "value": np.full(k, np.nan), "cr": cr_before.copy(), "cr_before": cr_before}
+    if n < 3:
+        return result
+
+    # Кандидаты (k, m * c): пара q // c, значение candidates[q % c]
+    pair_i, pair_j = np.repeat(rows, c), np.repeat(cols, c)
+    new_values = np.tile(candidates, m)
+    delta_ij = new_values[np.newaxis] - matrices[:, pair_i, pair_j]
+    delta_ji = 1.0 / new_values[np.newaxis] - matrices[:, pair_j, pair_i]
+    blocked = np.abs(np.log(new_values[np.newaxis]) - np.log(matrices[:, pair_i, pair_j])) < 1e-9
+    if editable is not None:
+        blocked |= ~np.repeat(np.asarray(editable, dtype=bool), c, axis=1)
+
+    if refine is None or m * c <= EXACT_CANDIDATES or refine >= m:
+        selected = np.broadcast_to(np.arange(m * c), (k, m * c))
+    else:
+        # 1) Оценка первого порядка для всех кандидатов, отбор пар по лучшему значению
+        left, _ = ahp_engine.batch_priority_vectors(matrices.transpose(0, 2, 1))
+        norm = np.einsum('kn,kn->k', left, weights)[:, np.newaxis]
+        predicted = lambda_before[:, np.newaxis] + (left[:, pair_i] * weights[:, pair_j] * delta_ij
+                                                    + left[:, pair_j] * weights[:, pair_i] * delta_ji) / norm
+        pair_score = np.where(blocked, np.inf, predicted).reshape(k, m, c).min(axis=2)
+        top_pairs = np.argpartition(pair_score, refine - 1, axis=1)[:, :refine]
+        selected = (top_pairs[:, :, np.newaxis] * c + np.arange(c)).reshape(k, -1)
+    r = selected.shape[1]
+
+    # 2) Точный пересчет отобранных кандидатов
+    batch = np.arange(k)[:, np.newaxis]
+    slot = np.arange(r)[np.newaxis, :]
+    sel_i, sel_j = pair_i[selected], pair_j[selected]
+    sel_dij, sel_dji = delta_ij[batch, selected], delta_ji[batch, selected]
+    w = np.repeat(weights[:, np.newaxis, :], r, axis=1)
+    lambda_max = np.zeros((k, r))
+    for _ in range(max_iter):
+        product = w @ matrices.transpose(0, 2, 1)
+        product[batch, slot, sel_i] += sel_dij * w[batch, slot, sel_j]
+        product[batch, slot, sel_j] += sel_dji * w[batch, slot, sel_i]
+        lambda_max = product.sum(axis=2)
+        new_w = product / lambda_max[:, :, np.newaxis]
+        delta = np.max(np.abs(new_w - w))
+        w = new_w
+        if delta < tol:
+            break
+
+    cr = np.where(blocked[batch, selected], np.inf, ahp_engine.consistency_ratios(lambda_max, n))
+    best = np.argmin(cr, axis=1)
+    best_q = selected[np.arange(k), best]
+    best_cr = cr[np.arange(k), best]
+    improves = best_cr < cr_before - 1e-12
+    result["pair"][improves] = np.stack([pair_i[best_q], pair_j[best_q]], axis=1)[improves]
+    result["value"][improves] = new_values[best_q][improves]
+    result["cr"][improves] = best_cr[improves]
+    return result
+
+
+# --- 3. Диагностика проекта ---
+def diagnose_matrices(matrices, items, top=3, editable=None):
+    """Отчеты по стеку матриц одного размера: список словарей (см. diagnose_session)."""
+    matrices = np.asarray(matrices, dtype=float)
+    weights, _ = ahp_engine.batch_priority_vectors(matrices)
+    n = matrices.shape[-1]
+    triads, triad_scores = worst_triads(matrices, top)
+    deviations = np.abs(np.log(cell_deviations(matrices, weights)))
+    rows, cols = np.triu_indices(n, 1)
+    upper_dev = deviations[:, rows, cols]
+    cell_order = np.argsort(-upper_dev, axis=1)[:, :top]
+    fix = best_single_fix(matrices, weights, editable=editable)
+    reports = []
+    for s in range(matrices.shape[0]):
+        report = {
+            "items": list(items),
+            "cr": float(fix["cr_before"][s]),
+            "triads": [(items[a], items[b], items[c], float(score))
+                       for (a, b, c), score in zip(triads[s], triad_scores[s])],
+            "cells": [(items[rows[p]], items[cols[p]], float(matrices[s, rows[p], cols[p]]),
+                       float(weights[s, rows[p]] / weights[s, cols[p]]), float(upper_dev[s, p])) for p in cell_order[s]],
+            "deviations": deviations[s],
+            "fix": None,
+        }
+        if fix["pair"][s, 0] >= 0:
+            a, b = fix["pair"][s]
+            report["fix"] = {"pair": (items[a], items[b]), "old": float(matrices[s, a, b]),
+                             "new": float(fix["value"][s]), "cr": float(fix["cr"][s])}
+        reports.append(report)
+    return reports
+
+
+@ahp_metrics.timed("diagnostics.diagnose_session")
+def diagnose_session(session_data, top=3):
+    """
+    Диагностика всех матриц проекта по словарю сессии: {подпись матрицы (как в cr_data): отчет}.
+    Отчет: items (элементы матрицы), cr, triads [(A, B, C, индекс Кочкодая)], cells [(A, B, a_AB, w_A/w_B, |log отклонения|)],
+    deviations (n, n) - |log(a_ij * w_j / w_i)| всех ячеек,
+    fix {pair, old, new, cr} - лучшая замена одного суждения по шкале Саати (или None).
+    В сокращенном опросе пропуски заполняются отношениями весов, а исправления предлагаются только
+    для суждений, заданных экспертом.
+    """
+    incomplete = ahp_engine.is_reduced_session(session_data)
+    reports = {}
+    for labels, items, upper in ahp_engine.session_matrices(session_data, np.nan if incomplete else 1):
+        if len(items) < 2:
+            continue
+        matrices = ahp_engine.build_reciprocal_matrices(upper, len(items))
+        editable = ~np.isnan(upper)
+        if incomplete:
+            weights, _, _ = ahp_engine.solve_incomplete_matrices(matrices)
+            matrices = ahp_engine.complete_matrices(matrices, weights)
+        reports.update(zip(labels, diagnose_matrices(matrices, items, top, editable)))
+    return reports
+
+
+# --- 4. Запуск из командной строки ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Диагностика согласованности матриц проекта AHP (.json сессии).")
+    parser.add_argument("session", help="файл сессии ahp_project_session.json")
+    parser.add_argument("--top", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.session, encoding='utf-8') as f:
+        session_data = json.load(f)
+    for label, report in diagnose_session(session_data, args.top).items():
+        print(f"--- {label}: CR = {report['cr']:.3f} ---")
+        for a, b, c, score in report["triads"]:
+            print(f"  Триада {a} / {b} / {c}: индекс Кочкодая {score:.2f}")
+        if report["fix"]:
+            fix = report["fix"]
+            print(f"  Исправление: {fix['pair'][0]} vs {fix['pair'][1]}: {fix['old']:.3g} -> {fix['new']:.3g} "
+                  f"(CR {report['cr']:.3f} -> {fix['cr']:.3f})")
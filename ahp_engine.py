@@ -0,0 +1,879 @@
+import base64
+import itertools
+import json
+import os
+import bisect
+import numpy as np
+import ahp_metrics
+
+# --- 1. Случайные индексы (RI) ---
+# RI(n) = (среднее lambda_max случайной матрицы - n) / (n - 1) по матрицам, чьи суждения выбраны
+# равновероятно из полной шкалы Саати (17 значений). Таблица для n = 3..RI_TABLE_MAX_N считается
+# заранее (ahp_ri.py) и поставляется файлом ri_table.json; для больших n RI симулируется при первом
+# обращении и запоминается. Без файла используются оценки Донегана-Додда (как в 'ahpy', random_index='dd').
+RI_DONEGAN_DODD = {
+    3: 0.4914, 4: 0.8286, 5: 1.0591, 6: 1.1797, 7: 1.2519,
+    8: 1.3171, 9: 1.3733, 10: 1.4055, 11: 1.4213, 12: 1.4497,
+    13: 1.4643, 14: 1.4822, 15: 1.4969, 16: 1.5078, 17: 1.5153,
+    18: 1.5262, 19: 1.5313, 20: 1.5371, 25: 1.5619, 30: 1.5772,
+    40: 1.5976, 50: 1.6102, 60: 1.6178, 70: 1.6237, 80: 1.6277,
+    90: 1.6213, 100: 1.6339
+}
+SAATY_FULL_SCALE = np.array([1/9, 1/8, 1/7, 1/6, 1/5, 1/4, 1/3, 1/2, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+RI_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ri_table.json")
+RI_SEED = 20240501
+# Размер выборки для RI, которого нет в таблице (симуляция при первом обращении)
+RI_RUNTIME_SAMPLES = 2000
+
+GOAL_CR_LABEL = 'Матрица "Goal" (Критерии)'
+
+_ri_table = None
+
+
+def lambda_max_moments(n, n_samples, rng, chunk_size=None, tol=1e-12, max_iter=1000):
+    """
+    Сумма и сумма квадратов lambda_max по n_samples случайным обратносимметричным матрицам n x n
+    (суждения равновероятно из полной шкалы Саати). lambda_max - пакетно степенным методом,
+    для положительных матриц он сходится к lambda Перрона. Матрицы генерируются блоками по chunk_size
+    (по умолчанию ~64 МБ на блок). Суммы из разных процессов складываются.
+    """
+    chunk_size = chunk_size or max(1, min(n_samples, 2**23 // (n * n)))
+    m = n * (n - 1) // 2
+    total, total_sq, done = 0.0, 0.0, 0
+    while done < n_samples:
+        size = min(chunk_size, n_samples - done)
+        upper = SAATY_FULL_SCALE[rng.integers(0, SAATY_FULL_SCALE.size, size=(size, m))]
+        _, lambda_max, _ = batch_power_iteration(build_reciprocal_matrices(upper, n), tol=tol, max_iter=max_iter)
+        total += float(lambda_max.sum())
+        total_sq += float((lambda_max * lambda_max).sum())
+        done += size
+    return total, total_sq
+
+
+def random_index_from_moments(n, total, total_sq, n_samples):
+    """RI и его стандартная ошибка по суммам lambda_max_moments()."""
+    mean = total / n_samples
+    std = np.sqrt(max(total_sq / n_samples - mean * mean, 0.0))
+    return (mean - n) / (n - 1), std / (n - 1) / np.sqrt(n_samples)
+
+
+def simulate_random_index(n, n_samples=10000, rng=None, chunk_size=None):
+    """Монте-Карло оценка RI(n) в текущем процессе. Возвращает (RI, стандартная ошибка)."""
+    if n < 3:
+        return 0.0, 0.0
+    rng = rng if rng is not None else np.random.default_rng([RI_SEED, n])
+    total, total_sq = lambda_max_moments(n, n_samples, rng, chunk_size)
+    return random_index_from_moments(n, total, total_sq, n_samples)
+
+
+def load_ri_table(path=None):
+    """Таблица {n: RI} из ri_table.json (читается один раз). Без файла - пустой словарь."""
+    global _ri_table
+    if _ri_table is None or path is not None:
+        try:
+            with open(path or RI_TABLE_PATH, encoding='utf-8') as f:
+                table = {int(n): float(ri) for n, ri in json.load(f)["ri"].items()}
+        except (OSError, ValueError, KeyError):
+            table = {}
+        if path is not None:
+            return table
+        _ri_table = table
+    return _ri_table
+
+
+def _interpolated_dd(n):
+    """Оценка Донегана-Додда с линейной интерполяцией между табличными n (None за пределами таблицы)."""
+    if n in RI_DONEGAN_DODD:
+        return RI_DONEGAN_DODD[n]
+    sizes = tuple(RI_DONEGAN_DODD.keys())
+    if n > sizes[-1]:
+        return None
+    smaller = sizes[bisect.bisect_left(sizes, n) - 1]
+    larger = sizes[bisect.bisect_right(sizes, n)]
+    slope = (RI_DONEGAN_DODD[larger] - RI_DONEGAN_DODD[smaller]) / (larger - smaller)
+    return slope * (n - smaller) + RI_DONEGAN_DODD[smaller]
+
+
+def random_index(n):
+    """
+    Возвращает RI для матрицы n x n: из поставляемой таблицы (O(1)), иначе из оценок Донегана-Додда,
+    иначе симуляцией (один раз на n за процесс, с фиксированным seed - результат воспроизводим).
+    """
+    if n < 3:
+        return 0.0
+    table = load_ri_table()
+    if n in table:
+        return table[n]
+    if not table:
+        ri = _interpolated_dd(n)
+        if ri is not None:
+            return ri
+    table[n] = float(simulate_random_index(n, RI_RUNTIME_SAMPLES)[0])
+    return table[n]
+
+
+# --- 1.1 Геометрический индекс согласованности (GCI) ---
+# Для весов по среднему геометрическому (method="geometric") естественная мера - GCI
+# (Aguarón, Moreno-Jiménez, 2003), пороги соответствуют CR = 0.10.
+GCI_THRESHOLDS = {3: 0.31, 4: 0.35}
+GCI_THRESHOLD_LARGE = 0.37
+
+
+def gci_threshold(n):
+    return GCI_THRESHOLDS.get(n, GCI_THRESHOLD_LARGE)
+
+
+def geometric_consistency_index(matrices, weights=None):
+    """
+    GCI = 2 / ((n-1)(n-2)) * sum_{i<j} ln^2(a_ij * w_j / w_i) для стека (k, n, n).
+    weights - веса (k, n); по умолчанию среднее геометрическое строк. Для n < 3 GCI = 0.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    k, n = matrices.shape[0], matrices.shape[-1]
+    if n < 3:
+        return np.zeros(k)
+    if weights is None:
+        weights, _ = batch_geometric_mean(matrices)
+    log_err = np.log(matrices * weights[:, np.newaxis, :] / weights[:, :, np.newaxis])
+    rows, cols = np.triu_indices(n, 1)
+    return 2.0 / ((n - 1) * (n - 2)) * (log_err[:, rows, cols] ** 2).sum(axis=1)
+
+
+# --- 2. Построение матриц ---
+def parse_items(text):
+    """Разбивает содержимое текстового поля (criteria_input / alternatives_input) на список."""
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+
+def parse_tree(text):
+    """
+    Критерии с подкритериями: строка с отступом больше, чем у предыдущей, - подкритерий.
+    Возвращает (критерии верхнего уровня, {узел: подкритерии}) - в словаре только узлы с подкритериями.
+    Без отступов дерево двухуровневое: parse_tree(text)[0] == parse_items(text).
+    """
+    top, children, stack = [], {}, []
+    for line in text.split('\n'):
+        name = line.strip()
+        if not name:
+            continue
+        line = line.expandtabs(4)
+        indent = len(line) - len(line.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if stack:
+            children.setdefault(stack[-1][1], []).append(name)
+        else:
+            top.append(name)
+        stack.append((indent, name))
+    return top, children
+
+
+def format_tree(criteria, children, indent="  "):
+    """Обратная операция к parse_tree: текст для поля criteria_input."""
+    lines = []
+
+    def walk(nodes, depth):
+        for node in nodes:
+            lines.append(indent * depth + node)
+            walk(children.get(node, []), depth + 1)
+    walk(criteria, 0)
+    return "\n".join(lines)
+
+
+def tree_order(criteria, children):
+    """
+    Узлы дерева критериев в порядке обхода в ширину (без корня-цели):
+    (все узлы, внутренние узлы с подкритериями, листья). Листья сравнивают альтернативы.
+    """
+    nodes = list(criteria)
+    for node in nodes:
+        nodes.extend(children.get(node, []))
+    internal = [node for node in nodes if node in children]
+    leaves = [node for node in nodes if node not in children]
+    return nodes, internal, leaves
+
+
+def upper_triangle_values(session_data, key_prefix, items, default=1):
+    """
+    Достает из словаря сессии значения верхнего треугольника матрицы
+    (в порядке itertools.combinations, он совпадает с np.triu_indices).
+    """
+    return [session_data.get(f"{key_prefix}_{a}_{b}", default) for a, b in itertools.combinations(items, 2)]
+
+
+# --- 2.1 Компактный формат сессии (версия 2) ---
+# Вместо ключа на каждую пару суждения хранятся верхними треугольниками матриц:
+# float32 little-endian в base64, NaN - суждение не задано.
+SESSION_FORMAT = "ahp-session"
+SESSION_VERSION = 2
+
+
+def exact_judgments(values):
+    """
+    float32 -> float64 без потери точности шкалы Саати: целые хранятся в float32 точно,
+    а дроби вида 1/k (1/3, 1/7, ...) восстанавливаются до точного значения float64.
+    """
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.round(1.0 / values)
+        snap = (values < 1) & (k >= 2) & (np.abs(values * k - 1.0) < 1e-6)
+    return np.where(snap, 1.0 / np.where(snap, k, 1.0), values)
+
+
+def encode_array(values):
+    return base64.b64encode(np.asarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def decode_array(text, shape):
+    return exact_judgments(np.frombuffer(base64.b64decode(text), dtype='<f4')).reshape(shape)
+
+
+def is_compact_session(session_data):
+    return session_data.get('format') == SESSION_FORMAT
+
+
+def session_hierarchy(session_data, default=1):
+    """
+    Иерархия и суждения сессии любого формата:
+    (criteria, children, alternatives, criteria_upper (m_c,), subcriteria_upper, alternatives_upper (n_leaves, m_a)).
+    children - {узел: подкритерии} (пустой для двухуровневой иерархии); subcriteria_upper - верхние
+    треугольники матриц подкритериев внутренних узлов подряд, в порядке tree_order. Незаданные суждения = default.
+    """
+    criteria, children = parse_tree(session_data['criteria_input'])
+    alternatives = parse_items(session_data['alternatives_input'])
+    _, internal, leaves = tree_order(criteria, children)
+    n_crit, n_alt = len(criteria), len(alternatives)
+    sub_sizes = [len(children[node]) * (len(children[node]) - 1) // 2 for node in internal]
+    if is_compact_session(session_data):
+        if session_data.get('version') != SESSION_VERSION:
+            raise ValueError(f"Неподдерживаемая версия сессии: {session_data.get('version')}")
+        criteria_upper = decode_array(session_data['criteria_upper'], (n_crit * (n_crit - 1) // 2,))
+        if internal:
+            subcriteria_upper = decode_array(session_data['subcriteria_upper'], (sum(sub_sizes),))
+        else:
+            subcriteria_upper = np.empty(0)
+        alternatives_upper = decode_array(session_data['alternatives_upper'], (len(leaves), n_alt * (n_alt - 1) // 2))
+        for values in (criteria_upper, subcriteria_upper, alternatives_upper):
+            values[np.isnan(values)] = default
+    else:
+        criteria_upper = np.array(upper_triangle_values(session_data, "crit", criteria, default), dtype=float)
+        subcriteria_upper = np.array([value for node in internal
+                                      for value in upper_triangle_values(session_data, node, children[node], default)],
+                                     dtype=float)
+        alternatives_upper = np.array([upper_triangle_values(session_data, leaf, alternatives, default) for leaf in leaves],
+                                      dtype=float).reshape(len(leaves), n_alt * (n_alt - 1) // 2)
+    return criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper
+
+
+def session_arrays(session_data, default=1):
+    """
+    Списки критериев/альтернатив и верхние треугольники всех матриц двухуровневой сессии:
+    criteria_upper (m_c,), alternatives_upper (n_crit, m_a). Незаданные суждения = default.
+    Для иерархии с подкритериями - ValueError (см. session_hierarchy).
+    """
+    criteria, children, alternatives, criteria_upper, _, alternatives_upper = session_hierarchy(session_data, default)
+    if children:
+        raise ValueError("Функция поддерживает только двухуровневую иерархию (критерии без подкритериев)")
+    return criteria, alternatives, criteria_upper, alternatives_upper
+
+
+# Суждения взаимовлияний ANP (ahp_network): сравнения критериев относительно каждого критерия
+# (внутренняя зависимость) и каждой альтернативы (обратная связь). Ключи старого формата - 'anp:{узел}_A_B'.
+NETWORK_PREFIX = "anp:"
+
+
+def is_network_session(session_data):
+    """Сессия решается как сеть ANP, а не иерархия."""
+    return session_data.get('model') == 'anp'
+
+
+def network_label(node):
+    """Подпись матрицы взаимовлияний в cr_data."""
+    return f"Матрица влияний '{node}'"
+
+
+def session_network(session_data):
+    """
+    Суждения взаимовлияний двухуровневой сессии: массив (n_crit + n_alt, m_c), строки - матрицы сравнения
+    критериев относительно каждого критерия, затем каждой альтернативы. NaN - суждение не задано,
+    строка из одних NaN - влияния нет.
+    """
+    criteria, children = parse_tree(session_data['criteria_input'])
+    if children:
+        raise ValueError("Сеть ANP строится только для иерархии без подкритериев")
+    alternatives = parse_items(session_data['alternatives_input'])
+    shape = (len(criteria) + len(alternatives), len(criteria) * (len(criteria) - 1) // 2)
+    if is_compact_session(session_data):
+        if 'network_upper' not in session_data:
+            return np.full(shape, np.nan)
+        return decode_array(session_data['network_upper'], shape)
+    return np.array([upper_triangle_values(session_data, NETWORK_PREFIX + node, criteria, np.nan)
+                     for node in criteria + alternatives], dtype=float).reshape(shape)
+
+
+# Нечеткие суждения (ahp_fuzzy): модальное значение хранится в обычной матрице, а границы l <= m <= u -
+# отдельно, в порядке flat_values (критерии, подкритерии, альтернативы листьев). Ключи старого формата - 'fuzzy:{пара}': [l, u].
+FUZZY_PREFIX = "fuzzy:"
+
+
+def is_fuzzy_session(session_data):
+    """Сессия решается нечетким AHP (ahp_fuzzy)."""
+    return session_data.get('model') == 'fuzzy'
+
+
+def session_fuzzy_bounds(session_data):
+    """
+    Границы нечетких суждений сессии: массив (2, число суждений) - нижние и верхние границы
+    в порядке ahp_group.judgment_keys. NaN - границ нет (суждение четкое).
+    """
+    criteria, children = parse_tree(session_data['criteria_input'])
+    alternatives = parse_items(session_data['alternatives_input'])
+    _, internal, leaves = tree_order(criteria, children)
+    matrices = [("crit", criteria)] + [(node, children[node]) for node in internal] + [(leaf, alternatives) for leaf in leaves]
+    size = sum(len(items) * (len(items) - 1) // 2 for _, items in matrices)
+    if is_compact_session(session_data):
+        if 'fuzzy_bounds' not in session_data:
+            return np.full((2, size), np.nan)
+        return decode_array(session_data['fuzzy_bounds'], (2, size))
+    bounds = np.full((2, size), np.nan)
+    k = 0
+    for key, items in matrices:
+        for a, b in itertools.combinations(items, 2):
+            value = session_data.get(f"{FUZZY_PREFIX}{key}_{a}_{b}")
+            if isinstance(value, (list, tuple)) and len(value) == 2:
+                try:
+                    low, high = float(value[0]), float(value[1])
+                except (TypeError, ValueError):
+                    low = high = np.nan
+                if 0 < low <= high:
+                    bounds[:, k] = low, high
+            k += 1
+    return bounds
+
+
+def session_matrices(session_data, default=1):
+    """
+    Все матрицы сессии списком (подпись как в cr_data, сравниваемые элементы, верхние треугольники (k, m)),
+    матрицы одного размера уровня сгруппированы. Для сети ANP добавляются заданные матрицы взаимовлияний.
+    """
+    criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = session_hierarchy(
+        session_data, default)
+    _, internal, leaves = tree_order(criteria, children)
+    groups = [([GOAL_CR_LABEL], criteria, np.atleast_2d(criteria_upper))]
+    offset = 0
+    for node in internal:
+        n = len(children[node])
+        groups.append(([f"Матрица '{node}'"], children[node],
+                       np.atleast_2d(subcriteria_upper[offset:offset + n * (n - 1) // 2])))
+        offset += n * (n - 1) // 2
+    groups.append(([f"Матрица '{leaf}'" for leaf in leaves], alternatives, alternatives_upper))
+    if is_network_session(session_data):
+        network = session_network(session_data)
+        present = ~np.all(np.isnan(network), axis=1)
+        network[np.isnan(network)] = default
+        groups.append(([network_label(node) for node, used in zip(criteria + alternatives, present) if used],
+                       criteria, network[present]))
+    return [group for group in groups if group[0]]
+
+
+def build_reciprocal_matrices(upper_values, n):
+    """
+    Собирает стек обратносимметричных матриц (k, n, n)
+    из массива значений верхнего треугольника (k, n*(n-1)/2).
+    """
+    upper = np.asarray(upper_values, dtype=float)
+    if upper.ndim == 1:
+        upper = upper[np.newaxis, :]
+    rows, cols = np.triu_indices(n, 1)
+    matrices = np.ones((upper.shape[0], n, n))
+    matrices[:, rows, cols] = upper
+    matrices[:, cols, rows] = 1.0 / upper
+    return matrices
+
+
+# --- 3. Пакетный расчет весов и согласованности ---
+def batch_priority_vectors(matrices):
+    """
+    Считает главные собственные векторы и lambda_max для всего стека (k, n, n)
+    одним вызовом np.linalg.eig.
+    Возвращает weights (k, n) и lambda_max (k,).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    k, n = matrices.shape[0], matrices.shape[-1]
+    if n == 1:
+        return np.ones((k, 1)), np.ones(k)
+    eigenvalues, eigenvectors = np.linalg.eig(matrices)
+    index = np.argmax(eigenvalues.real, axis=1)
+    rows = np.arange(k)
+    lambda_max = eigenvalues.real[rows, index]
+    # Вектор Перрона положителен с точностью до знака, поэтому берем модуль
+    principal = np.abs(eigenvectors.real[rows, :, index])
+    weights = principal / principal.sum(axis=1, keepdims=True)
+    return weights, lambda_max
+
+
+def batch_power_iteration(matrices, tol=1e-10, max_iter=1000, x0=None):
+    """
+    Степенной метод для стека (k, n, n): w <- A w / sum(A w).
+    Для положительной обратносимметричной матрицы сходится к вектору Перрона,
+    причем для почти согласованных матриц - за несколько итераций.
+    x0 - начальное приближение (n,) или (k, n), например веса прошлого расчета (warm start).
+    Возвращает weights (k, n), lambda_max (k,) и число итераций.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    k, n = matrices.shape[0], matrices.shape[-1]
+    if x0 is None:
+        weights = np.full((k, n), 1.0 / n)
+    else:
+        weights = np.broadcast_to(np.asarray(x0, dtype=float), (k, n))
+        weights = weights / weights.sum(axis=1, keepdims=True)
+    lambda_max = np.full(k, float(n))
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        product = np.einsum('kij,kj->ki', matrices, weights)
+        # Так как sum(w) = 1, сумма A w сходится к lambda_max
+        lambda_max = product.sum(axis=1)
+        new_weights = product / lambda_max[:, np.newaxis]
+        delta = np.max(np.abs(new_weights - weights))
+        weights = new_weights
+        if delta < tol:
+            break
+    return weights, lambda_max, iterations
+
+
+def batch_geometric_mean(matrices):
+    """
+    Приближение весов средним геометрическим строк - O(n^2) на матрицу.
+    lambda_max оценивается как sum(A w), т.е. так же, как в степенном методе.
+    Возвращает weights (k, n) и lambda_max (k,).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    weights = np.exp(np.log(matrices).mean(axis=2))
+    weights /= weights.sum(axis=1, keepdims=True)
+    lambda_max = np.einsum('kij,kj->k', matrices, weights)
+    return weights, lambda_max
+
+
+def consistency_ratios(lambda_max, n):
+    """Считает CR = CI / RI для массива lambda_max матриц одного размера n."""
+    lambda_max = np.asarray(lambda_max, dtype=float)
+    ri = random_index(n)
+    if ri == 0:
+        return np.zeros_like(lambda_max)
+    ci = (lambda_max - n) / (n - 1)
+    return np.abs(ci / ri)
+
+
+# Методы расчета весов: "eig" - точное разложение, "power" - степенной метод,
+# "geometric" - среднее геометрическое строк (приближение)
+SOLVER_METHODS = ("eig", "power", "geometric")
+
+
+def solve_matrices(matrices, method="eig", tol=1e-10, max_iter=1000, x0=None):
+    """Возвращает weights (k, n), lambda_max (k,) и CR (k,) для стека матриц."""
+    if method == "eig":
+        weights, lambda_max = batch_priority_vectors(matrices)
+    elif method == "power":
+        weights, lambda_max, _ = batch_power_iteration(matrices, tol=tol, max_iter=max_iter, x0=x0)
+    elif method == "geometric":
+        weights, lambda_max = batch_geometric_mean(matrices)
+    else:
+        raise ValueError(f"Неизвестный метод расчета весов: {method}. Доступны: {', '.join(SOLVER_METHODS)}")
+    return weights, lambda_max, consistency_ratios(lambda_max, weights.shape[1])
+
+
+# --- 3.1 Неполные матрицы (сокращенный опрос) ---
+# Отсутствующие суждения хранятся как NaN: build_reciprocal_matrices переносит NaN в обе половины матрицы.
+def known_mask(matrices):
+    """Маска известных суждений (k, n, n) без диагонали."""
+    matrices = np.asarray(matrices, dtype=float)
+    return ~np.isnan(matrices) & ~np.eye(matrices.shape[-1], dtype=bool)
+
+
+def comparison_laplacians(known):
+    """Лапласианы графов сравнений (k, n, n): степень вершины на диагонали, -1 для известной пары."""
+    adjacency = known.astype(float)
+    return np.einsum('kij,ij->kij', adjacency.sum(axis=2)[:, :, np.newaxis], np.eye(known.shape[-1])) - adjacency
+
+
+def is_connected(known):
+    """Связен ли граф известных сравнений каждой матрицы (k,) - по рангу лапласиана."""
+    n = known.shape[-1]
+    if n == 1:
+        return np.ones(known.shape[0], dtype=bool)
+    return np.linalg.matrix_rank(comparison_laplacians(known)) == n - 1
+
+
+def batch_llsm(matrices):
+    """
+    Логарифмический МНК по известным суждениям: min sum (log a_ij - x_i + x_j)^2.
+    Нормальные уравнения L x = b (L - лапласиан графа сравнений) решаются псевдообращением
+    сразу для всего стека. Возвращает weights (k, n).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    known = known_mask(matrices)
+    log_a = np.where(known, np.log(np.where(known, matrices, 1.0)), 0.0)
+    x = np.einsum('kij,kj->ki', np.linalg.pinv(comparison_laplacians(known)), log_a.sum(axis=2))
+    weights = np.exp(x - x.max(axis=1, keepdims=True))
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def batch_harker(matrices):
+    """
+    Метод Харкера: пропуски заменяются нулями, на диагональ ставится 1 + число пропусков в строке,
+    главный собственный вектор такой матрицы - веса. Возвращает weights (k, n).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    known = known_mask(matrices)
+    n = matrices.shape[-1]
+    harker = np.where(known, matrices, 0.0)
+    harker[:, np.arange(n), np.arange(n)] = n - known.sum(axis=2)
+    weights, _ = batch_priority_vectors(harker)
+    return weights
+
+
+def complete_matrices(matrices, weights):
+    """Заполняет пропуски отношениями w_i / w_j - так считается CR по известным суждениям."""
+    matrices = np.asarray(matrices, dtype=float)
+    ratios = weights[:, :, np.newaxis] / weights[:, np.newaxis, :]
+    return np.where(np.isnan(matrices), ratios, matrices)
+
+
+def solve_incomplete_matrices(matrices, method="llsm"):
+    """
+    Веса для неполных матриц (NaN - пропуск): method "llsm" или "harker".
+    CR считается по матрице, дополненной найденными весами.
+    Возвращает weights (k, n), lambda_max (k,) и CR (k,).
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    if method == "llsm":
+        weights = batch_llsm(matrices)
+    elif method == "harker":
+        weights = batch_harker(matrices)
+    else:
+        raise ValueError(f"Неизвестный метод для неполных матриц: {method}. Доступны: llsm, harker")
+    _, lambda_max = batch_priority_vectors(complete_matrices(matrices, weights))
+    return weights, lambda_max, consistency_ratios(lambda_max, matrices.shape[-1])
+
+
+def suggest_next_pair(matrix):
+    """
+    Следующая пара (i, j), которую стоит спросить у эксперта, или None, если матрица полная.
+    Пока граф сравнений не связен - пара, соединяющая компоненту первого элемента с остальными
+    (так первые n-1 вопросов образуют остовное дерево). Дальше - пара с наибольшим
+    эффективным сопротивлением в графе: ее отношение w_i / w_j известно хуже всего.
+    """
+    known = known_mask(np.asarray(matrix, dtype=float)[np.newaxis])[0]
+    n = known.shape[0]
+    missing = ~known & ~np.eye(n, dtype=bool)
+    if not missing.any():
+        return None
+    degree = known.sum(axis=1)
+    # Компонента связности элемента 0 (достижимость за n шагов)
+    reach = np.zeros(n, dtype=bool)
+    reach[0] = True
+    for _ in range(n):
+        grown = reach | known[reach].any(axis=0)
+        if (grown == reach).all():
+            break
+        reach = grown
+    if not reach.all():
+        inside, outside = np.flatnonzero(reach), np.flatnonzero(~reach)
+        i, j = inside[np.argmin(degree[inside])], outside[np.argmin(degree[outside])]
+        return (int(min(i, j)), int(max(i, j)))
+    pinv = np.linalg.pinv(comparison_laplacians(known[np.newaxis])[0])
+    diag = np.diag(pinv)
+    resistance = diag[:, np.newaxis] + diag[np.newaxis, :] - 2 * pinv
+    resistance[~np.triu(missing, 1)] = -np.inf
+    i, j = np.unravel_index(np.argmax(resistance), resistance.shape)
+    return (int(i), int(j))
+
+
+# --- 4. Двухуровневая иерархия (Цель -> Критерии -> Альтернативы) ---
+def sorted_weights(names, values, precision=4):
+    """Словарь {имя: вес}, отсортированный по убыванию, как local_weights в 'ahpy'."""
+    weights = {name: round(float(value), precision) for name, value in zip(names, values)}
+    return dict(sorted(weights.items(), key=lambda item: item[1], reverse=True))
+
+
+def solve_hierarchy(criteria, alternatives, criteria_upper, alternatives_upper, precision=4, incomplete=False,
+                    method="eig"):
+    """
+    Решает иерархию целиком.
+    criteria_upper: верхний треугольник матрицы критериев (m_c,)
+    alternatives_upper: верхние треугольники матриц альтернатив (len(criteria), m_a)
+    incomplete=True: NaN в треугольниках - пропущенные суждения, веса считаются методом LLSM.
+    method: метод для полных матриц (см. SOLVER_METHODS).
+    Возвращает тот же кортеж, что и web_app.calculate_ahp:
+    (final_weights, criteria_weights, cr_data, profiles, criteria)
+    """
+    n_crit, n_alt = len(criteria), len(alternatives)
+    crit_matrix = build_reciprocal_matrices(criteria_upper, n_crit)
+    alt_matrices = build_reciprocal_matrices(alternatives_upper, n_alt)
+
+    if incomplete:
+        crit_w, _, crit_cr = solve_incomplete_matrices(crit_matrix)
+        alt_w, _, alt_cr = solve_incomplete_matrices(alt_matrices)
+    else:
+        crit_w, _, crit_cr = solve_matrices(crit_matrix, method)
+        alt_w, _, alt_cr = solve_matrices(alt_matrices, method)
+    return synthesize(criteria, alternatives, crit_w[0], crit_cr[0], alt_w, alt_cr, precision)
+
+
+def synthesize(criteria, alternatives, crit_w, crit_cr, alt_w, alt_cr, precision=4):
+    """
+    Собирает итоговый кортеж из уже посчитанных локальных весов:
+    crit_w (n_crit,), crit_cr - число, alt_w (n_crit, n_alt), alt_cr (n_crit,).
+    """
+    # Синтез: глобальный вес альтернативы = сумма (вес критерия * локальный вес)
+    final = crit_w @ alt_w
+
+    final_weights = sorted_weights(alternatives, final, precision)
+    criteria_weights = sorted_weights(criteria, crit_w, precision)
+    cr_data = {GOAL_CR_LABEL: round(float(crit_cr), precision)}
+    for name, cr in zip(criteria, alt_cr):
+        cr_data[f"Матрица '{name}'"] = round(float(cr), precision)
+    rounded_alt_w = np.round(alt_w, precision)
+    profiles = {alt: [float(v) for v in rounded_alt_w[:, j]] for j, alt in enumerate(alternatives)}
+    return final_weights, criteria_weights, cr_data, profiles, criteria
+
+
+# --- 4.1 Многоуровневая иерархия (Цель -> Критерии -> Подкритерии ... -> Альтернативы) ---
+def solve_unique(upper_values, n, incomplete=False, method="eig"):
+    """
+    Решает стек верхних треугольников (k, m) матриц размера n, одинаковые матрицы - один раз.
+    Возвращает веса уникальных матриц (u, n), их CR (u,) и номер уникальной матрицы для каждой исходной (k,).
+    """
+    upper = np.asarray(upper_values, dtype=float)
+    if upper.ndim == 1:
+        upper = upper[np.newaxis, :]
+    if n < 2:
+        return np.ones((1, n)), np.zeros(1), np.zeros(upper.shape[0], dtype=int)
+    if upper.shape[0] == 0:
+        return np.empty((0, n)), np.empty(0), np.empty(0, dtype=int)
+    unique, inverse = np.unique(upper, axis=0, return_inverse=True)
+    matrices = build_reciprocal_matrices(unique, n)
+    if incomplete:
+        weights, _, cr = solve_incomplete_matrices(matrices)
+    else:
+        weights, _, cr = solve_matrices(matrices, method)
+    return weights, cr, inverse.reshape(-1)
+
+
+def solve_tree(criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper, precision=4,
+               incomplete=False, method="eig"):
+    """
+    Решает иерархию произвольной глубины (аргументы - как в session_hierarchy).
+    Матрицы каждого размера решаются одним пакетом, одинаковые матрицы (общие поддеревья) - один раз.
+    Глобальные веса распространяются по уровням: вес узла = вес родителя * локальный вес.
+    Итог = сумма по листьям (глобальный вес листа * веса альтернатив листа); листья с одинаковой
+    матрицей альтернатив сначала складываются, поэтому умножение на матрицу весов одно.
+    Возвращает тот же кортеж, что и solve_hierarchy; в роли критериев - листья дерева.
+    """
+    nodes, internal, leaves = tree_order(criteria, children)
+    index = {node: i for i, node in enumerate(nodes)}
+    if len(index) != len(nodes):
+        raise ValueError("Имена критериев и подкритериев должны быть уникальны")
+    parent = np.full(len(nodes), -1)
+    local = np.zeros(len(nodes))
+
+    root_w, root_cr, _ = solve_unique(criteria_upper, len(criteria), incomplete, method)
+    local[:len(criteria)] = root_w[0]
+
+    # Матрицы подкритериев: один пакет на каждое число подкритериев
+    sizes = [len(children[node]) for node in internal]
+    offsets = np.cumsum([0] + [n * (n - 1) // 2 for n in sizes])
+    by_size = {}
+    for k, n in enumerate(sizes):
+        by_size.setdefault(n, []).append(k)
+    node_cr = {}
+    for n, group in by_size.items():
+        upper = np.array([subcriteria_upper[offsets[k]:offsets[k + 1]] for k in group]).reshape(len(group), n * (n - 1) // 2)
+        weights, cr, inverse = solve_unique(upper, n, incomplete, method)
+        kids = np.array([[index[kid] for kid in children[internal[k]]] for k in group])
+        local[kids] = weights[inverse]
+        parent[kids] = np.array([index[internal[k]] for k in group])[:, np.newaxis]
+        node_cr.update((internal[k], cr[u]) for k, u in zip(group, inverse))
+
+    # Глобальные веса уровень за уровнем (разреженное произведение: у каждого узла один родитель)
+    depth = np.zeros(len(nodes), dtype=int)
+    for node in nodes:
+        if parent[index[node]] >= 0:
+            depth[index[node]] = depth[parent[index[node]]] + 1
+    global_w = local.copy()
+    for level in range(1, depth.max() + 1 if len(nodes) else 0):
+        selected = np.flatnonzero(depth == level)
+        global_w[selected] = global_w[parent[selected]] * local[selected]
+
+    leaf_w = global_w[[index[leaf] for leaf in leaves]]
+    alt_w, alt_cr, alt_inverse = solve_unique(alternatives_upper, len(alternatives), incomplete, method)
+    final = np.bincount(alt_inverse, weights=leaf_w, minlength=len(alt_w)) @ alt_w
+
+    final_weights = sorted_weights(alternatives, final, precision)
+    criteria_weights = sorted_weights(leaves, leaf_w, precision)
+    leaf_cr = dict(zip(leaves, alt_cr[alt_inverse]))
+    cr_data = {GOAL_CR_LABEL: round(float(root_cr[0]), precision)}
+    for node in nodes:
+        cr_data[f"Матрица '{node}'"] = round(float(node_cr[node] if node in node_cr else leaf_cr[node]), precision)
+    rounded_alt_w = np.round(alt_w[alt_inverse], precision).reshape(len(leaves), len(alternatives))
+    profiles = {alt: [float(v) for v in rounded_alt_w[:, j]] for j, alt in enumerate(alternatives)}
+    return final_weights, criteria_weights, cr_data, profiles, leaves
+
+
+def is_reduced_session(session_data):
+    """Сессия собрана сокращенным опросом: отсутствующее суждение - пропуск, а не 1."""
+    return session_data.get('elicitation_mode') == 'reduced'
+
+
+@ahp_metrics.timed("engine.solve_session")
+def solve_session(session_data, precision=4, incomplete=None, method="eig"):
+    """
+    Решает иерархию по словарю сессии (любого формата, с подкритериями или без, см. session_hierarchy).
+    incomplete=None - по флагу сессии elicitation_mode; иначе отсутствующие суждения = 1.
+    """
+    if incomplete is None:
+        incomplete = is_reduced_session(session_data)
+    criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = session_hierarchy(
+        session_data, np.nan if incomplete else 1)
+    if children:
+        return solve_tree(criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper,
+                          precision, incomplete, method)
+    return solve_hierarchy(criteria, alternatives, criteria_upper, alternatives_upper, precision, incomplete, method)
+
+
+def solve_any_session(session_data, precision=4):
+    """
+    Решает сессию по ее модели: сеть ANP - ahp_network, нечеткий AHP - ahp_fuzzy, иерархия - solve_session.
+    Модули моделей импортируются лениво: сами они импортируют ahp_engine.
+    """
+    if is_network_session(session_data):
+        import ahp_network
+        return ahp_network.solve_session(session_data, precision=precision)
+    if is_fuzzy_session(session_data):
+        import ahp_fuzzy
+        return ahp_fuzzy.solve_session(session_data, precision=precision)
+    return solve_session(session_data, precision=precision)
+
+
+@ahp_metrics.timed("engine.session_gci")
+def session_gci(session_data):
+    """
+    GCI всех матриц проекта: {подпись матрицы (как в cr_data): (GCI, порог)}.
+    В сокращенном опросе пропуски заполняются отношениями весов LLSM.
+    """
+    incomplete = is_reduced_session(session_data)
+    report = {}
+    for labels, items, upper in session_matrices(session_data, np.nan if incomplete else 1):
+        n = len(items)
+        matrices = build_reciprocal_matrices(upper, n)
+        if incomplete:
+            matrices = complete_matrices(matrices, solve_incomplete_matrices(matrices)[0])
+        limit = gci_threshold(n)
+        report.update((label, (float(value), limit)) for label, value in zip(labels, geometric_consistency_index(matrices)))
+    return report
+
+
+@ahp_metrics.timed("engine.solve_session_ahpy")
+def solve_session_ahpy(session_data, precision=4):
+    """
+    Прежний расчет через ahpy.Compare (эталон для сверки). ahpy импортируется лениво:
+    для остальных функций модуля он не нужен.
+    Веса - от ahpy, а CR считается по RI проекта (random_index), как в основном расчете: иначе смена бэкенда
+    меняла бы, какие матрицы считаются несогласованными.
+    """
+    import ahpy
+    criteria, alternatives, criteria_upper, alternatives_upper = session_arrays(session_data)
+    criteria_comps = dict(zip(itertools.combinations(criteria, 2), criteria_upper.tolist()))
+    children_comps = {crit: dict(zip(itertools.combinations(alternatives, 2), upper.tolist()))
+                      for crit, upper in zip(criteria, alternatives_upper)}
+    children_nodes = [ahpy.Compare(name, comps, precision=precision) for name, comps in children_comps.items()]
+    root_node = ahpy.Compare("Goal", criteria_comps, precision=precision)
+    root_node.add_children(children_nodes)
+    crit_cr = solve_matrices(build_reciprocal_matrices(criteria_upper[np.newaxis], len(criteria)))[2]
+    alt_cr = solve_matrices(build_reciprocal_matrices(alternatives_upper, len(alternatives)))[2]
+    cr_data = {GOAL_CR_LABEL: round(float(crit_cr[0]), precision)}
+    for child, cr in zip(children_nodes, alt_cr): cr_data[f"Матрица '{child.name}'"] = round(float(cr), precision)
+    profiles = {alt: [child.local_weights.get(alt, 0) for child in children_nodes] for alt in alternatives}
+    return root_node.target_weights, root_node.local_weights, cr_data, profiles, criteria
+
+
+# --- 5. Инкрементальная модель (пересчет только измененной матрицы) ---
+class AHPModel:
+    """
+    Хранит матрицы иерархии вместе с их локальными весами и CR.
+    set_judgment() меняет одну оценку и помечает только ее матрицу как "грязную";
+    results() пересчитывает грязные матрицы степенным методом, стартуя с прошлых весов,
+    и заново делает дешевый синтез (одно умножение вектора на матрицу).
+    """
+
+    CRITERIA_KEY = "crit"
+
+    def __init__(self, criteria, alternatives, criteria_matrix, alternatives_matrices, precision=4, tol=1e-10):
+        self.criteria = list(criteria)
+        self.alternatives = list(alternatives)
+        self.precision = precision
+        self.tol = tol
+        self._crit_index = {name: i for i, name in enumerate(self.criteria)}
+        self._alt_index = {name: i for i, name in enumerate(self.alternatives)}
+        self.criteria_matrix = np.array(criteria_matrix, dtype=float)
+        self.alternatives_matrices = np.array(alternatives_matrices, dtype=float)
+        # Первый расчет - точный и пакетный, дальше только warm start
+        crit_w, _, crit_cr = solve_matrices(self.criteria_matrix[np.newaxis])
+        self.criteria_weights, self.criteria_cr = crit_w[0], float(crit_cr[0])
+        self.alternatives_weights, _, self.alternatives_cr = solve_matrices(self.alternatives_matrices)
+        self._criteria_dirty = False
+        self._dirty = set()
+
+    @classmethod
+    def from_session(cls, session_data, precision=4):
+        """Строит модель по словарю сессии любого формата (как solve_session)."""
+        criteria, alternatives, criteria_upper, alternatives_upper = session_arrays(session_data)
+        crit_matrix = build_reciprocal_matrices(criteria_upper, len(criteria))
+        alt_matrices = build_reciprocal_matrices(alternatives_upper, len(alternatives))
+        return cls(criteria, alternatives, crit_matrix[0], alt_matrices, precision=precision)
+
+    def set_judgment(self, key_prefix, item_a, item_b, value):
+        """
+        Записывает оценку 'item_a против item_b' в матрицу key_prefix
+        ("crit" или имя критерия). Возвращает True, если значение изменилось.
+        """
+        if key_prefix == self.CRITERIA_KEY:
+            matrix, index = self.criteria_matrix, self._crit_index
+        else:
+            matrix, index = self.alternatives_matrices[self._crit_index[key_prefix]], self._alt_index
+        i, j = index[item_a], index[item_b]
+        value = float(value)
+        if matrix[i, j] == value:
+            return False
+        matrix[i, j] = value
+        matrix[j, i] = 1.0 / value
+        if key_prefix == self.CRITERIA_KEY:
+            self._criteria_dirty = True
+        else:
+            self._dirty.add(self._crit_index[key_prefix])
+        return True
+
+    @property
+    def is_dirty(self):
+        return self._criteria_dirty or bool(self._dirty)
+
+    def refresh(self):
+        """Пересчитывает только грязные матрицы (warm start от прошлых весов)."""
+        if self._criteria_dirty:
+            crit_w, _, crit_cr = solve_matrices(self.criteria_matrix[np.newaxis], method="power",
+                                                tol=self.tol, x0=self.criteria_weights)
+            self.criteria_weights, self.criteria_cr = crit_w[0], float(crit_cr[0])
+            self._criteria_dirty = False
+        if self._dirty:
+            dirty = np.fromiter(sorted(self._dirty), dtype=int)
+            alt_w, _, alt_cr = solve_matrices(self.alternatives_matrices[dirty], method="power",
+                                              tol=self.tol, x0=self.alternatives_weights[dirty])
+            self.alternatives_weights[dirty] = alt_w
+            self.alternatives_cr[dirty] = alt_cr
+            self._dirty.clear()
+
+    def results(self):
+        """Тот же кортеж, что и solve_session: (final_weights, criteria_weights, cr_data, profiles, criteria)."""
+        self.refresh()
+        return synthesize(self.criteria, self.alternatives, self.criteria_weights, self.criteria_cr,
+                          self.alternatives_weights, self.alternatives_cr, self.precision)
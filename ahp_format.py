@@ -0,0 +1,345 @@
+import sys
+import numpy as np
+import ahp_engine
+import ahp_session
+
+
+# --- 1. Разбор текстового формата .ahp (подмножество YAML) ---
+def _scalar(text):
+    """Скаляры остаются строками: числа из матриц преобразуются в float при сборке массивов."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    return text
+
+
+def _flow_list(text):
+    """'[Platform A, Platform B]' -> ['Platform A', 'Platform B']."""
+    inner = text.strip()[1:-1].strip()
+    return [_scalar(part) for part in inner.split(',')] if inner else []
+
+
+def _value(text):
+    text = text.strip()
+    return _flow_list(text) if text.startswith('[') else _scalar(text)
+
+
+def _split_key(text):
+    key, _, value = text.partition(':')
+    return key.strip(), value.strip()
+
+
+def _tokenize(text):
+    """Строки без комментариев и пустых строк в виде (отступ, текст)."""
+    lines = []
+    for raw in text.splitlines():
+        stripped = raw.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if ' #' in stripped:
+            stripped = stripped.split(' #', 1)[0].rstrip()
+        lines.append((len(raw) - len(raw.lstrip()), stripped))
+    return lines
+
+
+def _parse_block(lines, i, indent):
+    """Разбирает блок (словарь или список) с отступом indent начиная со строки i."""
+    if lines[i][1].startswith('- '):
+        return _parse_list(lines, i, indent)
+    return _parse_mapping(lines, i, indent)
+
+
+def _parse_nested(lines, i, indent):
+    """Значение ключа, записанное на следующих строках (глубже или списком на том же уровне)."""
+    if i < len(lines) and (lines[i][0] > indent or (lines[i][0] == indent and lines[i][1].startswith('- '))):
+        return _parse_block(lines, i, lines[i][0])
+    return None, i
+
+
+def _parse_mapping(lines, i, indent, result=None):
+    result = {} if result is None else result
+    while i < len(lines) and lines[i][0] == indent and not lines[i][1].startswith('- '):
+        key, value = _split_key(lines[i][1])
+        i += 1
+        if value:
+            result[key] = _value(value)
+        else:
+            result[key], i = _parse_nested(lines, i, indent)
+    return result, i
+
+
+def _parse_list(lines, i, indent):
+    result = []
+    while i < len(lines) and lines[i][0] == indent and lines[i][1].startswith('- '):
+        item = lines[i][1][2:].strip()
+        item_indent = indent + 2
+        i += 1
+        if item.startswith('[') or ':' not in item:
+            result.append(_value(item))
+            continue
+        # Элемент-словарь: первая пара на строке с '-', остальные - ниже с отступом элемента
+        key, value = _split_key(item)
+        mapping = {}
+        if value:
+            mapping[key] = _value(value)
+        else:
+            mapping[key], i = _parse_nested(lines, i, item_indent)
+        if i < len(lines) and lines[i][0] > indent and not lines[i][1].startswith('- '):
+            mapping, i = _parse_mapping(lines, i, lines[i][0], mapping)
+        result.append(mapping)
+    return result, i
+
+
+def parse_ahp_text(text):
+    """Разбирает текст .ahp во вложенные словари/списки."""
+    lines = _tokenize(text)
+    if not lines:
+        return {}
+    data, _ = _parse_block(lines, 0, lines[0][0])
+    return data
+
+
+# --- 2. Иерархия в виде массивов NumPy ---
+class AHPHierarchy:
+    """
+    Иерархия AHP: цель, узел критериев (root), дерево подкритериев и матрицы сравнений.
+    children[узел] - упорядоченный список дочерних узлов; у листьев (критериев нижнего уровня)
+    детей нет, их матрицы сравнивают альтернативы.
+    matrices[узел] - обратносимметричная матрица (n, n) в порядке children[узел] или alternatives.
+    """
+
+    def __init__(self, goal, root, alternatives, children, matrices):
+        self.goal = goal
+        self.root = root
+        self.alternatives = list(alternatives)
+        self.children = {name: list(kids) for name, kids in children.items() if kids}
+        self.matrices = {name: np.asarray(matrix, dtype=float) for name, matrix in matrices.items()}
+        self._check()
+
+    def _check(self):
+        for node in self.nodes():
+            items = self.items(node)
+            matrix = self.matrices.get(node)
+            if matrix is None:
+                raise ValueError(f"Нет матрицы сравнений для узла '{node}'.")
+            if matrix.shape != (len(items), len(items)):
+                raise ValueError(f"Матрица '{node}' имеет размер {matrix.shape}, ожидается {len(items)}x{len(items)}.")
+
+    @property
+    def criteria(self):
+        return self.children[self.root]
+
+    def items(self, node):
+        """Что сравнивается в матрице узла: его дети или альтернативы (для листа)."""
+        return self.children.get(node, self.alternatives)
+
+    def nodes(self):
+        """Все узлы с матрицами в порядке обхода в ширину, начиная с root."""
+        order = [self.root]
+        for node in order:
+            order.extend(self.children.get(node, []))
+        return order
+
+    def leaves(self):
+        return [node for node in self.nodes() if node not in self.children]
+
+    @property
+    def is_two_level(self):
+        return all(child not in self.children for child in self.criteria)
+
+    def upper(self, node):
+        """Верхний треугольник матрицы узла (в порядке np.triu_indices)."""
+        rows, cols = np.triu_indices(len(self.items(node)), 1)
+        return self.matrices[node][rows, cols]
+
+    def tree(self):
+        """Дерево ниже root в виде ahp_engine.session_hierarchy: (критерии, {узел: подкритерии}, порядок обхода)."""
+        children = {node: kids for node, kids in self.children.items() if node != self.root}
+        return self.criteria, children, ahp_engine.tree_order(self.criteria, children)
+
+    def solve(self, precision=4):
+        """
+        Решает иерархию через ahp_engine.solve_tree: матрицы одного размера - пакетом,
+        одинаковые (общие поддеревья) - один раз. Матрицы восстанавливаются по верхнему треугольнику.
+        Возвращает кортеж как calculate_ahp; для многоуровневой иерархии в роли критериев
+        выступают листья с их глобальными весами.
+        """
+        criteria, children, (_, internal, leaves) = self.tree()
+        m_alt = len(self.alternatives) * (len(self.alternatives) - 1) // 2
+        subcriteria_upper = np.concatenate([self.upper(node) for node in internal]) if internal else np.empty(0)
+        alternatives_upper = np.array([self.upper(leaf) for leaf in leaves]).reshape(len(leaves), m_alt)
+        return ahp_engine.solve_tree(criteria, children, self.alternatives, self.upper(self.root), subcriteria_upper,
+                                     alternatives_upper, precision)
+
+    # --- Связь со словарем сессии web_app ---
+    def to_session(self):
+        """Компактный словарь сессии (версия 2, см. ahp_session); подкритерии записываются отступами."""
+        criteria, children, _ = self.tree()
+        store = ahp_session.JudgmentStore(criteria, self.alternatives, children=children)
+        for key in store.matrix_keys():
+            store.set_upper(key, self.upper(self.root if key == store.CRITERIA_KEY else key))
+        return store.to_dict()
+
+    @classmethod
+    def from_session(cls, session_data, goal="Goal", root="Критерии"):
+        criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = \
+            ahp_engine.session_hierarchy(session_data)
+        _, internal, leaves = ahp_engine.tree_order(criteria, children)
+        matrices = {root: ahp_engine.build_reciprocal_matrices(criteria_upper, len(criteria))[0]}
+        offset = 0
+        for node in internal:
+            n = len(children[node])
+            upper = subcriteria_upper[offset:offset + n * (n - 1) // 2]
+            matrices[node] = ahp_engine.build_reciprocal_matrices(upper, n)[0]
+            offset += n * (n - 1) // 2
+        matrices.update(zip(leaves, ahp_engine.build_reciprocal_matrices(alternatives_upper, len(alternatives))))
+        return cls(goal, root, alternatives, {root: criteria, **children}, matrices)
+
+
+# --- 3. Чтение и запись .ahp ---
+def _children_from_spec(spec, children):
+    """Рекурсивно собирает children из списка {'Name': ..., 'Children': [...]}."""
+    names = []
+    for item in spec or []:
+        name = item['Name'] if isinstance(item, dict) else item
+        names.append(name)
+        if isinstance(item, dict) and item.get('Children'):
+            children[name] = _children_from_spec(item['Children'], children)
+    return names
+
+
+def hierarchy_from_dict(data):
+    goal = data['Goal']
+    criteria = goal['Criteria']
+    children = {}
+    children[criteria['Name']] = _children_from_spec(criteria['Children'], children)
+    raw_matrices = goal.get('PairwiseMatrices') or data.get('PairwiseMatrices') or {}
+    matrices = {name: np.array(rows, dtype=float) for name, rows in raw_matrices.items() if not isinstance(rows, str)}
+    # Ссылка 'Узел: Другой узел' - общая матрица (одинаковые поддеревья описываются один раз)
+    aliases = {name: target for name, target in raw_matrices.items() if isinstance(target, str)}
+    for name, target in aliases.items():
+        seen = {name}
+        while target in aliases:
+            if target in seen:
+                raise ValueError(f"Циклическая ссылка на матрицу узла '{name}'.")
+            seen.add(target)
+            target = aliases[target]
+        if target not in matrices:
+            raise ValueError(f"Матрица узла '{name}' ссылается на неизвестный узел '{target}'.")
+        matrices[name] = matrices[target]
+    return AHPHierarchy(goal['Name'], criteria['Name'], data['Alternatives'], children, matrices)
+
+
+def loads_ahp(text):
+    return hierarchy_from_dict(parse_ahp_text(text))
+
+
+def load_ahp(path):
+    with open(path, encoding='utf-8') as f:
+        return loads_ahp(f.read())
+
+
+def _number(value):
+    return f"{value:.4g}"
+
+
+def dumps_ahp(hierarchy):
+    """Текст .ahp в том же виде, что platform_choice.ahp; повторяющиеся матрицы записываются ссылкой на первую."""
+    lines = [
+        "# Описание иерархии и матриц сравнения",
+        "",
+        f"Alternatives: [{', '.join(hierarchy.alternatives)}]",
+        "Goal:",
+        f"  Name: {hierarchy.goal}",
+        "  Criteria:",
+        f"    Name: {hierarchy.root}",
+        "    Children:",
+    ]
+
+    def add_children(node, indent):
+        for child in hierarchy.children[node]:
+            lines.append(" " * indent + f"- Name: {child}")
+            if child in hierarchy.children:
+                lines.append(" " * (indent + 2) + "Children:")
+                add_children(child, indent + 4)
+
+    add_children(hierarchy.root, 6)
+    lines.append("  PairwiseMatrices:")
+    written = {}
+    for node in hierarchy.nodes():
+        lines.append(f"    # ({', '.join(hierarchy.items(node))})")
+        key = (hierarchy.matrices[node].shape, hierarchy.matrices[node].tobytes())
+        if key in written:
+            lines.append(f"    {node}: {written[key]}")
+            lines.append("")
+            continue
+        written[key] = node
+        lines.append(f"    {node}:")
+        for row in hierarchy.matrices[node]:
+            lines.append(f"      - [{', '.join(_number(v) for v in row)}]")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def dump_ahp(hierarchy, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dumps_ahp(hierarchy))
+
+
+# --- 4. Бинарный компаньон .npz ---
+# Хранит только верхние треугольники матриц одним массивом float64 - загрузка без разбора текста.
+NPZ_VERSION = 1
+
+
+def save_npz(hierarchy, path):
+    nodes = hierarchy.nodes()
+    index = {node: i for i, node in enumerate(nodes)}
+    parents = np.full(len(nodes), -1, dtype=np.int64)
+    for node, kids in hierarchy.children.items():
+        parents[[index[kid] for kid in kids]] = index[node]
+    sizes = np.array([hierarchy.matrices[node].shape[0] for node in nodes], dtype=np.int64)
+    upper = [hierarchy.matrices[node][np.triu_indices(n, 1)] for node, n in zip(nodes, sizes)]
+    np.savez(path, version=np.int64(NPZ_VERSION), goal=np.str_(hierarchy.goal), nodes=np.array(nodes, dtype=str),
+             parents=parents, alternatives=np.array(hierarchy.alternatives, dtype=str), sizes=sizes,
+             upper=np.concatenate(upper) if upper else np.empty(0))
+
+
+def load_npz(path):
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['version']) != NPZ_VERSION:
+            raise ValueError(f"Неподдерживаемая версия файла .npz: {int(data['version'])}")
+        nodes = [str(node) for node in data['nodes']]
+        parents, sizes, upper = data['parents'], data['sizes'], data['upper']
+        alternatives = [str(alt) for alt in data['alternatives']]
+        goal = str(data['goal'])
+    children = {}
+    for node, parent in zip(nodes, parents):
+        if parent >= 0:
+            children.setdefault(nodes[parent], []).append(node)
+    matrices = {}
+    offset = 0
+    for node, n in zip(nodes, sizes):
+        m = int(n * (n - 1) // 2)
+        matrices[node] = ahp_engine.build_reciprocal_matrices(upper[offset:offset + m], int(n))[0]
+        offset += m
+    return AHPHierarchy(goal, nodes[0], alternatives, children, matrices)
+
+
+def load_hierarchy(path):
+    """Загружает .ahp или .npz по расширению файла."""
+    return load_npz(path) if str(path).endswith('.npz') else load_ahp(path)
+
+
+# --- 5. Запуск: python ahp_format.py platform_choice.ahp ---
+if __name__ == "__main__":
+    hierarchy = load_hierarchy(sys.argv[1] if len(sys.argv) > 1 else "platform_choice.ahp")
+    final_weights, criteria_weights, cr_data, _, _ = hierarchy.solve()
+    print(f"\n--- {hierarchy.goal}: ИТОГОВЫЙ РЕЙТИНГ АЛЬТЕРНАТИВ ---")
+    for name, weight in final_weights.items():
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)")
+    print("\n--- Веса Критериев ---")
+    for name, weight in criteria_weights.items():
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)")
+    print("\n--- Проверка согласованности (CR) ---")
+    for name, cr in cr_data.items():
+        print(f"  {name}: CR = {cr:.4f}")
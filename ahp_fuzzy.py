@@ -0,0 +1,238 @@
+"""
+Нечеткий AHP: треугольные нечеткие суждения (l, m, u) и интервальные суждения "от l до u".
+
+Пример:
+  python ahp_fuzzy.py ahp_project_session.json --method extent
+
+Суждение хранится модальным значением m (обычная матрица сессии, по ней считаются CR и диагностика)
+и границами l <= m <= u (ahp_engine.session_fuzzy_bounds); интервальное суждение [l, u] - треугольное
+число с m = sqrt(l * u), четкое - (m, m, m). Все матрицы одного размера решаются одним пакетом (k, n, n, 3):
+  "buckley" - метод Бакли: среднее геометрическое строк по каждой компоненте, нечеткие веса r_i / sum(r);
+  итоговые нечеткие оценки синтезируются по иерархии и дефаззифицируются центром тяжести (l + m + u) / 3.
+  "extent" - анализ протяженности Чанга: синтетические протяженности S_i и степени возможности
+  V(S_i >= S_j); четкие веса - нормированный min_j V(S_i >= S_j), синтез - как в AHP.
+Интервалы приоритетов - границы [l, u] итоговых нечетких оценок.
+"""
+import argparse
+import json
+import numpy as np
+import ahp_engine
+import ahp_metrics
+
+FUZZY_METHODS = ("buckley", "extent")
+DEFAULT_METHOD = "buckley"
+
+
+# --- 1. Нечеткие матрицы и веса ---
+def build_fuzzy_matrices(lower, modal, upper, n):
+    """
+    Стек треугольных нечетких обратносимметричных матриц (k, n, n, 3) из верхних треугольников (k, m)
+    нижних границ, модальных значений и верхних границ: a_ji = (1/u_ij, 1/m_ij, 1/l_ij).
+    NaN в границах - четкое суждение; границы приводятся к l <= m <= u.
+    """
+    modal = np.atleast_2d(np.asarray(modal, dtype=float))
+    lower = np.fmin(np.atleast_2d(np.asarray(lower, dtype=float)), modal)
+    upper = np.fmax(np.atleast_2d(np.asarray(upper, dtype=float)), modal)
+    rows, cols = np.triu_indices(n, 1)
+    matrices = np.ones((modal.shape[0], n, n, 3))
+    matrices[:, rows, cols] = np.stack([lower, modal, upper], axis=-1)
+    matrices[:, cols, rows] = 1.0 / np.stack([upper, modal, lower], axis=-1)
+    return matrices
+
+
+def defuzzify(fuzzy):
+    """Центр тяжести треугольных чисел (..., 3): (l + m + u) / 3."""
+    return np.asarray(fuzzy).mean(axis=-1)
+
+
+def buckley_weights(matrices):
+    """
+    Метод Бакли для стека (k, n, n, 3): r_i - среднее геометрическое строки по каждой компоненте,
+    нечеткий вес w_i = r_i * (sum r)^-1 = (l_i / sum u, m_i / sum m, u_i / sum l). Возвращает (k, n, 3).
+    """
+    r = np.exp(np.log(matrices).mean(axis=2))
+    return r / r.sum(axis=1, keepdims=True)[..., ::-1]
+
+
+def extent_analysis(matrices):
+    """
+    Анализ протяженности Чанга для стека (k, n, n, 3).
+    Синтетическая протяженность S_i = sum_j a_ij * (sum_ij a_ij)^-1; степень возможности
+    V(S_i >= S_j) = 1, если m_i >= m_j; 0, если l_j >= u_i; иначе (l_j - u_i) / ((m_i - u_i) - (m_j - l_j)).
+    Возвращает протяженности (k, n, 3) и четкие веса (k, n) - нормированный min_j V(S_i >= S_j).
+    """
+    row_sums = matrices.sum(axis=2)
+    extents = row_sums / row_sums.sum(axis=1, keepdims=True)[..., ::-1]
+    low, mid, high = np.moveaxis(extents, -1, 0)
+    low_i, mid_i, high_i = low[:, :, np.newaxis], mid[:, :, np.newaxis], high[:, :, np.newaxis]
+    low_j, mid_j = low[:, np.newaxis, :], mid[:, np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        partial = (low_j - high_i) / ((mid_i - high_i) - (mid_j - low_j))
+    possibility = np.where(mid_i >= mid_j, 1.0, np.where(low_j >= high_i, 0.0, partial))
+    degree = possibility.min(axis=2)
+    total = degree.sum(axis=1, keepdims=True)
+    # Все степени нулевые бывают только в вырожденных случаях - тогда веса равные
+    weights = np.where(total > 0, degree / np.where(total > 0, total, 1.0), 1.0 / degree.shape[1])
+    return extents, weights
+
+
+def fuzzy_weights(lower, modal, upper, n, method=DEFAULT_METHOD):
+    """
+    Веса стека матриц размера n по верхним треугольникам (k, m): нечеткие (k, n, 3) и четкие (k, n).
+    buckley - четкие веса = нормированный центр тяжести нечетких; extent - нечеткие веса = протяженности S_i.
+    """
+    modal = np.atleast_2d(np.asarray(modal, dtype=float))
+    if n < 2:
+        return np.ones((modal.shape[0], n, 3)), np.ones((modal.shape[0], n))
+    matrices = build_fuzzy_matrices(lower, modal, upper, n)
+    if method == "buckley":
+        fuzzy = buckley_weights(matrices)
+        crisp = defuzzify(fuzzy)
+        return fuzzy, crisp / crisp.sum(axis=1, keepdims=True)
+    if method == "extent":
+        return extent_analysis(matrices)
+    raise ValueError(f"Неизвестный метод нечеткого AHP: {method}")
+
+
+def _complete(upper, n):
+    """Пропуски сокращенного опроса (NaN) заполняются отношениями весов LLSM, как в ahp_diagnostics."""
+    matrices = ahp_engine.build_reciprocal_matrices(upper, n)
+    weights, _, _ = ahp_engine.solve_incomplete_matrices(matrices)
+    rows, cols = np.triu_indices(n, 1)
+    return ahp_engine.complete_matrices(matrices, weights)[:, rows, cols]
+
+
+# --- 2. Решение иерархии ---
+def solve_fuzzy_tree(criteria, children, alternatives, values, precision=4, incomplete=False, method=DEFAULT_METHOD):
+    """
+    Решает нечеткую иерархию произвольной глубины. values (3, число суждений) - нижние, модальные и верхние
+    значения в порядке ahp_group.judgment_keys (JudgmentStore.fuzzy_values()).
+    Матрицы всех узлов группируются по размеру, каждая группа - один пакет fuzzy_weights.
+    Глобальный нечеткий вес узла - произведение по компонентам вдоль пути от цели, итоговая оценка
+    альтернативы - сумма по листьям (вес листа * локальный вес альтернативы).
+    Возвращает (кортеж как у ahp_engine.solve_tree, интервалы), интервалы - {"alternatives": {имя: (l, m, u)},
+    "criteria": {лист: (l, m, u)}}.
+    """
+    nodes, internal, leaves = ahp_engine.tree_order(criteria, children)
+    index = {node: i for i, node in enumerate(nodes)}
+    if len(index) != len(nodes):
+        raise ValueError("Имена критериев и подкритериев должны быть уникальны")
+    values = np.asarray(values, dtype=float)
+    n_alt = len(alternatives)
+
+    # Матрицы иерархии: (владелец весов, элементы, срез суждений); альтернативы всех листьев - одна группа строк
+    matrices = [(None, criteria)] + [(node, children[node]) for node in internal] + [(leaf, alternatives) for leaf in leaves]
+    offsets = np.cumsum([0] + [len(items) * (len(items) - 1) // 2 for _, items in matrices])
+    by_size = {}
+    for k, (_, items) in enumerate(matrices):
+        by_size.setdefault(len(items), []).append(k)
+    local_fuzzy = [None] * len(matrices)
+    local_crisp = [None] * len(matrices)
+    matrix_cr = np.zeros(len(matrices))
+    for n, group in by_size.items():
+        m = n * (n - 1) // 2
+        block = np.stack([values[:, offsets[k]:offsets[k + 1]] for k in group], axis=1).reshape(3, len(group), m)
+        lower, modal, upper = block
+        if incomplete:
+            missing = np.isnan(modal)
+            if missing.any() and n > 1:
+                filled = _complete(modal, n)
+                lower, modal, upper = (np.where(missing, filled, part) for part in (lower, modal, upper))
+        fuzzy, crisp = fuzzy_weights(lower, modal, upper, n, method)
+        # Согласованность - по модальной матрице
+        if n > 1:
+            _, _, cr = ahp_engine.solve_matrices(ahp_engine.build_reciprocal_matrices(modal, n))
+            matrix_cr[group] = cr
+        for row, k in enumerate(group):
+            local_fuzzy[k], local_crisp[k] = fuzzy[row], crisp[row]
+
+    global_fuzzy = np.ones((len(nodes), 3))
+    global_crisp = np.ones(len(nodes))
+    global_fuzzy[:len(criteria)], global_crisp[:len(criteria)] = local_fuzzy[0], local_crisp[0]
+    # tree_order - обход в ширину: вес родителя известен раньше весов его подкритериев
+    for k, node in enumerate(internal, start=1):
+        kids = [index[kid] for kid in children[node]]
+        global_fuzzy[kids] = global_fuzzy[index[node]] * local_fuzzy[k]
+        global_crisp[kids] = global_crisp[index[node]] * local_crisp[k]
+    leaf_ids = [index[leaf] for leaf in leaves]
+    leaf_fuzzy, leaf_crisp = global_fuzzy[leaf_ids], global_crisp[leaf_ids]
+    alt_fuzzy = np.array(local_fuzzy[1 + len(internal):]).reshape(len(leaves), n_alt, 3)
+    alt_crisp = np.array(local_crisp[1 + len(internal):]).reshape(len(leaves), n_alt)
+    final_fuzzy = np.einsum('lc,lac->ac', leaf_fuzzy, alt_fuzzy)
+
+    if method == "buckley":
+        final = defuzzify(final_fuzzy)
+        leaf_w = defuzzify(leaf_fuzzy)
+    else:
+        final = leaf_crisp @ alt_crisp
+        leaf_w = leaf_crisp
+    final = final / max(final.sum(), 1e-300)
+    leaf_w = leaf_w / max(leaf_w.sum(), 1e-300)
+
+    final_weights = ahp_engine.sorted_weights(alternatives, final, precision)
+    criteria_weights = ahp_engine.sorted_weights(leaves, leaf_w, precision)
+    cr_data = {ahp_engine.GOAL_CR_LABEL: round(float(matrix_cr[0]), precision)}
+    node_cr = dict(zip(internal + leaves, matrix_cr[1:]))
+    for node in nodes:
+        cr_data[f"Матрица '{node}'"] = round(float(node_cr[node]), precision)
+    rounded_alt_w = np.round(alt_crisp, precision)
+    profiles = {alt: [float(v) for v in rounded_alt_w[:, j]] for j, alt in enumerate(alternatives)}
+    intervals = {
+        "alternatives": {alt: tuple(round(float(v), precision) for v in final_fuzzy[j]) for j, alt in enumerate(alternatives)},
+        "criteria": {leaf: tuple(round(float(v), precision) for v in leaf_fuzzy[i]) for i, leaf in enumerate(leaves)},
+    }
+    return (final_weights, criteria_weights, cr_data, profiles, leaves), intervals
+
+
+def session_values(session_data):
+    """Нижние, модальные и верхние значения всех суждений сессии (3, число суждений); пропуски модальных - NaN."""
+    criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = \
+        ahp_engine.session_hierarchy(session_data, np.nan)
+    modal = np.concatenate([criteria_upper, subcriteria_upper, alternatives_upper.ravel()])
+    bounds = ahp_engine.session_fuzzy_bounds(session_data)
+    bounds = np.where(np.isnan(bounds), modal, bounds)
+    return np.stack([bounds[0], modal, bounds[1]])
+
+
+def _solve(session_data, precision, method):
+    incomplete = ahp_engine.is_reduced_session(session_data)
+    criteria, children = ahp_engine.parse_tree(session_data['criteria_input'])
+    alternatives = ahp_engine.parse_items(session_data['alternatives_input'])
+    values = session_values(session_data)
+    if not incomplete:
+        values = np.where(np.isnan(values), 1.0, values)
+    return solve_fuzzy_tree(criteria, children, alternatives, values, precision, incomplete,
+                            method or session_data.get('fuzzy_method') or DEFAULT_METHOD)
+
+
+@ahp_metrics.timed("fuzzy.solve_session")
+def solve_session(session_data, precision=4, method=None):
+    """Решает нечеткую иерархию по словарю сессии любого формата. method=None - метод сессии (fuzzy_method)."""
+    return _solve(session_data, precision, method)[0]
+
+
+def priority_intervals(session_data, precision=4, method=None):
+    """Интервалы приоритетов сессии: {"alternatives": {имя: (l, m, u)}, "criteria": {лист: (l, m, u)}}."""
+    return _solve(session_data, precision, method)[1]
+
+
+# --- 3. Запуск из командной строки ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нечеткий AHP по файлу сессии (.json).")
+    parser.add_argument("session", help="файл сессии ahp_project_session.json")
+    parser.add_argument("--method", choices=FUZZY_METHODS, default=None)
+    args = parser.parse_args()
+
+    with open(args.session, encoding='utf-8') as f:
+        session_data = json.load(f)
+    (final_weights, criteria_weights, cr_data, _, _), intervals = _solve(session_data, 4, args.method)
+    print("\n--- ИТОГОВЫЙ РЕЙТИНГ АЛЬТЕРНАТИВ (нечеткий AHP) ---")
+    for name, weight in final_weights.items():
+        low, mid, high = intervals["alternatives"][name]
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)  нечеткая оценка ({low:.4f}, {mid:.4f}, {high:.4f})")
+    print("\n--- Веса критериев ---")
+    for name, weight in criteria_weights.items():
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)")
+    print("\n--- Проверка согласованности (CR, модальные суждения) ---")
+    for name, cr in cr_data.items():
+        print(f"  {name}: CR = {cr:.4f}")
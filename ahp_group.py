@@ -0,0 +1,263 @@
+import itertools
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ahp_engine
+import ahp_metrics
+import ahp_session
+
+
+# --- 1. Ключи суждений проекта ---
+def judgment_keys(criteria, alternatives, children=None):
+    """
+    Все ключи суждений, которые читает calculate_ahp, в фиксированном порядке:
+    сначала 'crit_A_B', затем '{узел}_A_B' для подкритериев каждого узла с подкритериями
+    и '{лист}_A_B' для альтернатив каждого листа (без подкритериев листья - сами критерии).
+    """
+    children = children or {}
+    _, internal, leaves = ahp_engine.tree_order(criteria, children)
+    keys = [f"crit_{a}_{b}" for a, b in itertools.combinations(criteria, 2)]
+    for node in internal:
+        keys.extend(f"{node}_{a}_{b}" for a, b in itertools.combinations(children[node], 2))
+    for leaf in leaves:
+        keys.extend(f"{leaf}_{a}_{b}" for a, b in itertools.combinations(alternatives, 2))
+    return keys
+
+
+# --- 2. Потоковый аккумулятор среднего геометрического ---
+class GroupAccumulator:
+    """
+    Накапливает суммы логарифмов и число ответов по каждому ключу суждения
+    в заранее выделенных массивах - память O(число ключей), не зависит от числа экспертов.
+    Среднее геометрическое считается как exp(sum(log v) / count): без переполнения,
+    которое дает np.prod на тысячах бюллетеней.
+    Частичные аккумуляторы (например, из разных процессов) объединяются через merge().
+    Нечеткие бюллетени (ahp_fuzzy) агрегируются так же по каждой границе l и u (метод Бакли); у четких
+    суждений l = m = u. Если нечеткий хотя бы один бюллетень, результат - нечеткая сессия.
+    Если хотя бы один бюллетень собран сокращенным опросом, результат - тоже сокращенная сессия:
+    суждения без ответов остаются пропусками (LLSM), а не равны 1.
+    """
+
+    def __init__(self, criteria_input, alternatives_input):
+        self.criteria_input = criteria_input
+        self.alternatives_input = alternatives_input
+        self.criteria, self.children = ahp_engine.parse_tree(criteria_input)
+        self.alternatives = ahp_engine.parse_items(alternatives_input)
+        self.keys = judgment_keys(self.criteria, self.alternatives, self.children)
+        self.log_sum = np.zeros(len(self.keys))
+        self.log_bounds = np.zeros((2, len(self.keys)))
+        self.counts = np.zeros(len(self.keys), dtype=np.int64)
+        self.n_ballots = 0
+        self.fuzzy_method = None
+        self.fuzzy = False
+        self.reduced = False
+
+    @classmethod
+    def from_ballot(cls, data):
+        """Аккумулятор со структурой проекта (критерии/альтернативы) из бюллетеня."""
+        return cls(data['criteria_input'], data['alternatives_input'])
+
+    def add(self, data):
+        """
+        Добавляет один бюллетень (словарь сессии любой версии). Отсутствующие и некорректные оценки пропускаются.
+        Бюллетень приводится к массиву суждений проекта, дальше - операции над массивами.
+        """
+        store = ahp_session.load_session(data).reindex(self.criteria, self.alternatives, self.children)
+        lower, values, upper = store.fuzzy_values()
+        answered = np.isfinite(values) & (values > 0)
+        self.log_sum[answered] += np.log(values[answered])
+        self.log_bounds[:, answered] += np.log(np.stack([lower[answered], upper[answered]]))
+        self.counts[answered] += 1
+        self.n_ballots += 1
+        self.reduced = self.reduced or store.elicitation_mode == 'reduced'
+        if store.model == "fuzzy" or store.is_fuzzy():
+            self.fuzzy = True
+            self.fuzzy_method = self.fuzzy_method or store.fuzzy_method
+
+    def merge(self, other):
+        """Добавляет частичный результат другого аккумулятора с той же структурой проекта."""
+        if self.keys != other.keys:
+            raise ValueError("Бюллетени относятся к разным проектам (не совпадают критерии или альтернативы).")
+        self.log_sum += other.log_sum
+        self.log_bounds += other.log_bounds
+        self.counts += other.counts
+        self.n_ballots += other.n_ballots
+        self.fuzzy = self.fuzzy or other.fuzzy
+        self.fuzzy_method = self.fuzzy_method or other.fuzzy_method
+        self.reduced = self.reduced or other.reduced
+        return self
+
+    def result(self):
+        """Компактный словарь агрегированной сессии для calculate_ahp. Суждения, на которые никто не ответил, - NaN."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            geo_means = np.where(self.counts > 0, np.exp(self.log_sum / np.maximum(self.counts, 1)), np.nan)
+            bounds = np.where(self.counts > 0, np.exp(self.log_bounds / np.maximum(self.counts, 1)), np.nan)
+        mode = 'reduced' if self.reduced else 'full'
+        if not self.fuzzy:
+            return ahp_session.JudgmentStore.from_flat(self.criteria, self.alternatives, geo_means, self.children,
+                                                       mode).to_dict()
+        # Границы, совпавшие со средним модальных значений (все ответы четкие), не сохраняются
+        bounds[:, np.all(np.isclose(bounds, geo_means), axis=0)] = np.nan
+        store = ahp_session.JudgmentStore.from_flat(self.criteria, self.alternatives, geo_means, self.children, mode,
+                                                    bounds=bounds)
+        store.model, store.fuzzy_method = "fuzzy", self.fuzzy_method
+        return store.to_dict()
+
+
+# --- 3. Агрегация файлов ---
+@ahp_metrics.timed("group.aggregate_streams")
+def aggregate_streams(files):
+    """
+    Агрегирует открытые файлы (например, загруженные в Streamlit) по одному проходу:
+    каждый бюллетень разбирается один раз, структура проекта берется из первого.
+    """
+    accumulator = None
+    for file in files:
+        file.seek(0)
+        with ahp_metrics.span("io.ballot_parse"):
+            data = json.load(file)
+        ahp_metrics.count("group.ballots")
+        if accumulator is None:
+            accumulator = GroupAccumulator.from_ballot(data)
+        accumulator.add(data)
+    return accumulator
+
+
+def _aggregate_chunk(paths, criteria_input, alternatives_input):
+    accumulator = GroupAccumulator(criteria_input, alternatives_input)
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            accumulator.add(json.load(f))
+    return accumulator
+
+
+def aggregate_paths(paths, workers=None, chunk_size=256):
+    """
+    Агрегирует бюллетени с диска. При workers > 1 файлы делятся на блоки по chunk_size,
+    каждый блок агрегируется в отдельном процессе, частичные результаты объединяются merge().
+    """
+    paths = list(paths)
+    with open(paths[0], encoding='utf-8') as f:
+        first = json.load(f)
+    accumulator = GroupAccumulator.from_ballot(first)
+    accumulator.add(first)
+    rest = paths[1:]
+    if not rest:
+        return accumulator
+    if not workers or workers <= 1:
+        return accumulator.merge(_aggregate_chunk(rest, accumulator.criteria_input, accumulator.alternatives_input))
+    chunk_size = max(1, min(chunk_size, math.ceil(len(rest) / workers)))
+    chunks = [rest[i:i + chunk_size] for i in range(0, len(rest), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = pool.map(_aggregate_chunk, chunks,
+                            itertools.repeat(accumulator.criteria_input), itertools.repeat(accumulator.alternatives_input))
+        for partial in partials:
+            accumulator.merge(partial)
+    return accumulator
+
+
+# --- 4. Агрегация индивидуальных приоритетов (AIP) ---
+def ballot_matrix(ballots, criteria, alternatives, missing=1.0):
+    """
+    Значения всех суждений экспертов одной матрицей (E, число ключей) в порядке judgment_keys().
+    Бюллетени любой версии; отсутствующие оценки = missing (1, как в calculate_ahp; NaN - пропуск для LLSM).
+    """
+    n_crit, n_alt = len(criteria), len(alternatives)
+    values = np.full((len(ballots), n_crit * (n_crit - 1) // 2 + n_crit * n_alt * (n_alt - 1) // 2), missing)
+    for row, ballot in zip(values, ballots):
+        flat = ahp_session.load_session(ballot).reindex(criteria, alternatives).flat_values()
+        answered = np.isfinite(flat)
+        row[answered] = flat[answered]
+    return values
+
+
+def solve_individual(values, n_crit, n_alt, chunk_size=64, method="eig", incomplete=False):
+    """
+    Решает иерархии всех экспертов пакетно: values (E, ключи) из ballot_matrix().
+    Эксперты обрабатываются блоками по chunk_size, чтобы тензор (E * n_crit, n_alt, n_alt) не рос без предела.
+    incomplete=True - NaN в values - пропуски, веса считаются LLSM (как в ahp_engine.solve_unique), method не используется.
+    Возвращает crit_w (E, n_crit), crit_cr (E,), alt_w (E, n_crit, n_alt), alt_cr (E, n_crit).
+    """
+    def solve(upper, n):
+        matrices = ahp_engine.build_reciprocal_matrices(upper, n)
+        return ahp_engine.solve_incomplete_matrices(matrices) if incomplete else ahp_engine.solve_matrices(matrices, method)
+
+    n_experts = values.shape[0]
+    m_crit = n_crit * (n_crit - 1) // 2
+    m_alt = n_alt * (n_alt - 1) // 2
+    crit_w, crit_cr = np.empty((n_experts, n_crit)), np.empty(n_experts)
+    alt_w, alt_cr = np.empty((n_experts, n_crit, n_alt)), np.empty((n_experts, n_crit))
+    for start in range(0, n_experts, chunk_size):
+        block = values[start:start + chunk_size]
+        e = block.shape[0]
+        w, _, cr = solve(block[:, :m_crit], n_crit)
+        crit_w[start:start + e], crit_cr[start:start + e] = w, cr
+        alt_upper = block[:, m_crit:].reshape(e * n_crit, m_alt)
+        w, _, cr = solve(alt_upper, n_alt)
+        alt_w[start:start + e], alt_cr[start:start + e] = w.reshape(e, n_crit, n_alt), cr.reshape(e, n_crit)
+    return crit_w, crit_cr, alt_w, alt_cr
+
+
+def _combine(vectors, weights, mean):
+    """Взвешенное среднее приоритетов экспертов по оси 0 с нормировкой по последней оси."""
+    if mean == "geometric":
+        combined = np.exp(np.tensordot(weights, np.log(vectors), axes=1))
+    else:
+        combined = np.tensordot(weights, vectors, axes=1)
+    return combined / combined.sum(axis=-1, keepdims=True)
+
+
+@ahp_metrics.timed("group.aip")
+def aggregate_individual_priorities(ballots, expert_weights=None, cr_threshold=0.1, inconsistent="keep",
+                                    mean="geometric", precision=4, chunk_size=64):
+    """
+    AIP: иерархия каждого эксперта решается отдельно (пакетно), затем векторы приоритетов
+    объединяются взвешенным средним (mean: "geometric" или "arithmetic").
+    expert_weights - веса экспертов (по умолчанию равные).
+    inconsistent - что делать с бюллетенями, у которых максимальный CR > cr_threshold:
+      "keep" - учитывать как есть, "exclude" - отбросить, "downweight" - умножить вес на cr_threshold / CR.
+    Возвращает (results, expert_cr, used_weights), где results - кортеж того же вида, что и calculate_ahp,
+    expert_cr (E,) - максимальный CR по матрицам эксперта, used_weights (E,) - итоговые веса экспертов.
+    """
+    criteria, children = ahp_engine.parse_tree(ballots[0]['criteria_input'])
+    if children:
+        raise ValueError("AIP поддерживает только двухуровневую иерархию (критерии без подкритериев).")
+    alternatives = ahp_engine.parse_items(ballots[0]['alternatives_input'])
+    n_crit, n_alt, n_experts = len(criteria), len(alternatives), len(ballots)
+    # Сокращенные бюллетени решаются LLSM с пропусками (как ahp_engine.solve_session), полные - как прежде (пропуск = 1)
+    reduced = np.array([ahp_engine.is_reduced_session(ballot) for ballot in ballots])
+    values = ballot_matrix(ballots, criteria, alternatives, np.nan)
+    values[~reduced] = np.where(np.isnan(values[~reduced]), 1.0, values[~reduced])
+    crit_w, crit_cr = np.empty((n_experts, n_crit)), np.empty(n_experts)
+    alt_w, alt_cr = np.empty((n_experts, n_crit, n_alt)), np.empty((n_experts, n_crit))
+    for incomplete in (False, True):
+        rows = reduced == incomplete
+        if rows.any():
+            crit_w[rows], crit_cr[rows], alt_w[rows], alt_cr[rows] = solve_individual(
+                values[rows], n_crit, n_alt, chunk_size, incomplete=incomplete)
+
+    expert_cr = np.maximum(crit_cr, alt_cr.max(axis=1, initial=0.0))
+    weights = np.ones(len(ballots)) if expert_weights is None else np.asarray(expert_weights, dtype=float).copy()
+    too_high = expert_cr > cr_threshold
+    if inconsistent == "exclude":
+        weights[too_high] = 0.0
+    elif inconsistent == "downweight":
+        weights[too_high] *= cr_threshold / expert_cr[too_high]
+    elif inconsistent != "keep":
+        raise ValueError(f"Неизвестный режим для несогласованных бюллетеней: {inconsistent}")
+    if weights.sum() <= 0:
+        raise ValueError("Все бюллетени отсеяны: ни один эксперт не прошел порог согласованности.")
+    weights = weights / weights.sum()
+
+    # Итоговые веса альтернатив каждого эксперта (E, n_alt) - одно einsum на всех
+    expert_final = np.einsum('ec,eca->ea', crit_w, alt_w)
+    final = _combine(expert_final, weights, mean)
+    group_crit_w = _combine(crit_w, weights, mean)
+    group_alt_w = _combine(alt_w, weights, mean)
+    # Таблица CR показывает взвешенный средний CR экспертов по каждой матрице
+    results = ahp_engine.synthesize(criteria, alternatives, group_crit_w, weights @ crit_cr, group_alt_w,
+                                    weights @ alt_cr, precision)
+    # Синтез AIP - это среднее итоговых векторов экспертов, а не произведение средних весов
+    results = (ahp_engine.sorted_weights(alternatives, final, precision),) + results[1:]
+    return results, expert_cr, weights
@@ -0,0 +1,146 @@
+"""
+Нагрузочный тест локального HTTP-сервиса AHP (ahp_service).
+
+Пример:
+  python ahp_loadtest.py --start --requests 5000 --concurrency 64
+  python ahp_loadtest.py --url http://127.0.0.1:8765 --criteria 5 --alternatives 10 --unique 0.5 --ahp-share 0.1
+
+Сессии генерируются как в ahp_bench (случайные согласованные с шумом матрицы). --unique - доля запросов
+с неповторяющимися суждениями (остальные повторяют небольшой набор и попадают в кэш сервиса),
+--ahp-share - доля запросов в формате .ahp. Клиент - asyncio с keep-alive соединениями, без зависимостей.
+Выводит пропускную способность, задержки (p50/p95/p99) и число ошибок; --start запускает сервис сам.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+import numpy as np
+import ahp_bench
+import ahp_format
+import ahp_service
+
+
+# --- 1. Запросы ---
+def make_payloads(n_requests, n_crit, n_alt, unique=0.2, ahp_share=0.0, noise=0.1, seed=0):
+    """Тела запросов: [(bytes, Content-Type)]. Повторяющиеся запросы берутся из набора из 16 проектов."""
+    rng = np.random.default_rng(seed)
+    repeated = [ahp_bench.synthetic_store(n_crit, n_alt, noise, rng).to_dict() for _ in range(16)]
+    payloads = []
+    for _ in range(n_requests):
+        if rng.random() < unique:
+            session_data = ahp_bench.synthetic_store(n_crit, n_alt, noise, rng).to_dict()
+        else:
+            session_data = repeated[rng.integers(len(repeated))]
+        if rng.random() < ahp_share:
+            text = ahp_format.dumps_ahp(ahp_format.AHPHierarchy.from_session(session_data))
+            payloads.append((text.encode('utf-8'), "text/plain"))
+        else:
+            payloads.append((json.dumps(session_data).encode('utf-8'), "application/json"))
+    return payloads
+
+
+# --- 2. Клиент ---
+async def _post(reader, writer, host, path, body, content_type):
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _worker(host, port, queue, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                body, content_type = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                status, _ = await _post(reader, writer, host, "/solve", body, content_type)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors.append("connection")
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(url, payloads, concurrency):
+    """Отправляет все payloads через concurrency соединений. Возвращает (время, задержки, ошибки)."""
+    target = urlsplit(url)
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker(target.hostname, target.port, queue, latencies, errors) for _ in range(concurrency)))
+    return time.perf_counter() - start, np.array(latencies), errors
+
+
+async def wait_ready(url, timeout=30.0):
+    target = urlsplit(url)
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(target.hostname, target.port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"Сервис {url} не ответил за {timeout:.0f} с")
+
+
+# --- 3. Запуск ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса ahp_service.")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{ahp_service.DEFAULT_PORT}")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--criteria", type=int, default=5)
+    parser.add_argument("--alternatives", type=int, default=5)
+    parser.add_argument("--unique", type=float, default=0.2, help="доля запросов с новыми суждениями")
+    parser.add_argument("--ahp-share", type=float, default=0.0, help="доля запросов в формате .ahp")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", action="store_true", help="запустить ahp_service на время теста")
+    parser.add_argument("--workers", type=int, default=None, help="процессов сервиса (с --start)")
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.requests, args.criteria, args.alternatives, args.unique, args.ahp_share, seed=args.seed)
+    process = None
+    if args.start:
+        command = [sys.executable, ahp_service.__file__, "--port", str(urlsplit(args.url).port)]
+        if args.workers is not None:
+            command += ["--workers", str(args.workers)]
+        process = subprocess.Popen(command)
+    try:
+        asyncio.run(wait_ready(args.url))
+        elapsed, latencies, errors = asyncio.run(run_load(args.url, payloads, args.concurrency))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"Запросов: {len(latencies)} за {elapsed:.2f} с - {len(latencies) / elapsed:.0f} запр/с "
+          f"({args.concurrency} соединений, {args.criteria}x{args.alternatives}, новых {args.unique:.0%})")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(f"Задержка: p50 {p50:.1f} мс, p95 {p95:.1f} мс, p99 {p99:.1f} мс, макс {latencies.max() * 1000:.1f} мс")
+    print(f"Ошибок: {len(errors)}" + (f" ({', '.join(str(e) for e in sorted(set(errors), key=str))})" if errors else ""))
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,234 @@
+"""
+Легкая инструментация горячих путей: интервалы (spans) и счетчики.
+
+Пример:
+  AHP_METRICS_JSONL=metrics.jsonl streamlit run web_app.py
+  python ahp_metrics.py metrics.jsonl --prometheus > ahp.prom
+
+Замеры пишутся в "текущий" Recorder (contextvars: у каждого потока/сессии Streamlit свой),
+activate(None) или отсутствие активного Recorder - ничего не пишется. AHP_METRICS=0 при запуске
+отключает инструментацию полностью: timed() возвращает функцию без обертки, span() - общий пустой объект.
+Экспорт: JSONL (строка на интервал) и текстовый формат Prometheus (сводка по интервалам и счетчики).
+"""
+import argparse
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+ENABLED = os.environ.get("AHP_METRICS", "1") != "0"
+# Сколько последних интервалов хранит Recorder (сводка считается по всем)
+MAX_SPANS = 2000
+
+_current = contextvars.ContextVar("ahp_metrics_recorder", default=None)
+
+
+# --- 1. Хранилище замеров ---
+class Recorder:
+    """
+    Замеры одной сессии: последние max_spans интервалов, сводка по именам (число, сумма, максимум, последний)
+    и счетчики. sink - необязательная функция, получающая каждую запись (например, JsonlSink).
+    """
+
+    def __init__(self, max_spans=MAX_SPANS, sink=None):
+        self.spans = deque(maxlen=max_spans)
+        self.totals = {}
+        self.counters = {}
+        self.sink = sink
+
+    def record(self, name, duration, attrs=None):
+        entry = {"ts": round(time.time(), 6), "span": name, "duration_s": duration}
+        if attrs:
+            entry["attrs"] = attrs
+        self.spans.append(entry)
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [1, duration, duration, duration]
+        else:
+            total[0] += 1
+            total[1] += duration
+            total[2] = max(total[2], duration)
+            total[3] = duration
+        if self.sink is not None:
+            self.sink(entry)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        if self.sink is not None:
+            self.sink({"ts": round(time.time(), 6), "counter": name, "value": value})
+
+    def reset(self):
+        self.spans.clear()
+        self.totals.clear()
+        self.counters.clear()
+
+    def summary(self):
+        """Сводка по интервалам, самые затратные первыми: [(имя, вызовов, сумма, среднее, максимум, последний)]."""
+        rows = [(name, n, total, total / n, peak, last) for name, (n, total, peak, last) in self.totals.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    # --- Экспорт ---
+    def to_jsonl(self):
+        lines = [json.dumps(entry, ensure_ascii=False) for entry in self.spans]
+        lines.extend(json.dumps({"counter": name, "value": value}, ensure_ascii=False)
+                     for name, value in self.counters.items())
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_prometheus(self, prefix="ahp"):
+        """Текстовый формат Prometheus: summary по интервалам (_count/_sum), максимум и счетчики."""
+        lines = [f"# HELP {prefix}_span_seconds Время этапов обработки запроса.",
+                 f"# TYPE {prefix}_span_seconds summary"]
+        for name, n, total, _, _, _ in self.summary():
+            lines.append(f'{prefix}_span_seconds_count{{span="{_label(name)}"}} {n}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{_label(name)}"}} {total:.9g}')
+        lines += [f"# HELP {prefix}_span_seconds_max Максимальное время этапа.",
+                  f"# TYPE {prefix}_span_seconds_max gauge"]
+        lines.extend(f'{prefix}_span_seconds_max{{span="{_label(name)}"}} {peak:.9g}'
+                     for name, _, _, _, peak, _ in self.summary())
+        lines += [f"# HELP {prefix}_events_total Счетчики событий.", f"# TYPE {prefix}_events_total counter"]
+        lines.extend(f'{prefix}_events_total{{name="{_label(name)}"}} {value:.9g}' for name, value in sorted(self.counters.items()))
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def from_jsonl(cls, lines, max_spans=MAX_SPANS):
+        """Recorder из строк JSONL (например, файла AHP_METRICS_JSONL) - для сводки и экспорта в Prometheus."""
+        recorder = cls(max_spans)
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "span" in entry:
+                recorder.record(entry["span"], entry["duration_s"], entry.get("attrs"))
+            else:
+                recorder.count(entry["counter"], entry["value"])
+        return recorder
+
+
+def _label(value):
+    return re.sub(r'(["\\\\])', r'\\\1', str(value)).replace("\n", "\\n")
+
+
+class JsonlSink:
+    """Дописывает каждую запись строкой JSON в файл (общий для процессов и сессий, запись под блокировкой)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+# --- 2. Интервалы и счетчики ---
+class _Span:
+    __slots__ = ("recorder", "name", "attrs", "start_time")
+
+    def __init__(self, recorder, name, attrs):
+        self.recorder = recorder
+        self.name = name
+        self.attrs = attrs
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.start_time is not None:
+            self.recorder.record(self.name, time.perf_counter() - self.start_time, self.attrs)
+            self.start_time = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+class _NullSpan:
+    """Пустой интервал: инструментация выключена или нет активного Recorder."""
+    __slots__ = ()
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def activate(recorder):
+    """Делает recorder текущим для этого потока (None - не записывать)."""
+    _current.set(recorder if ENABLED else None)
+
+
+def current():
+    return _current.get()
+
+
+def span(name, **attrs):
+    """Интервал для with-блока или пары start()/stop()."""
+    recorder = _current.get() if ENABLED else None
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name, attrs or None)
+
+
+def count(name, value=1):
+    if ENABLED:
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.count(name, value)
+
+
+def timed(name=None):
+    """Декоратор: время каждого вызова функции как интервал name (по умолчанию - модуль.функция)."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _current.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with _Span(recorder, label, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- 3. Запуск: сводка или Prometheus по файлу JSONL ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сводка замеров AHP из файла JSONL.")
+    parser.add_argument("jsonl", help="файл AHP_METRICS_JSONL")
+    parser.add_argument("--prometheus", action="store_true", help="вывести в текстовом формате Prometheus")
+    args = parser.parse_args()
+
+    with open(args.jsonl, encoding='utf-8') as f:
+        recorder = Recorder.from_jsonl(f)
+    if args.prometheus:
+        sys.stdout.write(recorder.to_prometheus())
+    else:
+        print(f"{'Этап':<40}{'вызовов':>9}{'сумма, мс':>12}{'среднее, мс':>13}{'макс, мс':>11}")
+        for name, n, total, mean, peak, _ in recorder.summary():
+            print(f"{name:<40}{n:>9}{total * 1000:>12.1f}{mean * 1000:>13.2f}{peak * 1000:>11.1f}")
+        for name, value in sorted(recorder.counters.items()):
+            print(f"  {name}: {value:g}")
@@ -0,0 +1,238 @@
+"""
+Метод аналитических сетей (ANP): сеть Цель -> Критерии <-> Альтернативы с взаимовлияниями.
+
+Пример:
+  python ahp_network.py ahp_project_session.json --method squaring
+
+Суперматрица собирается из тех же суждений, что и иерархия AHP (веса критериев, локальные веса
+альтернатив), плюс матрицы взаимовлияний сессии (ahp_engine.session_network): сравнения критериев
+относительно каждого критерия (внутренняя зависимость) и каждой альтернативы (обратная связь).
+Итоговые приоритеты - столбец цели предельной матрицы. Без взаимовлияний результат совпадает с AHP.
+Большие сети можно считать в scipy.sparse (импортируется лениво, только для разреженного режима).
+"""
+import argparse
+import json
+import numpy as np
+import ahp_engine
+import ahp_metrics
+
+# Доля кластера критериев в столбце критерия с внутренней зависимостью (остальное - альтернативам)
+DEPENDENCE_WEIGHT = 0.5
+LIMIT_METHODS = ("auto", "squaring", "stationary")
+# С какого числа узлов суперматрица по умолчанию собирается в scipy.sparse
+SPARSE_MIN_NODES = 500
+
+
+# --- 1. Взвешенная суперматрица ---
+def _is_sparse(matrix):
+    return hasattr(matrix, 'tocsc')
+
+
+def _identity_like(matrix):
+    if _is_sparse(matrix):
+        import scipy.sparse
+        return scipy.sparse.identity(matrix.shape[0], format='csc')
+    return np.eye(matrix.shape[0])
+
+
+def weighted_supermatrix(crit_w, alt_w, dependence=None, feedback=None, dependence_weight=DEPENDENCE_WEIGHT,
+                         sparse=False):
+    """
+    Столбцово-стохастическая суперматрица, узлы: [цель, критерии, альтернативы].
+    crit_w (n_c,) - веса критериев относительно цели, alt_w (n_c, n_a) - локальные веса альтернатив по критериям.
+    dependence (n_c, n_c): строка j - веса критериев по влиянию на критерий j (строка NaN - влияния нет);
+    столбец такого критерия делится между кластерами: dependence_weight - критериям, остальное - альтернативам.
+    feedback (n_a, n_c): строка a - веса критериев относительно альтернативы a; столбец альтернативы без обратной
+    связи (строка NaN) возвращается к критериям с весами crit_w, как из цели. Поэтому без обратной связи результат
+    совпадает с AHP, а частичная обратная связь не стягивает весь предельный вес на альтернативы без нее.
+    sparse=True - scipy.sparse в формате CSC.
+    """
+    crit_w = np.asarray(crit_w, dtype=float)
+    alt_w = np.asarray(alt_w, dtype=float).reshape(crit_w.size, -1)
+    n_c, n_a = alt_w.shape
+    n = 1 + n_c + n_a
+    crit_nodes, alt_nodes = 1 + np.arange(n_c), 1 + n_c + np.arange(n_a)
+    dependence = np.full((n_c, n_c), np.nan) if dependence is None else np.asarray(dependence, dtype=float)
+    feedback = np.full((n_a, n_c), np.nan) if feedback is None else np.asarray(feedback, dtype=float)
+    has_dep = ~np.all(np.isnan(dependence), axis=1)
+    feedback = np.where(np.all(np.isnan(feedback), axis=1)[:, np.newaxis], crit_w, feedback)
+    alt_share = np.where(has_dep, 1.0 - dependence_weight, 1.0)
+
+    # Тройки (строка, столбец, значение) по блокам - одинаково для плотной и разреженной матрицы
+    rows = [crit_nodes, np.tile(alt_nodes, n_c), np.tile(crit_nodes, int(has_dep.sum())), np.tile(crit_nodes, n_a)]
+    cols = [np.zeros(n_c, dtype=int), np.repeat(crit_nodes, n_a), np.repeat(crit_nodes[has_dep], n_c),
+            np.repeat(alt_nodes, n_c)]
+    values = [crit_w, (alt_w * alt_share[:, np.newaxis]).ravel(), dependence_weight * dependence[has_dep].ravel(),
+              feedback.ravel()]
+    rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    if sparse:
+        import scipy.sparse
+        return scipy.sparse.csc_array((values, (rows, cols)), shape=(n, n))
+    matrix = np.zeros((n, n))
+    np.add.at(matrix, (rows, cols), values)
+    return matrix
+
+
+# --- 2. Предельная матрица ---
+def _max_abs(matrix):
+    return float(abs(matrix).max()) if matrix.shape[0] else 0.0
+
+
+def _squared_limit(matrix, tol, max_squarings):
+    """W^(2^k) до сходимости max |P^2 - P| < tol; None, если предел не достигнут."""
+    power = matrix
+    for _ in range(max_squarings):
+        square = power @ power
+        if _max_abs(square - power) < tol:
+            return square
+        power = square
+    return None
+
+
+def limit_matrix(matrix, tol=1e-10, max_squarings=64):
+    """
+    Предельная матрица lim W^k повторным возведением в квадрат: k squarings дают W^(2^k),
+    поэтому сходимость достигается за десятки умножений, а не тысячи.
+    Если предела степеней нет (циклическая сеть, например критерии <-> альтернативы без внутренней
+    зависимости), возвращается предел Чезаро - он равен пределу "ленивой" цепи (I + W) / 2, у которой
+    тот же стационарный вектор, но нет циклов. Работает с плотными массивами и scipy.sparse.
+    """
+    limit = _squared_limit(matrix, tol, max_squarings)
+    if limit is not None and _max_abs(matrix @ limit - limit) < tol * 10:
+        return limit
+    limit = _squared_limit((matrix + _identity_like(matrix)) / 2, tol, max_squarings)
+    if limit is None:
+        raise ValueError(f"Предельная матрица не сошлась за {max_squarings} возведений в квадрат.")
+    return limit
+
+
+def stationary_vector(matrix, tol=1e-10):
+    """
+    Стационарный вектор x = W x, sum(x) = 1 одной линейной системой: последнее уравнение (W - I) x = 0
+    заменяется условием нормировки. Для сети с единственным замкнутым классом все столбцы предельной
+    матрицы равны x. Проверка: невязка |W x - x| < tol и x >= 0, иначе ValueError
+    (несколько поглощающих узлов или несвязные части - нужен limit_matrix).
+    """
+    n = matrix.shape[0]
+    rhs = np.zeros(n)
+    rhs[-1] = 1.0
+    unique = True
+    if _is_sparse(matrix):
+        import scipy.sparse
+        import scipy.sparse.csgraph
+        import scipy.sparse.linalg
+        # Замкнутый класс - компонента сильной связности, из которой нет ребер наружу
+        n_comp, labels = scipy.sparse.csgraph.connected_components(matrix.T, connection='strong')
+        edges = matrix.tocoo()
+        leaving = np.zeros(n_comp, dtype=bool)
+        leaving[labels[edges.col[labels[edges.row] != labels[edges.col]]]] = True
+        unique = np.count_nonzero(~leaving) == 1
+        system = scipy.sparse.vstack([(matrix - _identity_like(matrix))[:-1], scipy.sparse.csc_array(np.ones((1, n)))],
+                                      format='csc')
+        with np.errstate(all='ignore'):
+            x = scipy.sparse.linalg.spsolve(system, rhs) if unique else np.full(n, np.nan)
+    else:
+        system = matrix - np.eye(n)
+        system[-1] = 1.0
+        # Несколько замкнутых классов - вырожденная система (после округления может не давать LinAlgError)
+        unique = np.linalg.cond(system) < 1e12
+        x = np.linalg.solve(system, rhs) if unique else np.full(n, np.nan)
+    if not (unique and np.all(np.isfinite(x)) and np.all(x > -tol) and np.max(np.abs(matrix @ x - x)) < tol * 100):
+        raise ValueError("Стационарный вектор не единственен: в сети несколько замкнутых классов.")
+    return np.clip(x, 0.0, None)
+
+
+def limit_priorities(matrix, method="auto", tol=1e-10):
+    """
+    Предельные приоритеты всех узлов относительно цели (узел 0) - столбец цели предельной матрицы.
+    squaring - limit_matrix; stationary - стационарный вектор сети без цели (в цель ничего не входит,
+    поэтому ее предельный столбец совпадает с ним); auto - stationary, при неудаче squaring.
+    """
+    if method not in LIMIT_METHODS:
+        raise ValueError(f"Неизвестный метод предельной матрицы: {method}")
+    if method != "squaring":
+        try:
+            return np.concatenate([[0.0], stationary_vector(matrix[1:, 1:], tol)])
+        except ValueError:
+            if method == "stationary":
+                raise
+    column = limit_matrix(matrix, tol)[:, [0]]
+    return np.asarray(column.toarray() if _is_sparse(column) else column).ravel()
+
+
+# --- 3. Решение сети по суждениям ---
+def solve_network(criteria, alternatives, criteria_upper, alternatives_upper, network_upper,
+                  dependence_weight=DEPENDENCE_WEIGHT, precision=4, incomplete=False, method="auto", sparse=None):
+    """
+    Решает сеть ANP. network_upper (n_c + n_a, m_c) - как в ahp_engine.session_network (строки NaN - влияния нет).
+    Веса всех матриц считаются пакетно (одинаковые матрицы - один раз), затем строится суперматрица
+    и ее предельные приоритеты. Возвращает тот же кортеж, что и ahp_engine.solve_hierarchy:
+    веса альтернатив и критериев - предельные (нормированные внутри кластера). Без обратной связи предельный
+    вес критериев равен сумме всех путей из цели (I - D)^-1 w, где D - блок внутренней зависимости.
+    """
+    n_c, n_a = len(criteria), len(alternatives)
+    network_upper = np.asarray(network_upper, dtype=float).reshape(n_c + n_a, n_c * (n_c - 1) // 2)
+    present = ~np.all(np.isnan(network_upper), axis=1)
+    if not incomplete:
+        network_upper = np.where(np.isnan(network_upper), 1.0, network_upper)
+
+    crit_w, crit_cr, crit_inverse = ahp_engine.solve_unique(criteria_upper, n_c, incomplete)
+    alt_w, alt_cr, alt_inverse = ahp_engine.solve_unique(alternatives_upper, n_a, incomplete)
+    net_w, net_cr, net_inverse = ahp_engine.solve_unique(network_upper[present], n_c, incomplete)
+    crit_w, alt_w = crit_w[crit_inverse[0]], alt_w[alt_inverse].reshape(n_c, n_a)
+    relations = np.full((n_c + n_a, n_c), np.nan)
+    relations[present] = net_w[net_inverse].reshape(-1, n_c)
+
+    if sparse is None:
+        sparse = 1 + n_c + n_a >= SPARSE_MIN_NODES
+    supermatrix = weighted_supermatrix(crit_w, alt_w, relations[:n_c], relations[n_c:], dependence_weight, sparse)
+    limit = limit_priorities(supermatrix, method)
+    final = limit[1 + n_c:] / max(limit[1 + n_c:].sum(), 1e-300)
+    crit_total = limit[1:1 + n_c] / max(limit[1:1 + n_c].sum(), 1e-300)
+
+    final_weights = ahp_engine.sorted_weights(alternatives, final, precision)
+    criteria_weights = ahp_engine.sorted_weights(criteria, crit_total, precision)
+    cr_data = {ahp_engine.GOAL_CR_LABEL: round(float(crit_cr[crit_inverse[0]]), precision)}
+    for name, cr in zip(criteria, alt_cr[alt_inverse]):
+        cr_data[f"Матрица '{name}'"] = round(float(cr), precision)
+    for node, cr in zip([node for node, used in zip(criteria + alternatives, present) if used], net_cr[net_inverse]):
+        cr_data[ahp_engine.network_label(node)] = round(float(cr), precision)
+    rounded_alt_w = np.round(alt_w, precision)
+    profiles = {alt: [float(v) for v in rounded_alt_w[:, j]] for j, alt in enumerate(alternatives)}
+    return final_weights, criteria_weights, cr_data, profiles, criteria
+
+
+@ahp_metrics.timed("anp.solve_session")
+def solve_session(session_data, precision=4, method="auto", sparse=None):
+    """Решает сеть по словарю сессии любого формата (только без подкритериев)."""
+    incomplete = ahp_engine.is_reduced_session(session_data)
+    criteria, alternatives, criteria_upper, alternatives_upper = ahp_engine.session_arrays(
+        session_data, np.nan if incomplete else 1)
+    dependence_weight = session_data.get('anp_dependence_weight')
+    return solve_network(criteria, alternatives, criteria_upper, alternatives_upper,
+                         ahp_engine.session_network(session_data),
+                         DEPENDENCE_WEIGHT if dependence_weight is None else dependence_weight,
+                         precision, incomplete, method, sparse)
+
+
+# --- 4. Запуск из командной строки ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Решение сети ANP по файлу сессии (.json).")
+    parser.add_argument("session", help="файл сессии ahp_project_session.json")
+    parser.add_argument("--method", choices=LIMIT_METHODS, default="auto")
+    parser.add_argument("--sparse", action="store_true", help="суперматрица в scipy.sparse")
+    args = parser.parse_args()
+
+    with open(args.session, encoding='utf-8') as f:
+        session_data = json.load(f)
+    final_weights, criteria_weights, cr_data, _, _ = solve_session(session_data, method=args.method,
+                                                                   sparse=args.sparse or None)
+    print("\n--- ИТОГОВЫЙ РЕЙТИНГ АЛЬТЕРНАТИВ (ANP) ---")
+    for name, weight in final_weights.items():
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)")
+    print("\n--- Предельные веса критериев ---")
+    for name, weight in criteria_weights.items():
+        print(f"  {name}: {weight:.4f} ({(weight*100):.1f}%)")
+    print("\n--- Проверка согласованности (CR) ---")
+    for name, cr in cr_data.items():
+        print(f"  {name}: CR = {cr:.4f}")
@@ -0,0 +1,101 @@
+"""
+Расчет таблицы случайных индексов (RI) симуляцией Монте-Карло и запись ri_table.json.
+
+Пример:
+  python ahp_ri.py --max-n 100 --workers 8
+
+Для каждого n генерируются случайные матрицы по полной шкале Саати (17 значений), lambda_max
+считается пакетно (ahp_engine.lambda_max_moments). Выборка каждого n делится на блоки с независимыми
+потоками случайных чисел (SeedSequence.spawn), блоки считаются в пуле процессов, суммы складываются -
+результат не зависит от числа процессов.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ahp_engine
+
+RI_TABLE_VERSION = 1
+# Выборок на одну задачу пула
+TASK_SAMPLES = 10000
+
+
+def default_samples(n):
+    """Размер выборки по умолчанию: для больших n разброс lambda_max / (n - 1) мал, хватает меньшей выборки."""
+    if n <= 15:
+        return 100000
+    if n <= 40:
+        return 50000
+    return 20000
+
+
+def _moments_task(n, n_samples, seed):
+    return n, n_samples, ahp_engine.lambda_max_moments(n, n_samples, np.random.default_rng(seed))
+
+
+def simulate_table(sizes, samples=None, workers=None, seed=ahp_engine.RI_SEED):
+    """
+    RI для всех sizes: {n: (RI, стандартная ошибка, размер выборки)}.
+    samples - фиксированный размер выборки (по умолчанию default_samples(n)).
+    """
+    tasks = []
+    for n in sizes:
+        n_samples = samples or default_samples(n)
+        counts = [TASK_SAMPLES] * (n_samples // TASK_SAMPLES) + ([n_samples % TASK_SAMPLES] if n_samples % TASK_SAMPLES else [])
+        seeds = np.random.SeedSequence([seed, n]).spawn(len(counts))
+        tasks.extend((n, count, child) for count, child in zip(counts, seeds))
+    # Крупные n - первыми, чтобы пул не простаивал в конце
+    tasks.sort(key=lambda task: -task[0] ** 2 * task[1])
+    sums = {n: [0, 0.0, 0.0] for n in sizes}
+
+    def collect(results):
+        for n, count, (total, total_sq) in results:
+            sums[n][0] += count
+            sums[n][1] += total
+            sums[n][2] += total_sq
+
+    if workers == 1:
+        collect(_moments_task(*task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collect(pool.map(_moments_task, *zip(*tasks)))
+    table = {}
+    for n, (count, total, total_sq) in sums.items():
+        ri, stderr = ahp_engine.random_index_from_moments(n, total, total_sq, count)
+        table[n] = (ri, stderr, count)
+    return table
+
+
+def write_table(table, path=ahp_engine.RI_TABLE_PATH, seed=ahp_engine.RI_SEED):
+    data = {
+        "version": RI_TABLE_VERSION,
+        "scale": "saaty-17",
+        "seed": seed,
+        "ri": {str(n): round(float(ri), 5) for n, (ri, _, _) in sorted(table.items())},
+        "stderr": {str(n): round(float(se), 6) for n, (_, se, _) in sorted(table.items())},
+        "samples": {str(n): int(count) for n, (_, _, count) in sorted(table.items())},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+        f.write('\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симуляция таблицы случайных индексов RI и запись ri_table.json.")
+    parser.add_argument("--min-n", type=int, default=3)
+    parser.add_argument("--max-n", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=None, help="выборок на каждое n (по умолчанию зависит от n)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="число процессов (1 - без пула)")
+    parser.add_argument("--seed", type=int, default=ahp_engine.RI_SEED)
+    parser.add_argument("-o", "--output", default=ahp_engine.RI_TABLE_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = simulate_table(range(max(3, args.min_n), args.max_n + 1), args.samples, args.workers, args.seed)
+    write_table(table, args.output, args.seed)
+    for n, (ri, stderr, count) in sorted(table.items()):
+        print(f"n={n:3d}  RI={ri:.4f}  ±{stderr:.4f}  (выборок {count})")
+    print(f"Готово за {time.perf_counter() - start:.1f} с: {args.output}", file=sys.stderr)
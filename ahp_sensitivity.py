@@ -0,0 +1,196 @@
+import argparse
+import json
+import numpy as np
+import ahp_engine
+import ahp_group
+import ahp_metrics
+
+# Шкала Саати в порядке возрастания: шаг +-1 - это сдвиг на соседнее значение
+SAATY_SCALE = np.array([1/9, 1/7, 1/5, 1/3, 1, 3, 5, 7, 9])
+LOG_SAATY_SCALE = np.log(SAATY_SCALE)
+
+
+# --- 1. Возмущение суждений ---
+def perturb_judgments(values, n_samples, mode="step", sigma=0.3, rng=None):
+    """
+    Генерирует n_samples возмущенных наборов суждений из базового вектора values (m,).
+    mode="step"      - каждое суждение сдвигается на -1, 0 или +1 шаг шкалы Саати (равновероятно);
+                       промежуточные значения (например, после агрегации) сначала округляются до шкалы;
+    mode="lognormal" - суждение умножается на exp(N(0, sigma)) и обрезается до [1/9, 9].
+    Возвращает массив (n_samples, m).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    values = np.asarray(values, dtype=float)
+    if mode == "step":
+        positions = np.argmin(np.abs(np.log(values)[:, np.newaxis] - LOG_SAATY_SCALE), axis=1)
+        steps = rng.integers(-1, 2, size=(n_samples, values.size))
+        return SAATY_SCALE[np.clip(positions + steps, 0, SAATY_SCALE.size - 1)]
+    if mode == "lognormal":
+        noise = np.exp(rng.normal(0.0, sigma, size=(n_samples, values.size)))
+        return np.clip(values * noise, SAATY_SCALE[0], SAATY_SCALE[-1])
+    raise ValueError(f"Неизвестный режим возмущения: {mode}. Доступны: step, lognormal")
+
+
+def ranks_from_weights(weights):
+    """Места альтернатив (0 - лучшая) для каждой строки массива весов (S, n)."""
+    order = np.argsort(-weights, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    ranks[np.arange(weights.shape[0])[:, np.newaxis], order] = np.arange(weights.shape[1])
+    return ranks
+
+
+# --- 2. Монте-Карло анализ ---
+@ahp_metrics.timed("sensitivity.monte_carlo")
+def monte_carlo(session_data, n_samples=10000, mode="step", sigma=0.3, memory_budget_mb=256, seed=None,
+                method="eig", top_drivers=10):
+    """
+    Решает n_samples возмущенных иерархий пакетно - тензорами (S * n_crit, n_alt, n_alt),
+    разбитыми на блоки так, чтобы блок укладывался в memory_budget_mb.
+    Возвращает словарь:
+      alternatives       - имена альтернатив
+      baseline           - базовые итоговые веса (n_alt,)
+      rank_probabilities - (n_alt, n_alt): вероятность, что альтернатива i займет место r
+      winner_change_rate - доля выборок, где лидер отличается от базового
+      drivers            - [(ключ суждения, |корреляция| сдвига суждения со сменой лидера)], по убыванию
+    В сокращенном опросе возмущаются только заданные суждения, пропуски остаются пропусками, а веса
+    каждой выборки считаются LLSM - базовый рейтинг совпадает с результатом расчета.
+    """
+    rng = np.random.default_rng(seed)
+    criteria, children = ahp_engine.parse_tree(session_data['criteria_input'])
+    if children:
+        raise ValueError("Анализ Монте-Карло поддерживает только двухуровневую иерархию (критерии без подкритериев).")
+    alternatives = ahp_engine.parse_items(session_data['alternatives_input'])
+    keys = ahp_group.judgment_keys(criteria, alternatives)
+    incomplete = ahp_engine.is_reduced_session(session_data)
+    base_values = ahp_group.ballot_matrix([session_data], criteria, alternatives, np.nan if incomplete else 1.0)[0]
+    answered = np.isfinite(base_values)
+    n_crit, n_alt = len(criteria), len(alternatives)
+
+    crit_w, _, alt_w, _ = ahp_group.solve_individual(base_values[np.newaxis], n_crit, n_alt, method=method,
+                                                     incomplete=incomplete)
+    baseline = np.einsum('ec,eca->ea', crit_w, alt_w)[0]
+    base_winner = np.argmax(baseline)
+    base_log = np.log(base_values)
+
+    # Грубая оценка памяти на одну выборку: матрицы + рабочие массивы eig (комплексные векторы)
+    bytes_per_sample = 8 * 4 * (n_crit * n_crit + n_crit * n_alt * n_alt) + 8 * 2 * len(keys)
+    chunk = int(max(1, min(n_samples, memory_budget_mb * 2**20 // bytes_per_sample)))
+
+    rank_counts = np.zeros((n_alt, n_alt), dtype=np.int64)
+    # Потоковые суммы для корреляции сдвига каждого суждения со сменой лидера
+    sum_x, sum_xx, sum_xy = np.zeros(len(keys)), np.zeros(len(keys)), np.zeros(len(keys))
+    sum_y = 0.0
+    winner_changes = 0
+    done = 0
+    while done < n_samples:
+        size = min(chunk, n_samples - done)
+        samples = np.full((size, base_values.size), np.nan)
+        samples[:, answered] = perturb_judgments(base_values[answered], size, mode, sigma, rng)
+        crit_w, _, alt_w, _ = ahp_group.solve_individual(samples, n_crit, n_alt, chunk_size=size, method=method,
+                                                         incomplete=incomplete)
+        final = np.einsum('ec,eca->ea', crit_w, alt_w)
+        ranks = ranks_from_weights(final)
+        for r in range(n_alt):
+            rank_counts[:, r] += (ranks == r).sum(axis=0)
+        changed = (np.argmax(final, axis=1) != base_winner).astype(float)
+        shift = np.where(answered, np.log(samples) - base_log, 0.0)
+        sum_x += shift.sum(axis=0)
+        sum_xx += (shift * shift).sum(axis=0)
+        sum_xy += changed @ shift
+        sum_y += changed.sum()
+        winner_changes += int(changed.sum())
+        done += size
+
+    n = float(n_samples)
+    cov = n * sum_xy - sum_x * sum_y
+    var_x = n * sum_xx - sum_x ** 2
+    var_y = n * sum_y - sum_y ** 2  # y бинарный: sum(y^2) = sum(y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.where((var_x > 0) & (var_y > 0), np.abs(cov) / np.sqrt(var_x * var_y), 0.0)
+    order = np.argsort(-corr)[:top_drivers]
+    return {
+        "alternatives": alternatives,
+        "baseline": baseline,
+        "rank_probabilities": rank_counts / n,
+        "winner_change_rate": winner_changes / n,
+        "drivers": [(keys[i], float(corr[i])) for i in order if corr[i] > 0],
+    }
+
+
+# --- 3. Развертка веса одного критерия (без пересчета собственных векторов) ---
+def _sweep_terms(criteria_weights, local_weights):
+    """
+    Если вес критерия c равен t, а остальные масштабируются пропорционально,
+    итоговые веса линейны по t: F_c(t) = t * L_c + (1 - t) * R_c.
+    Возвращает L (n_crit, n_alt) и R (n_crit, n_alt).
+    """
+    w = np.asarray(criteria_weights, dtype=float)
+    L = np.asarray(local_weights, dtype=float)
+    rest = w @ L - w[:, np.newaxis] * L
+    others = (1.0 - w)[:, np.newaxis]
+    # Единственный критерий (вес 1): "остальных" нет, кривая постоянна
+    with np.errstate(invalid='ignore', divide='ignore'):
+        R = np.where(others > 0, rest / others, L)
+    return L, R
+
+
+def weight_sweep(criteria_weights, local_weights, n_points=101):
+    """
+    Кривые рейтинга для всех критериев сразу.
+    criteria_weights (n_crit,), local_weights (n_crit, n_alt) - локальные веса альтернатив по критериям.
+    Возвращает сетку t (n_points,) и кривые (n_crit, n_points, n_alt).
+    """
+    L, R = _sweep_terms(criteria_weights, local_weights)
+    grid = np.linspace(0.0, 1.0, n_points)
+    curves = grid[np.newaxis, :, np.newaxis] * L[:, np.newaxis, :] + (1.0 - grid)[np.newaxis, :, np.newaxis] * R[:, np.newaxis, :]
+    return grid, curves
+
+
+def crossover_points(criteria_weights, local_weights):
+    """
+    Точные веса критерия, при которых две альтернативы меняются местами.
+    Возвращает массивы индексов (критерий, альтернатива a, альтернатива b) и вес t в (0, 1).
+    """
+    L, R = _sweep_terms(criteria_weights, local_weights)
+    d0 = R[:, :, np.newaxis] - R[:, np.newaxis, :]  # разность весов a и b при t = 0
+    d1 = L[:, :, np.newaxis] - L[:, np.newaxis, :]  # ... и при t = 1
+    slope = d1 - d0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(slope != 0, -d0 / slope, np.nan)
+    n_alt = L.shape[1]
+    upper = np.triu(np.ones((n_alt, n_alt), dtype=bool), 1)
+    crit_idx, a_idx, b_idx = np.nonzero((t > 0) & (t < 1) & upper[np.newaxis])
+    return crit_idx, a_idx, b_idx, t[crit_idx, a_idx, b_idx]
+
+
+def sweep_from_results(criteria_w, profiles, criteria):
+    """Достает веса критериев и локальные веса альтернатив из кортежа calculate_ahp (без пересчета)."""
+    criteria_weights = np.array([criteria_w[name] for name in criteria])
+    alternatives = list(profiles)
+    local_weights = np.array([profiles[alt] for alt in alternatives]).T
+    return criteria_weights, local_weights, alternatives
+
+
+# --- 4. Запуск из командной строки ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Монте-Карло анализ устойчивости рейтинга AHP по файлу сессии (.json).")
+    parser.add_argument("session", help="файл сессии ahp_project_session.json")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--mode", choices=["step", "lognormal"], default="step")
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--memory-mb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.session, encoding='utf-8') as f:
+        session_data = json.load(f)
+    report = monte_carlo(session_data, args.samples, args.mode, args.sigma, args.memory_mb, args.seed)
+
+    print(f"--- Устойчивость рейтинга ({args.samples} выборок, режим '{args.mode}') ---")
+    for i, alt in enumerate(report["alternatives"]):
+        probs = ", ".join(f"{p:.1%}" for p in report["rank_probabilities"][i])
+        print(f"  {alt} (базовый вес {report['baseline'][i]:.4f}): места 1..n = [{probs}]")
+    print(f"Доля выборок со сменой лидера: {report['winner_change_rate']:.1%}")
+    print("Суждения, сильнее всего влияющие на смену лидера:")
+    for key, score in report["drivers"]:
+        print(f"  {key}: {score:.3f}")
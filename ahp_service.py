@@ -0,0 +1,319 @@
+"""
+HTTP/JSON сервис расчета AHP для других систем (отдельно от Streamlit, только стандартная библиотека).
+
+Пример:
+  python ahp_service.py --port 8765 --workers 4
+  curl -X POST --data-binary @ahp_project_session.json http://127.0.0.1:8765/solve
+  curl -X POST -H "Content-Type: text/plain" --data-binary @platform_choice.ahp "http://127.0.0.1:8765/solve?precision=6"
+
+POST /solve - тело: словарь сессии (JSON любой версии) или проект .ahp (текст; Content-Type не JSON).
+Ответ: final_weights, criteria_weights, cr, profiles, criteria, consistent (все CR <= 0.10), cached.
+GET /health - состояние, GET /metrics - замеры в текстовом формате Prometheus (ahp_metrics).
+
+Расчеты идут в пуле процессов. Одновременные запросы с двухуровневой четкой иерархией одного размера
+собираются в пачку (до --max-batch запросов или --batch-delay мс) и решаются одним пакетом матриц;
+деревья, ANP, нечеткий AHP и сокращенный опрос решаются по одному. Результаты кэшируются по ключу
+суждений (ahp_cache), одинаковые запросы "в полете" ждут один расчет.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import ahp_cache
+import ahp_engine
+import ahp_format
+import ahp_metrics
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH = 64
+BATCH_DELAY_S = 0.002
+CR_THRESHOLD = 0.1
+
+
+# --- 1. Расчет (выполняется в процессах пула) ---
+def batch_key(session_data):
+    """
+    (n_crit, n_alt), если сессию можно решать в пачке с другими того же размера (двухуровневая четкая
+    иерархия AHP с полным опросом), иначе None.
+    """
+    if session_data.get('model', 'ahp') != 'ahp' or ahp_engine.is_reduced_session(session_data):
+        return None
+    criteria, children = ahp_engine.parse_tree(session_data['criteria_input'])
+    n_alt = len(ahp_engine.parse_items(session_data['alternatives_input']))
+    if children or len(criteria) < 2 or n_alt < 2:
+        return None
+    return len(criteria), n_alt
+
+
+def solve_batch(sessions, precision=4):
+    """
+    Решает пачку сессий одного размера (см. batch_key): матрицы критериев всех сессий - один стек,
+    матрицы альтернатив - другой, каждый решается одним вызовом ahp_engine.solve_matrices.
+    Возвращает по каждой сессии кортеж результатов или строку с ошибкой разбора.
+    """
+    outcomes = [None] * len(sessions)
+    parsed = []
+    for i, session_data in enumerate(sessions):
+        try:
+            parsed.append((i, ahp_engine.session_arrays(session_data)))
+        except (KeyError, TypeError, ValueError) as e:
+            outcomes[i] = f"Ошибка разбора сессии: {e}"
+    if not parsed:
+        return outcomes
+    n_crit, n_alt = len(parsed[0][1][0]), len(parsed[0][1][1])
+    criteria_upper = np.stack([arrays[2] for _, arrays in parsed])
+    alternatives_upper = np.concatenate([arrays[3] for _, arrays in parsed])
+    crit_w, _, crit_cr = ahp_engine.solve_matrices(ahp_engine.build_reciprocal_matrices(criteria_upper, n_crit))
+    alt_w, _, alt_cr = ahp_engine.solve_matrices(ahp_engine.build_reciprocal_matrices(alternatives_upper, n_alt))
+    for b, (i, (criteria, alternatives, _, _)) in enumerate(parsed):
+        rows = slice(b * n_crit, (b + 1) * n_crit)
+        outcomes[i] = ahp_engine.synthesize(criteria, alternatives, crit_w[b], crit_cr[b], alt_w[rows], alt_cr[rows],
+                                            precision)
+    return outcomes
+
+
+def _warmup():
+    return os.getpid()
+
+
+# --- 2. Сервис: кэш, пачки, пул ---
+class ScoringService:
+    """
+    Принимает разобранные сессии и возвращает результаты расчета.
+    executor - пул для расчетов (процессы или потоки), cache - ahp_cache.ResultsCache.
+    """
+
+    def __init__(self, executor, cache=None, max_batch=MAX_BATCH, batch_delay=BATCH_DELAY_S, recorder=None):
+        self.executor = executor
+        self.cache = cache if cache is not None else ahp_cache.ResultsCache(maxsize=4096)
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.recorder = recorder if recorder is not None else ahp_metrics.Recorder()
+        self._pending = {}
+        self._inflight = {}
+
+    async def score(self, session_data, precision=4):
+        """(результаты, взяты ли из кэша). Ошибки разбора - ValueError."""
+        try:
+            key = ahp_cache.judgments_key(session_data, precision)
+            shape = batch_key(session_data)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Некорректная сессия: {e}") from e
+        results = self.cache.get(key)
+        if results is not None:
+            return results, True
+        # Тот же набор суждений уже считается - ждем его результат
+        if key in self._inflight:
+            ahp_metrics.count("service.dedup")
+            return await asyncio.shield(self._inflight[key]), True
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if shape is None:
+                with ahp_metrics.span("service.solve_single"):
+                    results = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, ahp_engine.solve_any_session, session_data, precision)
+            else:
+                results = await self._submit((shape, precision), session_data)
+            if isinstance(results, str):
+                raise ValueError(results)
+            if results[0] is not None:
+                self.cache.put(key, results)
+            future.set_result(results)
+            return results, False
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение передано ожидающим дубликатам; если их нет, не оставляем его "непрочитанным"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _submit(self, key, session_data):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((session_data, future))
+        if len(bucket) >= self.max_batch:
+            self._flush(key)
+        elif len(bucket) == 1:
+            loop.call_later(self.batch_delay, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        bucket = self._pending.pop(key, None)
+        if bucket:
+            asyncio.ensure_future(self._run_batch(key[1], bucket))
+
+    async def _run_batch(self, precision, bucket):
+        ahp_metrics.count("service.batches")
+        ahp_metrics.count("service.batched_requests", len(bucket))
+        try:
+            with ahp_metrics.span("service.solve_batch", size=len(bucket)):
+                outcomes = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, solve_batch, [session_data for session_data, _ in bucket], precision)
+        except Exception as e:
+            for _, future in bucket:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), outcome in zip(bucket, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+
+def parse_body(body, content_type=""):
+    """Словарь сессии из тела запроса: JSON сессии или текст проекта .ahp."""
+    text = body.decode('utf-8-sig')
+    if "json" in content_type or text.lstrip().startswith("{"):
+        session_data = json.loads(text)
+        if not isinstance(session_data, dict):
+            raise ValueError("Ожидается JSON-объект сессии")
+        return session_data
+    try:
+        return ahp_format.loads_ahp(text).to_session()
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Ошибка чтения проекта .ahp: {e}") from e
+
+
+def result_payload(results, cached):
+    final_weights, criteria_weights, cr_data, profiles, criteria = results
+    return {
+        "final_weights": final_weights,
+        "criteria_weights": criteria_weights,
+        "cr": cr_data,
+        "profiles": profiles,
+        "criteria": list(criteria),
+        "consistent": all(cr <= CR_THRESHOLD for cr in cr_data.values()),
+        "cached": cached,
+    }
+
+
+# --- 3. HTTP/1.1 поверх asyncio ---
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class HTTPServer:
+    """Минимальный HTTP/1.1 (keep-alive, Content-Length) для эндпоинтов сервиса."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle(self, method, target, headers, body):
+        """(статус, тело, Content-Type)."""
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok", "pending_batches": len(self.service._pending),
+                         "cache_size": len(self.service.cache._memory)}, "application/json"
+        if url.path == "/metrics":
+            return 200, self.service.recorder.to_prometheus(), "text/plain; version=0.0.4"
+        if url.path != "/solve":
+            return 404, {"error": f"Неизвестный путь: {url.path}"}, "application/json"
+        if method != "POST":
+            return 405, {"error": "Используйте POST"}, "application/json"
+        query = parse_qs(url.query)
+        try:
+            precision = int(query.get("precision", ["4"])[0])
+            session_data = parse_body(body, headers.get("content-type", ""))
+            results, cached = await self.service.score(session_data, precision)
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError) as e:
+            return 400, {"error": str(e)}, "application/json"
+        if results[0] is None:
+            return 400, {"error": "Расчет не удался"}, "application/json"
+        return 200, result_payload(results, cached), "application/json"
+
+    async def serve_connection(self, reader, writer):
+        ahp_metrics.activate(self.service.recorder)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if length > MAX_BODY_BYTES:
+                    status, payload, content_type = 413, {"error": "Слишком большое тело запроса"}, "application/json"
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    with ahp_metrics.span("service.request"):
+                        try:
+                            status, payload, content_type = await self.handle(method, target, headers, body)
+                        except Exception as e:
+                            status, payload, content_type = 500, {"error": str(e)}, "application/json"
+                    ahp_metrics.count(f"service.status_{status}")
+                data = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode('utf-8')
+                writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+                              f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                              ).encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=None, max_batch=MAX_BATCH, batch_delay=BATCH_DELAY_S,
+                cache_dir=None, ready=None):
+    """
+    Запускает сервис и работает до отмены. workers=0 - расчеты в одном потоке, без пула процессов.
+    ready - asyncio.Event, который выставляется, когда порт открыт.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    executor = ThreadPoolExecutor(max_workers=1) if workers == 0 else ProcessPoolExecutor(max_workers=workers)
+    recorder = ahp_metrics.Recorder()
+    service = ScoringService(executor, ahp_cache.ResultsCache(maxsize=4096, cache_dir=cache_dir), max_batch,
+                             batch_delay, recorder)
+    loop = asyncio.get_running_loop()
+    # Процессы пула стартуют заранее, а не на первых запросах
+    await asyncio.gather(*(loop.run_in_executor(executor, _warmup) for _ in range(max(workers, 1))))
+    server = await asyncio.start_server(HTTPServer(service).serve_connection, host, port)
+    if ready is not None:
+        ready.set()
+    print(f"AHP-сервис: http://{host}:{port} (процессов: {workers or 'нет'}, пачка до {max_batch} / "
+          f"{batch_delay * 1000:.1f} мс)", file=sys.stderr)
+    # SIGTERM (например, от ahp_loadtest --start) завершает сервис так же, как Ctrl+C, вместе с процессами пула
+    serving = asyncio.current_task()
+    if sys.platform != "win32":
+        loop.add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# --- 4. Запуск ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON сервис расчета AHP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов пула (0 - без пула)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="запросов в одной пачке")
+    parser.add_argument("--batch-delay", type=float, default=BATCH_DELAY_S * 1000, help="ожидание пачки, мс")
+    parser.add_argument("--cache-dir", default=os.environ.get("AHP_CACHE_DIR"), help="общий дисковый кэш результатов")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch, args.batch_delay / 1000, args.cache_dir))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,352 @@
+import itertools
+import numpy as np
+import ahp_engine
+import ahp_metrics
+
+
+def _as_judgment(value):
+    """Значение суждения из старого JSON: некорректные и неположительные оценки считаются незаданными."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+        return np.nan
+    return value
+
+
+# --- 1. Хранилище суждений: индексы имен + верхние треугольники float32 ---
+class JudgmentStore:
+    """
+    Суждения проекта без строковых ключей на каждую пару:
+    criteria_upper (m_c,) - верхний треугольник матрицы критериев,
+    subcriteria_upper - верхние треугольники матриц подкритериев внутренних узлов подряд (порядок ahp_engine.tree_order),
+    alternatives_upper (n_leaves, m_a) - верхние треугольники матриц альтернатив по листьям дерева критериев
+    (без подкритериев листья - сами критерии).
+    network_upper (n_crit + n_alt, m_c) - взаимовлияния сети ANP (только без подкритериев): сравнения критериев
+    относительно каждого критерия, затем каждой альтернативы; префикс матрицы - 'anp:{узел}'.
+    fuzzy_bounds (2, число суждений) - нижние и верхние границы нечетких суждений (ahp_fuzzy) в порядке flat_values();
+    модальное значение - само суждение.
+    Порядок пар - itertools.combinations (совпадает с np.triu_indices), NaN - суждение не задано.
+    """
+    CRITERIA_KEY = "crit"
+
+    def __init__(self, criteria, alternatives, criteria_upper=None, alternatives_upper=None, elicitation_mode="full",
+                 children=None, subcriteria_upper=None, network_upper=None):
+        self.criteria = list(criteria)
+        self.alternatives = list(alternatives)
+        self.children = {node: list(kids) for node, kids in (children or {}).items() if kids}
+        self.elicitation_mode = elicitation_mode
+        # "ahp" - иерархия, "anp" - сеть с взаимовлияниями (ahp_network), "fuzzy" - нечеткий AHP (ahp_fuzzy)
+        self.model = "ahp"
+        self.dependence_weight = None
+        self.fuzzy_method = None
+        _, self.internal, self.leaves = ahp_engine.tree_order(self.criteria, self.children)
+        n_crit, n_alt = len(self.criteria), len(self.alternatives)
+        # Позиция узла среди братьев: имена в дереве уникальны, поэтому одного словаря хватает на все уровни
+        self._crit_index = {name: i for i, name in enumerate(self.criteria)}
+        for kids in self.children.values():
+            self._crit_index.update((name, i) for i, name in enumerate(kids))
+        self._alt_index = {name: i for i, name in enumerate(self.alternatives)}
+        network_nodes = [] if self.children else self.criteria + self.alternatives
+        self._network_index = {ahp_engine.NETWORK_PREFIX + name: i for i, name in enumerate(network_nodes)}
+        self._leaf_index = {name: i for i, name in enumerate(self.leaves)}
+        self._sub_slices, offset = {}, 0
+        for node in self.internal:
+            n = len(self.children[node])
+            self._sub_slices[node] = slice(offset, offset + n * (n - 1) // 2)
+            offset += n * (n - 1) // 2
+        self._pairs = {}
+        m_crit, m_alt = n_crit * (n_crit - 1) // 2, n_alt * (n_alt - 1) // 2
+        self.criteria_upper = np.full(m_crit, np.nan, dtype=np.float32)
+        self.subcriteria_upper = np.full(offset, np.nan, dtype=np.float32)
+        self.alternatives_upper = np.full((len(self.leaves), m_alt), np.nan, dtype=np.float32)
+        self.network_upper = np.full((len(network_nodes), m_crit), np.nan, dtype=np.float32)
+        self.fuzzy_bounds = np.full((2, m_crit + offset + len(self.leaves) * m_alt), np.nan, dtype=np.float32)
+        if criteria_upper is not None:
+            self.criteria_upper[:] = np.asarray(criteria_upper, dtype=float).reshape(m_crit)
+        if subcriteria_upper is not None:
+            self.subcriteria_upper[:] = np.asarray(subcriteria_upper, dtype=float).reshape(offset)
+        if alternatives_upper is not None:
+            self.alternatives_upper[:] = np.asarray(alternatives_upper, dtype=float).reshape(len(self.leaves), m_alt)
+        if network_upper is not None:
+            self.network_upper[:] = np.asarray(network_upper, dtype=float).reshape(self.network_upper.shape)
+
+    @staticmethod
+    def _pair_index(n):
+        """Номер пары (i, j), i < j, в верхнем треугольнике."""
+        rows, cols = np.triu_indices(n, 1)
+        return {(int(i), int(j)): k for k, (i, j) in enumerate(zip(rows, cols))}
+
+    @property
+    def criteria_input(self):
+        return ahp_engine.format_tree(self.criteria, self.children)
+
+    @property
+    def alternatives_input(self):
+        return "\n".join(self.alternatives)
+
+    def items(self, key_prefix):
+        """Элементы, которые сравниваются в матрице key_prefix ('crit', узел с подкритериями, лист или 'anp:{узел}')."""
+        if key_prefix == self.CRITERIA_KEY or key_prefix in self._network_index:
+            return self.criteria
+        if key_prefix in self.children:
+            return self.children[key_prefix]
+        return self.alternatives
+
+    def upper(self, key_prefix):
+        """Верхний треугольник одной матрицы (вид, не копия)."""
+        if key_prefix == self.CRITERIA_KEY:
+            return self.criteria_upper
+        if key_prefix in self._sub_slices:
+            return self.subcriteria_upper[self._sub_slices[key_prefix]]
+        if key_prefix in self._network_index:
+            return self.network_upper[self._network_index[key_prefix]]
+        return self.alternatives_upper[self._leaf_index[key_prefix]]
+
+    def bounds(self, key_prefix):
+        """Нижние и верхние границы нечетких суждений одной матрицы иерархии (2, m) - вид, не копия."""
+        m_crit, m_sub, m_alt = self.criteria_upper.size, self.subcriteria_upper.size, self.alternatives_upper.shape[1]
+        if key_prefix == self.CRITERIA_KEY:
+            return self.fuzzy_bounds[:, :m_crit]
+        if key_prefix in self._sub_slices:
+            part = self._sub_slices[key_prefix]
+            return self.fuzzy_bounds[:, m_crit + part.start:m_crit + part.stop]
+        start = m_crit + m_sub + self._leaf_index[key_prefix] * m_alt
+        return self.fuzzy_bounds[:, start:start + m_alt]
+
+    def _locate(self, key_prefix, a, b):
+        """(массив, номер пары, обращена ли пара) для суждения 'a против b' в матрице key_prefix."""
+        items = self.items(key_prefix)
+        index = self._alt_index if items is self.alternatives else self._crit_index
+        n = len(items)
+        if n not in self._pairs:
+            self._pairs[n] = self._pair_index(n)
+        i, j = index[a], index[b]
+        if i > j:
+            return self.upper(key_prefix), self._pairs[n][(j, i)], True
+        return self.upper(key_prefix), self._pairs[n][(i, j)], False
+
+    def get(self, key_prefix, a, b, default=None):
+        array, k, flipped = self._locate(key_prefix, a, b)
+        value = float(ahp_engine.exact_judgments(array[k]))
+        if np.isnan(value):
+            return default
+        return 1.0 / value if flipped else value
+
+    def set(self, key_prefix, a, b, value):
+        """Записывает суждение (None - удалить). Возвращает True, если значение изменилось."""
+        array, k, flipped = self._locate(key_prefix, a, b)
+        new = np.nan if value is None else (1.0 / value if flipped else value)
+        old = array[k]
+        array[k] = new
+        changed = not (old == array[k] or (np.isnan(old) and np.isnan(array[k])))
+        # Новое четкое значение заменяет нечеткое суждение целиком
+        if changed and key_prefix not in self._network_index:
+            self.bounds(key_prefix)[:, k] = np.nan
+        return changed
+
+    def set_upper(self, key_prefix, values):
+        upper, values = self.upper(key_prefix), np.asarray(values, dtype=float)
+        if key_prefix not in self._network_index:
+            new = values.astype(np.float32)
+            self.bounds(key_prefix)[:, ~((upper == new) | (np.isnan(upper) & np.isnan(new)))] = np.nan
+        upper[:] = values
+
+    def get_bounds(self, key_prefix, a, b):
+        """Границы (l, u) нечеткого суждения 'a против b' или None, если суждение четкое."""
+        _, k, flipped = self._locate(key_prefix, a, b)
+        low, high = ahp_engine.exact_judgments(self.bounds(key_prefix)[:, k])
+        if np.isnan(low) or np.isnan(high):
+            return None
+        return (1.0 / high, 1.0 / low) if flipped else (low, high)
+
+    def set_bounds(self, key_prefix, a, b, low=None, high=None):
+        """Записывает границы нечеткого суждения (None - суждение снова четкое). Модальное значение задается set()."""
+        _, k, flipped = self._locate(key_prefix, a, b)
+        if low is None or high is None:
+            values = (np.nan, np.nan)
+        else:
+            values = (1.0 / high, 1.0 / low) if flipped else (low, high)
+        self.bounds(key_prefix)[:, k] = values
+
+    def fuzzy_values(self):
+        """Нижние, модальные и верхние значения всех суждений (3, число суждений) в порядке flat_values(); у четких l = m = u."""
+        values = self.flat_values()
+        bounds = ahp_engine.exact_judgments(self.fuzzy_bounds)
+        bounds = np.where(np.isnan(bounds), values, bounds)
+        return np.stack([bounds[0], values, bounds[1]])
+
+    def is_fuzzy(self):
+        """Есть ли в проекте нечеткие суждения."""
+        return bool(np.any(~np.isnan(self.fuzzy_bounds)))
+
+    def flat_values(self):
+        """Все суждения одним вектором float64 в порядке ahp_group.judgment_keys()."""
+        return ahp_engine.exact_judgments(np.concatenate([self.criteria_upper, self.subcriteria_upper,
+                                                          self.alternatives_upper.ravel()]))
+
+    @classmethod
+    def from_flat(cls, criteria, alternatives, values, children=None, elicitation_mode="full", bounds=None):
+        """Обратная операция к flat_values(); bounds (2, число суждений) - границы нечетких суждений."""
+        store = cls(criteria, alternatives, elicitation_mode=elicitation_mode, children=children)
+        m_crit, m_sub = store.criteria_upper.size, store.subcriteria_upper.size
+        store.criteria_upper[:] = values[:m_crit]
+        store.subcriteria_upper[:] = values[m_crit:m_crit + m_sub]
+        store.alternatives_upper[:] = np.reshape(values[m_crit + m_sub:], store.alternatives_upper.shape)
+        if bounds is not None:
+            store.fuzzy_bounds[:] = bounds
+        return store
+
+    def reindex(self, criteria, alternatives, children=None):
+        """
+        Новое хранилище для измененного дерева критериев/списка альтернатив.
+        Суждения переносятся по именам: пары, оба элемента которых сохранились под тем же родителем,
+        остаются (с учетом нового порядка); матрица альтернатив листа переносится, если узел остался листом.
+        """
+        store = JudgmentStore(criteria, alternatives, elicitation_mode=self.elicitation_mode, children=children)
+        store.model, store.dependence_weight, store.fuzzy_method = self.model, self.dependence_weight, self.fuzzy_method
+        if store.criteria == self.criteria and store.children == self.children and store.alternatives == self.alternatives:
+            store.criteria_upper[:] = self.criteria_upper
+            store.subcriteria_upper[:] = self.subcriteria_upper
+            store.alternatives_upper[:] = self.alternatives_upper
+            store.network_upper[:] = self.network_upper
+            store.fuzzy_bounds[:] = self.fuzzy_bounds
+            return store
+
+        def carry(node, sources, n_old):
+            store.upper(node)[:] = self._remap(self.upper(node), sources, n_old)
+            # При смене порядка пары границы меняются местами: [l, u] -> [1/u, 1/l]
+            low, high = self.bounds(node)
+            store.bounds(node)[:] = self._remap(low, sources, n_old, high), self._remap(high, sources, n_old, low)
+
+        for node in [store.CRITERIA_KEY] + store.internal:
+            if node == store.CRITERIA_KEY or node in self.children:
+                old_items = set(self.items(node))
+                carry(node, [self._crit_index[name] if name in old_items else None for name in store.items(node)],
+                      len(old_items))
+        alt_src = [self._alt_index.get(name) for name in store.alternatives]
+        for leaf in store.leaves:
+            if leaf in self._leaf_index:
+                carry(leaf, alt_src, len(self.alternatives))
+        crit_src = [self._crit_index[name] if name in self.criteria else None for name in store.criteria]
+        for key in store.network_keys():
+            if key in self._network_index:
+                store.upper(key)[:] = self._remap(self.upper(key), crit_src, len(self.criteria))
+        return store
+
+    @staticmethod
+    def _remap(upper, sources, n_old, reciprocal=None):
+        """
+        Переставляет верхний треугольник под новый порядок элементов (sources[i] - старый индекс или None).
+        reciprocal - значения, обратные к которым попадают в нижний треугольник (по умолчанию сам upper).
+        """
+        full = np.full((n_old, n_old), np.nan)
+        rows, cols = np.triu_indices(n_old, 1)
+        full[rows, cols] = upper
+        full[cols, rows] = 1.0 / (upper if reciprocal is None else reciprocal)
+        src = np.array([-1 if s is None else s for s in sources], dtype=int)
+        i, j = np.triu_indices(len(sources), 1)
+        result = np.full(i.size, np.nan, dtype=np.float32)
+        kept = (src[i] >= 0) & (src[j] >= 0)
+        result[kept] = full[src[i][kept], src[j][kept]]
+        return result
+
+    def matrix_keys(self):
+        """Префиксы всех матриц в порядке flat_values(): 'crit', узлы с подкритериями, листья."""
+        return [self.CRITERIA_KEY] + self.internal + self.leaves
+
+    def network_keys(self):
+        """Префиксы матриц взаимовлияний ANP: 'anp:{критерий}', затем 'anp:{альтернатива}'."""
+        return list(self._network_index)
+
+    # --- 2. Сериализация ---
+    def to_dict(self):
+        """Компактный словарь сессии (версия 2), который понимают все модули расчета."""
+        data = {
+            'format': ahp_engine.SESSION_FORMAT,
+            'version': ahp_engine.SESSION_VERSION,
+            'criteria_input': self.criteria_input,
+            'alternatives_input': self.alternatives_input,
+            'elicitation_mode': self.elicitation_mode,
+            'criteria_upper': ahp_engine.encode_array(self.criteria_upper),
+            'alternatives_upper': ahp_engine.encode_array(self.alternatives_upper),
+        }
+        # Двухуровневые сессии без сети остаются читаемыми для прежних версий
+        if self.children:
+            data['subcriteria_upper'] = ahp_engine.encode_array(self.subcriteria_upper)
+        if not np.all(np.isnan(self.network_upper)):
+            data['network_upper'] = ahp_engine.encode_array(self.network_upper)
+        if self.is_fuzzy():
+            data['fuzzy_bounds'] = ahp_engine.encode_array(self.fuzzy_bounds)
+        data.update(self._model_fields())
+        return data
+
+    def _model_fields(self):
+        fields = {}
+        if self.model != "ahp":
+            fields['model'] = self.model
+        if self.dependence_weight is not None:
+            fields['anp_dependence_weight'] = float(self.dependence_weight)
+        if self.fuzzy_method is not None:
+            fields['fuzzy_method'] = self.fuzzy_method
+        return fields
+
+    def _read_model_fields(self, data):
+        self.model = data.get('model', 'ahp')
+        self.dependence_weight = data.get('anp_dependence_weight')
+        self.fuzzy_method = data.get('fuzzy_method')
+        self.fuzzy_bounds[:] = ahp_engine.session_fuzzy_bounds(data)
+        return self
+
+    @classmethod
+    def from_dict(cls, data):
+        """Из компактного словаря версии 2."""
+        criteria, children, alternatives, criteria_upper, subcriteria_upper, alternatives_upper = \
+            ahp_engine.session_hierarchy(data, np.nan)
+        network_upper = None if children else ahp_engine.session_network(data)
+        store = cls(criteria, alternatives, criteria_upper, alternatives_upper, data.get('elicitation_mode', 'full'),
+                    children, subcriteria_upper, network_upper)
+        return store._read_model_fields(data)
+
+    @classmethod
+    def from_legacy(cls, data):
+        """
+        Миграция старого JSON с ключами 'crit_A_B' / '{узел}_A_B'.
+        Ключи собираются из известных имен, а не разбором строки по '_',
+        поэтому имена с подчеркиваниями переносятся корректно.
+        """
+        criteria, children = ahp_engine.parse_tree(data['criteria_input'])
+        store = cls(criteria, ahp_engine.parse_items(data['alternatives_input']),
+                    elicitation_mode=data.get('elicitation_mode', 'full'), children=children)
+        for key in store.matrix_keys() + store.network_keys():
+            store.set_upper(key, [_as_judgment(data.get(f"{key}_{a}_{b}"))
+                                  for a, b in itertools.combinations(store.items(key), 2)])
+        return store._read_model_fields(data)
+
+    def to_legacy(self):
+        """Старый формат с ключом на каждую заданную пару (для внешних инструментов)."""
+        data = {}
+        for key in self.matrix_keys() + self.network_keys():
+            upper = self.upper(key)
+            for k, (a, b) in enumerate(itertools.combinations(self.items(key), 2)):
+                if not np.isnan(upper[k]):
+                    data[f"{key}_{a}_{b}"] = float(upper[k])
+        for key in self.matrix_keys():
+            for a, b in itertools.combinations(self.items(key), 2):
+                bounds = self.get_bounds(key, a, b)
+                if bounds is not None:
+                    data[f"{ahp_engine.FUZZY_PREFIX}{key}_{a}_{b}"] = [float(bounds[0]), float(bounds[1])]
+        data['criteria_input'] = self.criteria_input
+        data['alternatives_input'] = self.alternatives_input
+        if self.elicitation_mode != 'full':
+            data['elicitation_mode'] = self.elicitation_mode
+        data.update(self._model_fields())
+        return data
+
+    def solve(self, precision=4):
+        return ahp_engine.solve_any_session(self.to_dict(), precision=precision)
+
+
+@ahp_metrics.timed("io.load_session")
+def load_session(data):
+    """Хранилище из словаря сессии любой версии (компактной или старой с ключами на пары)."""
+    if ahp_engine.is_compact_session(data):
+        return JudgmentStore.from_dict(data)
+    return JudgmentStore.from_legacy(data)
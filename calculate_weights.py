@@ -1,46 +1,60 @@
 import numpy as np
+import ahp_engine
 
-def calculate_ahp_matrix(matrix):
+def calculate_ahp_matrix(matrix, method="eig", tol=1e-10, max_iter=1000, x0=None):
     """
-    Рассчитывает веса (главный собственный вектор) и 
+    Рассчитывает веса (главный собственный вектор) и
     индекс согласованности для матрицы парных сравнений.
+
+    method:
+      "eig"       - полное разложение np.linalg.eig, O(n^3)
+      "power"     - степенной метод с точностью tol; x0 - начальный вектор
+                    (например, веса прошлого расчета, если изменилась одна оценка)
+      "geometric" - среднее геометрическое строк, O(n^2), приближение
     """
-    
+
     # 1. Преобразуем матрицу в numpy array
-    A = np.array(matrix)
+    A = np.array(matrix, dtype=float)
     n = A.shape[0]
 
-    # 2. Расчет собственных значений и векторов
-    eigenvalues, eigenvectors = np.linalg.eig(A)
-
-    # 3. Находим максимальное собственное значение (lambda_max)
-    lambda_max = np.max(eigenvalues)
-    
-    # 4. Находим главный собственный вектор (соответствует lambda_max)
-    #    и нормализуем его, чтобы получить веса
-    index = np.argmax(eigenvalues)
-    principal_eigenvector = eigenvectors[:, index]
-    
-    # Нормализация (сумма весов должна быть = 1)
-    weights = principal_eigenvector / np.sum(principal_eigenvector)
-    
-    # Отбрасываем мнимую часть (она возникает из-за неточностей вычислений)
-    weights = np.real(weights)
-    lambda_max = np.real(lambda_max)
+    if method == "eig":
+        # 2. Расчет собственных значений и векторов
+        eigenvalues, eigenvectors = np.linalg.eig(A)
+
+        # 3. Находим максимальное собственное значение (lambda_max)
+        #    (сравниваем по вещественной части, мнимая - погрешность вычислений)
+        index = np.argmax(np.real(eigenvalues))
+        lambda_max = eigenvalues[index]
+
+        # 4. Находим главный собственный вектор (соответствует lambda_max)
+        #    и нормализуем его, чтобы получить веса
+        principal_eigenvector = eigenvectors[:, index]
+
+        # Нормализация (сумма весов должна быть = 1)
+        weights = principal_eigenvector / np.sum(principal_eigenvector)
+
+        # Отбрасываем мнимую часть (она возникает из-за неточностей вычислений)
+        weights = np.real(weights)
+        lambda_max = np.real(lambda_max)
+    elif method == "power":
+        # 2-4. Степенной метод: сразу вещественный вектор, без комплексного разложения
+        weights, lambda_max, _ = ahp_engine.batch_power_iteration(A[np.newaxis], tol=tol, max_iter=max_iter, x0=x0)
+        weights, lambda_max = weights[0], lambda_max[0]
+    elif method == "geometric":
+        # 2-4. Среднее геометрическое строк
+        weights, lambda_max = ahp_engine.batch_geometric_mean(A[np.newaxis])
+        weights, lambda_max = weights[0], lambda_max[0]
+    else:
+        raise ValueError(f"Неизвестный метод: {method}. Доступны: {', '.join(ahp_engine.SOLVER_METHODS)}")
 
     # 5. Расчет Индекса Согласованности (CI)
     CI = (lambda_max - n) / (n - 1)
 
     # 6. Расчет Отношения Согласованности (CR)
-    #    Используем таблицу Случайных Индексов (RI) Саати
-    #    RI для n = 1, 2, 3, 4, 5, 6...
-    RI_table = {
-        1: 0.00, 2: 0.00, 3: 0.58, 4: 0.90, 5: 1.12,
-        6: 1.24, 7: 1.32, 8: 1.41, 9: 1.45, 10: 1.49
-    }
-    
-    RI = RI_table.get(n, 1.49) # Берем 1.49 для n > 10
-    
+    #    RI берется из таблицы, рассчитанной симуляцией для любого n (ahp_engine.random_index),
+    #    а не из таблицы Саати до n = 10
+    RI = ahp_engine.random_index(n)
+
     if RI == 0:
         CR = 0 # Для n=1, 2 согласованность всегда идеальна
     else:
@@ -48,32 +62,69 @@ def calculate_ahp_matrix(matrix):
 
     return weights, CI, CR
 
+def calculate_gci(matrix, method="geometric"):
+    """
+    Геометрический индекс согласованности (GCI) и его порог для матрицы.
+    Для весов по среднему геометрическому это естественная замена CR.
+    """
+    A = np.array(matrix, dtype=float)
+    weights = None if method == "geometric" else calculate_ahp_matrix(A, method=method)[0][np.newaxis]
+    GCI = float(ahp_engine.geometric_consistency_index(A[np.newaxis], weights)[0])
+    return GCI, ahp_engine.gci_threshold(A.shape[0])
+
+def compare_methods(matrix, tol=1e-10):
+    """
+    Отчет о точности быстрых методов относительно "eig":
+    максимальное отклонение весов, отклонение CR и совпадение ранжирования.
+    """
+    ref_weights, _, ref_CR = calculate_ahp_matrix(matrix, method="eig")
+    report = {}
+    for method in ("power", "geometric"):
+        weights, _, CR = calculate_ahp_matrix(matrix, method=method, tol=tol)
+        report[method] = {
+            "max_weight_error": float(np.max(np.abs(weights - ref_weights))),
+            "cr_error": float(abs(CR - ref_CR)),
+            "same_ranking": bool(np.array_equal(np.argsort(-weights), np.argsort(-ref_weights))),
+        }
+    return report
+
 # --- Запуск анализа ---
 
-# Матрица парных сравнений КРИТЕРИЕВ (Шаг 2.1)
-# (Удобство, Функционал, Стоимость, Поддержка)
-criteria_matrix = [
-    [1, 1/2, 3, 2],
-    [2, 1, 5, 3],
-    [1/3, 1/5, 1, 1/2],
-    [1/2, 1/3, 2, 1]
-]
-
-print("--- Анализ матрицы КРИТЕРИЕВ на Python (numpy) ---")
-weights, CI, CR = calculate_ahp_matrix(criteria_matrix)
-
-print(f"Размер матрицы (n): {len(criteria_matrix)}")
-print(f"Веса критериев:")
-print(f"  Удобство:   {weights[0]:.4f} ({(weights[0]*100):.1f}%)")
-print(f"  Функционал: {weights[1]:.4f} ({(weights[1]*100):.1f}%)")
-print(f"  Стоимость:  {weights[2]:.4f} ({(weights[2]*100):.1f}%)")
-print(f"  Поддержка:  {weights[3]:.4f} ({(weights[3]*100):.1f}%)")
-print("-" * 20)
-print(f"Индекс Согласованности (CI): {CI:.4f}")
-print(f"Отношение Согласованности (CR): {CR:.4f}")
-
-# Проверка согласованности
-if CR < 0.10:
-    print("-> Согласованность приемлемая (CR < 10%).")
-else:
-    print("-> Согласованность НИЗКАЯ (CR >= 10%). Экспертам нужно пересмотреть оценки.")
\ No newline at end of file
+if __name__ == "__main__":
+    # Матрица парных сравнений КРИТЕРИЕВ (Шаг 2.1)
+    # (Удобство, Функционал, Стоимость, Поддержка)
+    criteria_matrix = [
+        [1, 1/2, 3, 2],
+        [2, 1, 5, 3],
+        [1/3, 1/5, 1, 1/2],
+        [1/2, 1/3, 2, 1]
+    ]
+
+    print("--- Анализ матрицы КРИТЕРИЕВ на Python (numpy) ---")
+    weights, CI, CR = calculate_ahp_matrix(criteria_matrix)
+
+    print(f"Размер матрицы (n): {len(criteria_matrix)}")
+    print(f"Веса критериев:")
+    print(f"  Удобство:   {weights[0]:.4f} ({(weights[0]*100):.1f}%)")
+    print(f"  Функционал: {weights[1]:.4f} ({(weights[1]*100):.1f}%)")
+    print(f"  Стоимость:  {weights[2]:.4f} ({(weights[2]*100):.1f}%)")
+    print(f"  Поддержка:  {weights[3]:.4f} ({(weights[3]*100):.1f}%)")
+    print("-" * 20)
+    print(f"Индекс Согласованности (CI): {CI:.4f}")
+    print(f"Отношение Согласованности (CR): {CR:.4f}")
+
+    # Проверка согласованности
+    if CR < 0.10:
+        print("-> Согласованность приемлемая (CR < 10%).")
+    else:
+        print("-> Согласованность НИЗКАЯ (CR >= 10%). Экспертам нужно пересмотреть оценки.")
+
+    # Для весов по среднему геометрическому - GCI со своим порогом
+    GCI, GCI_limit = calculate_gci(criteria_matrix)
+    print(f"Геометрический индекс согласованности (GCI): {GCI:.4f} (порог {GCI_limit:.2f})")
+
+    # Точность быстрых методов относительно np.linalg.eig
+    print("-" * 20)
+    print("Точность методов относительно 'eig':")
+    for method, stats in compare_methods(criteria_matrix).items():
+        print(f"  {method}: max|Δw| = {stats['max_weight_error']:.2e}, |ΔCR| = {stats['cr_error']:.2e}, ранжирование совпадает: {stats['same_ranking']}")
@@ -1,26 +1,82 @@
 import streamlit as st
-import ahpy
 import pandas as pd
 import itertools
 import json
+import os
 import time
 import numpy as np
 import plotly.graph_objects as go
 import requests
 from streamlit_lottie import st_lottie
+import ahp_engine
+import ahp_cache
+import ahp_group
+import ahp_session
+import ahp_sensitivity
+import ahp_diagnostics
+import ahp_format
+import ahp_network
+import ahp_fuzzy
+import ahp_metrics
 
 # --- 1. Функция Lottie ---
+# Локальные копии анимаций (assets/<имя>.json) используются вместо сети, если они есть
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+# После неудачной загрузки анимация не запрашивается повторно столько секунд (без сети каждый перезапуск ждал бы таймаут)
+LOTTIE_RETRY_S = 60
+
+@ahp_metrics.timed("io.lottie_fetch")
 def load_lottie_url(url: str):
-    """Загружает Lottie анимацию по URL."""
+    """Загружает Lottie анимацию по URL. Ошибка сети или ответа - исключение."""
+    r = requests.get(url, timeout=3)
+    r.raise_for_status()
+    return r.json()
+
+@st.cache_data(show_spinner=False)
+def load_lottie_cached(name: str, url: str):
+    """Lottie анимация из assets/, иначе по URL. Кэшируется на процесс только удачная загрузка: исключения st.cache_data не кэширует."""
+    local_path = os.path.join(ASSETS_DIR, f"{name}.json")
+    if os.path.exists(local_path):
+        with open(local_path, encoding='utf-8') as f: return json.load(f)
+    return load_lottie_url(url)
+
+@st.cache_resource
+def get_lottie_failures():
+    """Время последней неудачной загрузки каждой анимации (общее для всех сессий процесса)."""
+    return {}
+
+def load_lottie(name: str, url: str):
+    """Анимация или None, если ее не удалось получить; повторная попытка - не раньше чем через LOTTIE_RETRY_S."""
+    failures = get_lottie_failures()
+    if time.time() - failures.get(name, float('-inf')) < LOTTIE_RETRY_S: return None
     try:
-        r = requests.get(url, timeout=5)
-        if r.status_code != 200: return None
-        return r.json()
-    except Exception: return None
+        return load_lottie_cached(name, url)
+    except Exception:
+        failures[name] = time.time()
+        return None
 
 # --- 2. Настройка страницы ---
 st.set_page_config(layout="wide", page_title="Платформа для AHP-Анализа")
 
+# --- 2.1 Замеры производительности ---
+# Замеры каждой сессии копятся в ее Recorder (панель "Производительность" в боковой панели).
+# AHP_METRICS_JSONL=<файл> дописывает их в общий JSONL для мониторинга, AHP_METRICS=0 отключает полностью.
+@st.cache_resource
+def get_metrics_sink():
+    path = os.environ.get("AHP_METRICS_JSONL")
+    return ahp_metrics.JsonlSink(path) if path else None
+
+def activate_metrics():
+    """Подключает Recorder сессии к текущему потоку (или отключает запись, если сбор выключен)."""
+    if 'perf_recorder' not in st.session_state:
+        st.session_state.perf_recorder = ahp_metrics.Recorder(sink=get_metrics_sink())
+    if 'ui_perf_enabled' not in st.session_state:
+        st.session_state.ui_perf_enabled = ahp_metrics.ENABLED
+    ahp_metrics.activate(st.session_state.perf_recorder if st.session_state.ui_perf_enabled else None)
+
+activate_metrics()
+script_span = ahp_metrics.span("render.script").start()
+
 # --- 3. (АНИМАЦИЯ) CSS ---
 st.markdown("""
     <style>
@@ -40,9 +96,14 @@ st.markdown("""
 
 # --- 4. Загрузка Анимаций ---
 lottie_header_url = "https://lottie.host/e0d4d0c9-1d48-43d7-9907-3f3603d6d6c4/Bf9pzxqT9z.json"
-lottie_header_json = load_lottie_url(lottie_header_url)
+lottie_header_json = load_lottie("header", lottie_header_url)
 lottie_success_url = "https://lottie.host/5b217b1d-91b6-4b2a-888a-36d713c70f80/vI0cYSgLNj.json"
-lottie_success_json = load_lottie_url(lottie_success_url)
+lottie_success_json = load_lottie("success", lottie_success_url)
+
+# "Быстрый режим": без Lottie и эффекта печатной машинки - перезапуск стоит только времени расчета.
+# По умолчанию берется из переменной окружения AHP_FAST_MODE=1, переключается в боковой панели.
+if 'ui_fast_mode' not in st.session_state:
+    st.session_state.ui_fast_mode = os.environ.get("AHP_FAST_MODE", "0") == "1"
 
 # --- 5. Отображение Заголовка (С АНИМАЦИЕЙ) ---
 col1, col2 = st.columns([4, 1])
@@ -51,7 +112,7 @@ with col1:
     # Используем CSS класс с задержкой для второго элемента
     st.markdown('<div class="fade-in-base" style="animation-delay: 0.2s;"><p>Создавайте проекты, сохраняйте/загружайте сессии, получайте AI-анализ, экспортируйте опросники и загружайте ответы для группового решения.</p></div>', unsafe_allow_html=True)
 with col2:
-    if lottie_header_json:
+    if lottie_header_json and not st.session_state.ui_fast_mode:
         st_lottie(lottie_header_json, height=150, width=150, speed=1, loop=True, quality='high', key="header_lottie")
 
 # --- 6. "Память" Streamlit ---
@@ -73,60 +134,272 @@ saaty_scale_values = {
 }
 
 # --- 8. Хелпер-функции ---
+# Сколько слайдеров показывать на одной странице матрицы
+PAIRS_PER_PAGE = 30
+
+def comparison_matrices(criteria, alternatives, children=None, network=False):
+    """
+    Все матрицы сравнения проекта: (префикс ключа, заголовок, сравниваемые элементы).
+    Порядок: критерии, подкритерии каждого узла (по уровням), альтернативы по каждому листу;
+    network=True - еще матрицы взаимовлияний ANP (критерии относительно каждого критерия и альтернативы).
+    """
+    children = children or {}
+    _, internal, leaves = ahp_engine.tree_order(criteria, children)
+    matrices = []
+    if len(criteria) >= 2: matrices.append(("crit", "Важность критериев", criteria))
+    matrices.extend((node, f"Важность подкритериев '{node}'", children[node]) for node in internal if len(children[node]) >= 2)
+    if len(alternatives) >= 2: matrices.extend((leaf, f"Сравнение по '{leaf}'", alternatives) for leaf in leaves)
+    if network and len(criteria) >= 2:
+        matrices.extend((ahp_engine.NETWORK_PREFIX + crit, f"Влияние критериев на '{crit}'", criteria) for crit in criteria)
+        matrices.extend((ahp_engine.NETWORK_PREFIX + alt, f"Важность критериев для '{alt}'", criteria) for alt in alternatives)
+    return matrices
+
+def render_slider_page(key_prefix, items, model):
+    """Слайдеры только для текущей страницы пар активной матрицы (в нечетком AHP - слайдеры диапазона)."""
+    fuzzy = get_store().model == "fuzzy"
+    pairs = list(itertools.combinations(items, 2))
+    n_pages = -(-len(pairs) // PAIRS_PER_PAGE)
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(f"Страница (из {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"ui_page_{key_prefix}")
+    for item_a, item_b in pairs[(page - 1) * PAIRS_PER_PAGE:page * PAIRS_PER_PAGE]:
+        if fuzzy:
+            create_range_comparison(key_prefix, item_a, item_b)
+        else:
+            create_comparison(key_prefix, item_a, item_b, model)
+
+def render_matrix_editor(key_prefix, items, model):
+    """Матрица активного сравнения в st.data_editor; изменения записываются в сессию одним пакетом по кнопке."""
+    n = len(items)
+    store = get_store()
+    matrix = ahp_engine.build_reciprocal_matrices(np.nan_to_num(store.upper(key_prefix), nan=1.0), n)[0]
+    version_key = f"ui_grid_version_{key_prefix}"
+    version = st.session_state.get(version_key, 0)
+    st.caption("Редактируйте ячейки выше диагонали (строка A против столбца B); нижний треугольник заполнится обратными значениями.")
+    with st.form(key=f"ui_grid_form_{key_prefix}"):
+        column_config = {item: st.column_config.NumberColumn(item, min_value=1/9, max_value=9, format="%.3f") for item in items}
+        edited = st.data_editor(pd.DataFrame(matrix, index=items, columns=items), column_config=column_config,
+                                key=f"ui_grid_{key_prefix}_{version}", use_container_width=True)
+        submitted = st.form_submit_button("Применить")
+    if submitted:
+        values = np.clip(edited.to_numpy(dtype=float), 1/9, 9)
+        rows, cols = np.triu_indices(n, 1)
+        store.set_upper(key_prefix, values[rows, cols])
+        for i, j in zip(rows, cols):
+            # Состояние слайдера сбрасываем, чтобы он взял новое значение из хранилища
+            st.session_state.pop(f"slider_{key_prefix}_{items[i]}_{items[j]}", None)
+            if model is not None: model.set_judgment(key_prefix, items[i], items[j], values[i, j])
+        # Новый ключ редактора: при следующем запуске таблица построится заново из сессии
+        st.session_state[version_key] = version + 1
+
+def record_judgment(key_prefix, item_a, item_b, slider_key):
+    """Колбэк сокращенного опроса: записывает ответ на предложенную пару."""
+    value = saaty_scale_values[st.session_state[slider_key]]
+    get_store().set(key_prefix, item_a, item_b, value)
+    st.session_state.pop(f"slider_{key_prefix}_{item_a}_{item_b}", None)
+    if 'ahp_model' in st.session_state:
+        st.session_state.ahp_model.set_judgment(key_prefix, item_a, item_b, value)
+    st.session_state[slider_key] = "Равная важность"
+
+def render_reduced_elicitation(key_prefix, items):
+    """
+    Сокращенный опрос: эксперт отвечает только на предлагаемые пары (сначала остовное дерево из n-1 пар,
+    затем самые неопределенные), пропущенные суждения восстанавливаются методом LLSM.
+    """
+    n = len(items)
+    upper = get_store().upper(key_prefix).astype(float)
+    matrix = ahp_engine.build_reciprocal_matrices(upper, n)[0]
+    answered = int(np.count_nonzero(~np.isnan(upper)))
+    connected = bool(ahp_engine.is_connected(ahp_engine.known_mask(matrix[np.newaxis]))[0])
+    budget = st.number_input("Бюджет вопросов для этой матрицы", min_value=n - 1, max_value=len(upper),
+                             value=min(len(upper), 2 * (n - 1)), key=f"ui_budget_{key_prefix}")
+    st.progress(min(answered / budget, 1.0), text=f"Отвечено {answered} из {budget} (всего пар {len(upper)}, минимум {n - 1})")
+    if not connected: st.warning("Пока не все элементы связаны сравнениями - веса будут неточными.")
+    pair = ahp_engine.suggest_next_pair(matrix)
+    if pair is None:
+        st.success("Все пары этой матрицы сравнены.")
+        return
+    if answered >= budget: st.info("Бюджет исчерпан - результат уже можно рассчитывать. Дополнительные ответы повысят точность.")
+    item_a, item_b = items[pair[0]], items[pair[1]]
+    slider_key = f"ui_reduced_slider_{key_prefix}"
+    if slider_key not in st.session_state: st.session_state[slider_key] = "Равная важность"
+    with st.form(key=f"ui_reduced_form_{key_prefix}"):
+        st.select_slider(f"Следующая пара: **{item_a}** (A) vs **{item_b}** (B)", options=saaty_scale_labels, key=slider_key)
+        st.form_submit_button("Записать оценку", on_click=record_judgment, args=(key_prefix, item_a, item_b, slider_key))
+
+def network_matrix_enabled(key_prefix):
+    """Флажок матрицы взаимовлияний ANP: матрица без оценок - влияния нет, выключение стирает ее оценки."""
+    store = get_store()
+    present = not np.all(np.isnan(store.upper(key_prefix)))
+    if st.checkbox("Учитывать это влияние", value=present, key=f"ui_anp_use_{key_prefix}"):
+        return True
+    if present: store.set_upper(key_prefix, np.full(len(store.upper(key_prefix)), np.nan))
+    return False
+
+@st.fragment
+def render_comparisons(criteria, alternatives):
+    """
+    Ввод оценок только для активной матрицы. Это фрагмент Streamlit:
+    изменение слайдера перезапускает только его, а не всю страницу.
+    """
+    # Фрагмент перезапускается без основного скрипта - Recorder сессии подключается заново
+    activate_metrics()
+    with ahp_metrics.span("render.comparisons"):
+        render_comparison_panel(criteria, alternatives)
+
+def render_comparison_panel(criteria, alternatives):
+    children = get_store().children
+    network = get_store().model == "anp"
+    # Инкрементальная модель - только для четкой двухуровневой иерархии; дерево, сеть ANP и нечеткий AHP
+    # пересчитываются целиком (с кэшем)
+    if children or get_store().model != "ahp":
+        st.session_state.pop('ahp_model', None)
+        live_model = None
+    else:
+        live_model = get_live_model(criteria, alternatives)
+    matrices = comparison_matrices(criteria, alternatives, children, network)
+    if matrices:
+        col_mode, col_matrix = st.columns([1, 2])
+        entry_modes = ["Слайдеры", "Таблица-матрица", "Сокращенный опрос"]
+        entry_mode = col_mode.radio("Способ ввода", entry_modes, horizontal=True, key="ui_entry_mode",
+                                    index=2 if get_store().elicitation_mode == "reduced" else 0,
+                                    help="Сокращенный опрос: только часть пар, пропуски восстанавливаются методом наименьших квадратов (LLSM).")
+        # Флаг сохраняется в сессии: в сокращенном опросе отсутствующее суждение - пропуск, а не 1
+        get_store().elicitation_mode = "reduced" if entry_mode == "Сокращенный опрос" else "full"
+        titles = [title for _, title, _ in matrices]
+        active_title = col_matrix.selectbox(f"Матрица сравнения ({len(matrices)} шт.)", titles, key="ui_active_matrix")
+        key_prefix, title, items = matrices[titles.index(active_title)]
+        st.subheader(title)
+        if key_prefix.startswith(ahp_engine.NETWORK_PREFIX) and not network_matrix_enabled(key_prefix):
+            st.caption("Влияние не учитывается. Включите, чтобы сравнить критерии.")
+        elif entry_mode == "Слайдеры":
+            render_slider_page(key_prefix, items, live_model)
+        elif entry_mode == "Таблица-матрица":
+            render_matrix_editor(key_prefix, items, live_model)
+        else:
+            render_reduced_elicitation(key_prefix, items)
+
+    # Живой рейтинг: пересчитывается только измененная матрица + синтез
+    st.subheader("Текущий Рейтинг (обновляется на лету)")
+    if get_store().elicitation_mode == "reduced" or live_model is None:
+        live_final, _, live_cr, _, _ = calculate_ahp(get_session_data())
+        if live_final is None: return
+    else:
+        live_final, _, live_cr, _, _ = live_model.results()
+    live_df = pd.DataFrame.from_dict(live_final, orient='index', columns=['Вес'])
+    st.bar_chart(live_df)
+    inconsistent = [name for name, cr in live_cr.items() if cr > 0.1]
+    if inconsistent: st.warning(f"CR > 0.10 в матрицах: {', '.join(inconsistent)}")
+
 def get_lists_from_state():
-    criteria = [line.strip() for line in st.session_state.criteria_input.split('\n') if line.strip()]
-    alternatives = [line.strip() for line in st.session_state.alternatives_input.split('\n') if line.strip()]
-    if len(criteria) != len(set(criteria)) or len(alternatives) != len(set(alternatives)):
+    """Критерии верхнего уровня и альтернативы; имена всех узлов дерева критериев должны быть уникальны."""
+    nodes = ahp_engine.parse_items(st.session_state.criteria_input)
+    alternatives = ahp_engine.parse_items(st.session_state.alternatives_input)
+    if len(nodes) != len(set(nodes)) or len(alternatives) != len(set(alternatives)):
         st.error("Ошибка: В критериях или альтернативах есть дубликаты!")
         return None, None
-    return criteria, alternatives
+    return ahp_engine.parse_tree(st.session_state.criteria_input)[0], alternatives
 
-def create_comparison(key_prefix, item_a, item_b):
-    session_key = f"{key_prefix}_{item_a}_{item_b}"
-    if session_key not in st.session_state: st.session_state[session_key] = 1
-    current_val = st.session_state[session_key]
-    default_label = min(saaty_scale_values.keys(), key=lambda k: abs(saaty_scale_values[k] - current_val))
+def saaty_label(value):
+    """Ближайшая к значению подпись шкалы Саати."""
+    return min(saaty_scale_values.keys(), key=lambda k: abs(saaty_scale_values[k] - value))
+
+def create_comparison(key_prefix, item_a, item_b, model=None):
+    store = get_store()
+    current_val = store.get(key_prefix, item_a, item_b, 1)
+    default_label = saaty_label(current_val)
+    slider_label = f"**{item_a}** (A) vs **{item_b}** (B)"
+    selected_label = st.select_slider(slider_label, options=saaty_scale_labels, value=default_label, key=f"slider_{key_prefix}_{item_a}_{item_b}")
+    ahp_metrics.count("render.sliders")
+    store.set(key_prefix, item_a, item_b, saaty_scale_values[selected_label])
+    # Живая модель пересчитает только матрицу, в которой изменилась оценка
+    if model is not None: model.set_judgment(key_prefix, item_a, item_b, saaty_scale_values[selected_label])
+
+def create_range_comparison(key_prefix, item_a, item_b):
+    """Суждение диапазоном "от - до": интервал [l, u] нечеткого AHP с модальным значением sqrt(l * u)."""
+    store = get_store()
+    current_val = store.get(key_prefix, item_a, item_b, 1)
+    low, high = store.get_bounds(key_prefix, item_a, item_b) or (current_val, current_val)
+    default = (saaty_label(low), saaty_label(high))
     slider_label = f"**{item_a}** (A) vs **{item_b}** (B)"
-    selected_label = st.select_slider(slider_label, options=saaty_scale_labels, value=default_label, key=f"slider_{session_key}")
-    st.session_state[session_key] = saaty_scale_values[selected_label]
+    selected = st.select_slider(slider_label, options=saaty_scale_labels, value=default, key=f"range_{key_prefix}_{item_a}_{item_b}",
+                                help="Выберите диапазон, если оценка неточна (например, 'от 3 до 5'); одна точка - четкая оценка.")
+    ahp_metrics.count("render.sliders")
+    # Сохраненное суждение не перезаписывается, пока диапазон не изменен: модальное значение из файла остается
+    if tuple(selected) == default:
+        return
+    low, high = sorted(saaty_scale_values[label] for label in selected)
+    if low == high:
+        store.set(key_prefix, item_a, item_b, low)
+        store.set_bounds(key_prefix, item_a, item_b)
+    else:
+        store.set(key_prefix, item_a, item_b, float(np.sqrt(low * high)))
+        store.set_bounds(key_prefix, item_a, item_b, low, high)
+
+def get_store():
+    """
+    Суждения проекта (ahp_session.JudgmentStore) - массивы верхних треугольников вместо ключа на каждую пару.
+    При изменении дерева критериев/списка альтернатив суждения переносятся по именам.
+    """
+    criteria, children = ahp_engine.parse_tree(st.session_state.criteria_input)
+    alternatives = ahp_engine.parse_items(st.session_state.alternatives_input)
+    store = st.session_state.get('judgments')
+    if store is None:
+        store = ahp_session.JudgmentStore(criteria, alternatives, children=children)
+    elif store.criteria != criteria or store.children != children or store.alternatives != alternatives:
+        store = store.reindex(criteria, alternatives, children)
+    st.session_state.judgments = store
+    return store
 
 def get_session_data():
-    return {k: v for k, v in st.session_state.items() if not k.startswith(('slider_', 'last_results'))}
+    """Компактный словарь сессии (версия 2) - для расчета, кэша и сохранения в файл."""
+    return get_store().to_dict()
+
+def get_ahp_export(session_data):
+    """Текущий проект в формате .ahp (как platform_choice.ahp)."""
+    try:
+        return ahp_format.dumps_ahp(ahp_format.AHPHierarchy.from_session(session_data))
+    except Exception:
+        return ""
+
+def get_live_model(criteria, alternatives):
+    """Инкрементальная модель AHP, которая живет в сессии между перезапусками скрипта."""
+    model = st.session_state.get('ahp_model')
+    if model is None or model.criteria != criteria or model.alternatives != alternatives:
+        model = ahp_engine.AHPModel.from_session(get_session_data())
+        st.session_state.ahp_model = model
+    return model
 
 def load_session_data(data):
     try:
+        # Старые файлы (ключ на каждую пару) мигрируются в компактный формат при загрузке
+        store = ahp_session.load_session(data)
         keys_to_clear = [k for k in st.session_state.keys()]
         for k in keys_to_clear: del st.session_state[k]
-        for k, v in data.items(): st.session_state[k] = v
-        st.success("✅ Сессия успешно загружена! Все данные восстановлены.")
-        time.sleep(1)
+        st.session_state.criteria_input = store.criteria_input
+        st.session_state.alternatives_input = store.alternatives_input
+        st.session_state.judgments = store
+        st.toast("✅ Сессия успешно загружена! Все данные восстановлены.")
         st.rerun()
     except Exception as e: st.error(f"Ошибка чтения файла: {e}")
 
+@ahp_metrics.timed("calc.aggregate")
 def aggregate_expert_data(expert_files):
-    all_judgments = {}
-    for file in expert_files:
-        file.seek(0)
-        data = json.load(file)
-        for key, value in data.items():
-            if '_' in key and not key.startswith('criteria_') and not key.startswith('alternatives_'):
-                if key not in all_judgments: all_judgments[key] = []
-                all_judgments[key].append(value)
-    aggregated_data = {}
-    for key, values in all_judgments.items():
-        geo_mean = np.prod(values) ** (1/len(values))
-        aggregated_data[key] = geo_mean
-    expert_files[0].seek(0)
-    base_data = json.load(expert_files[0])
-    aggregated_data['criteria_input'] = base_data['criteria_input']
-    aggregated_data['alternatives_input'] = base_data['alternatives_input']
-    return aggregated_data
+    # Один проход по бюллетеням: суммы логарифмов по каждому суждению, затем среднее геометрическое
+    return ahp_group.aggregate_streams(expert_files).result()
 
 # --- 9. AI-Аналитик (Эффект "Печатной машинки") ---
-def get_ai_analysis_stream(final_weights, criteria_weights, cr_data):
-    """Это ГЕНЕРАТОР, он использует `yield` для "печатания" текста."""
-    with st.spinner("🤖 AI-Аналитик изучает ваши данные..."):
-        time.sleep(2)
+def typing_pause(word_delay):
+    """Пауза между словами; суммарное время пауз - счетчик ai.sleep_seconds."""
+    if word_delay:
+        time.sleep(word_delay)
+        ahp_metrics.count("ai.sleep_seconds", word_delay)
+
+def get_ai_analysis_stream(final_weights, criteria_weights, cr_data, word_delay=0.0, diagnostics=None):
+    """
+    Это ГЕНЕРАТОР, он использует `yield` для "печатания" текста. word_delay=0 - весь текст сразу.
+    diagnostics - отчет ahp_diagnostics.diagnose_session: вместо общего примера называются реальные противоречия.
+    """
 
     sorted_weights = sorted(final_weights.items(), key=lambda item: item[1], reverse=True)
     winner_name = sorted_weights[0][0]
@@ -141,56 +414,107 @@ def get_ai_analysis_stream(final_weights, criteria_weights, cr_data):
         consistency_report = "**Согласованность: Идеальная.**\n\nВсе Индексы Согласованности (CR) ниже 0.10. Ваши суждения логичны."
     else:
         consistency_report = f"**Согласованность: ⚠️ НИЗКАЯ!**\n\nРезультатам **нельзя доверять**. Обнаружены противоречия в матрицах: **{', '.join(inconsistent_matrices)}**.\n\n"
-        consistency_report += "**Пример:** Если CR 'Матрицы \"Стоимость\"' высокий, это значит, что вы, возможно, сказали 'A > B', 'B > C', но при этом 'C > A' при сравнении по стоимости."
+        if diagnostics:
+            for name in inconsistent_matrices:
+                report = diagnostics.get(name)
+                if report is None: continue
+                if report["triads"]:
+                    a, b, c, score = report["triads"][0]
+                    consistency_report += f"{name}: сильнее всего противоречат друг другу оценки тройки **{a} / {b} / {c}** (индекс Кочкодая {score:.2f}). "
+                if report["fix"]:
+                    fix = report["fix"]
+                    consistency_report += (f"Измените оценку **{fix['pair'][0]} vs {fix['pair'][1]}** с '{saaty_label(fix['old'])}' на "
+                                           f"'{saaty_label(fix['new'])}' - CR снизится с {report['cr']:.3f} до {fix['cr']:.3f}.\n\n")
+        else:
+            consistency_report += "**Пример:** Если CR 'Матрицы \"Стоимость\"' высокий, это значит, что вы, возможно, сказали 'A > B', 'B > C', но при этом 'C > A' при сравнении по стоимости."
 
     # "Печатаем" первый блок
     st.info("**AI-Вывод по Рекомендации:**")
     for word in recommendation.split():
         yield word + " "
-        time.sleep(0.05)
+        typing_pause(word_delay)
 
-    yield "\n\n"; time.sleep(1)
+    yield "\n\n"
 
     # "Печатаем" второй блок
     if not inconsistent_matrices:
         st.success("**AI-Вывод по Согласованности:**")
         for word in consistency_report.split():
-            yield word + " "; time.sleep(0.05)
+            yield word + " "
+            typing_pause(word_delay)
     else:
         st.error("**AI-Вывод по Согласованности:**")
         for word in consistency_report.split():
-            yield word + " "; time.sleep(0.05)
+            yield word + " "
+            typing_pause(word_delay)
+
+@st.cache_data(max_entries=32)
+def get_diagnostics(session_data):
+    """Диагностика согласованности (триады, отклонения ячеек, лучшее исправление) для словаря сессии."""
+    try:
+        return ahp_diagnostics.diagnose_session(session_data)
+    except Exception:
+        return None
+
+@st.cache_data(max_entries=32)
+def get_fuzzy_intervals(session_data):
+    """Интервалы приоритетов нечеткого AHP: {"alternatives": {имя: (l, m, u)}, "criteria": {лист: (l, m, u)}}."""
+    try:
+        return ahp_fuzzy.priority_intervals(session_data)
+    except Exception:
+        return None
+
+@st.cache_data(max_entries=32)
+def get_gci(session_data):
+    """GCI всех матриц для словаря сессии: {подпись матрицы: (GCI, порог)}."""
+    try:
+        return ahp_engine.session_gci(session_data)
+    except Exception:
+        return None
 
 # --- 10. Функция расчета AHP ---
-def calculate_ahp(session_data):
+# "numpy" - пакетный движок ahp_engine (по умолчанию), "ahpy" - прежний расчет через ahpy.Compare
+AHP_BACKEND = "numpy"
+
+@st.cache_resource
+def get_results_cache():
+    """Один кэш результатов на процесс (общий для всех сессий); AHP_CACHE_DIR включает общий дисковый уровень."""
+    return ahp_cache.ResultsCache(maxsize=256, cache_dir=os.environ.get("AHP_CACHE_DIR"))
+
+@ahp_metrics.timed("calc.ahp")
+def calculate_ahp(session_data, backend=None):
+    backend = backend or AHP_BACKEND
+    if backend == "ahpy":
+        return calculate_ahp_ahpy(session_data)
+    # Модель сессии (AHP, сеть ANP, нечеткий AHP) выбирает ahp_engine.solve_any_session
+    try:
+        return get_results_cache().get_or_compute(session_data, lambda data: ahp_engine.solve_any_session(data, precision=4))
+    except Exception as e:
+        st.error(f"Ошибка расчета: {e}")
+        return None, None, None, None, None
+
+def calculate_ahp_ahpy(session_data):
     try:
-        criteria = [line.strip() for line in session_data['criteria_input'].split('\n') if line.strip()]
-        alternatives = [line.strip() for line in session_data['alternatives_input'].split('\n') if line.strip()]
-        criteria_comps, children_comps = {}, {}
-        for pair in itertools.combinations(criteria, 2):
-            criteria_comps[pair] = session_data.get(f"crit_{pair[0]}_{pair[1]}", 1)
-        for crit in criteria:
-            temp_dict = {}
-            for pair in itertools.combinations(alternatives, 2):
-                temp_dict[pair] = session_data.get(f"{crit}_{pair[0]}_{pair[1]}", 1)
-            children_comps[crit] = temp_dict
-        children_nodes = [ahpy.Compare(name, comps, precision=4) for name, comps in children_comps.items()]
-        root_node = ahpy.Compare("Goal", criteria_comps, precision=4)
-        root_node.add_children(children_nodes)
-        final_weights = root_node.target_weights
-        criteria_weights = root_node.local_weights
-        cr_data = {'Матрица "Goal" (Критерии)': root_node.consistency_ratio}
-        for child in children_nodes: cr_data[f"Матрица '{child.name}'"] = child.consistency_ratio
-        profiles = {}
-        for alt in alternatives:
-            profiles[alt] = []
-            for child in children_nodes:
-                profiles[alt].append(child.local_weights.get(alt, 0))
-        return final_weights, criteria_weights, cr_data, profiles, criteria
+        return ahp_engine.solve_session_ahpy(session_data, precision=4)
     except Exception as e:
         st.error(f"Ошибка расчета: {e}")
         return None, None, None, None, None
 
+@ahp_metrics.timed("calc.aip")
+def calculate_aip(expert_files, inconsistent_mode="keep"):
+    """Групповой расчет AIP: иерархия каждого эксперта решается отдельно (пакетно), веса усредняются."""
+    try:
+        ballots = []
+        for file in expert_files:
+            file.seek(0)
+            with ahp_metrics.span("io.ballot_parse"):
+                ballots.append(json.load(file))
+        results, expert_cr, _ = ahp_group.aggregate_individual_priorities(ballots, inconsistent=inconsistent_mode)
+        return results, expert_cr
+    except Exception as e:
+        st.error(f"Ошибка расчета: {e}")
+        return (None, None, None, None, None), None
+
 # --- 11. Функция для Радар-Графика ---
 def create_radar_chart(profiles, criteria):
     fig = go.Figure()
@@ -199,19 +523,45 @@ def create_radar_chart(profiles, criteria):
     fig.update_layout(polar=dict(radialaxis=dict(visible=True, range=[0, 1])), showlegend=True, title="Профиль Альтернатив по Критериям")
     return fig
 
+# --- 11.1 График развертки веса критерия ---
+def create_sweep_chart(criterion, grid, curves, alternatives, current_weight):
+    """curves (n_points, n_alt) - итоговые веса при весе критерия от 0 до 1 (из ahp_sensitivity.weight_sweep)."""
+    fig = go.Figure()
+    for j, alt in enumerate(alternatives):
+        fig.add_trace(go.Scatter(x=grid, y=curves[:, j], mode='lines', name=alt))
+    fig.add_vline(x=current_weight, line_dash="dash", annotation_text="текущий вес")
+    fig.update_layout(title=f"Итоговые веса при изменении веса '{criterion}'", xaxis_title=f"Вес '{criterion}'",
+                      yaxis_title="Итоговый вес", xaxis=dict(range=[0, 1]))
+    return fig
+
 # --- 12. БОКОВАЯ ПАНЕЛЬ ---
-with st.sidebar:
+with st.sidebar, ahp_metrics.span("render.sidebar"):
     st.header("1. Настройка Проекта")
     st.write("Введите критерии и альтернативы. Каждый с новой строки.")
-    st.text_area("Критерии", key="criteria_input", height=150)
+    st.text_area("Критерии", key="criteria_input", height=150,
+                 help="Подкритерии пишутся под своим критерием с отступом (например, два пробела); уровней может быть сколько угодно.")
     st.text_area("Альтернативы", key="alternatives_input", height=100)
     st.divider()
+    st.toggle("⚡ Быстрый режим", key="ui_fast_mode", help="Без анимаций и эффекта печати: результаты выводятся сразу.")
+    st.divider()
     st.header("2. Управление Сессией")
-    export_data = get_session_data()
-    st.download_button(label="💾 Скачать Сессию (.json)", data=json.dumps(export_data, indent=2), file_name="ahp_project_session.json", mime="application/json")
-    uploaded_file = st.file_uploader("Загрузить Сессию (.json)", type="json")
+    # Данные формируются в момент скачивания, поэтому учитывают оценки, введенные во фрагменте
+    st.download_button(label="💾 Скачать Сессию (.json)", data=lambda: json.dumps(get_session_data(), indent=2), file_name="ahp_project_session.json", mime="application/json")
+    st.download_button(label="🌳 Скачать Проект (.ahp)", data=lambda: get_ahp_export(get_session_data()), file_name="ahp_project.ahp", mime="text/plain")
+    uploaded_file = st.file_uploader("Загрузить Сессию (.json) или Проект (.ahp)", type=["json", "ahp"])
     if uploaded_file:
-        load_session_data(json.load(uploaded_file))
+        if uploaded_file.name.endswith('.ahp'):
+            try:
+                with ahp_metrics.span("io.session_upload"):
+                    uploaded_session = ahp_format.loads_ahp(uploaded_file.getvalue().decode('utf-8')).to_session()
+            except Exception as e:
+                uploaded_session = None
+                st.error(f"Ошибка чтения файла: {e}")
+            if uploaded_session: load_session_data(uploaded_session)
+        else:
+            with ahp_metrics.span("io.session_upload"):
+                uploaded_session = json.load(uploaded_file)
+            load_session_data(uploaded_session)
 
 # --- 13. СОЗДАНИЕ ВКЛАДОК ---
 tab1, tab2, tab3, tab4 = st.tabs([
@@ -222,50 +572,69 @@ tab1, tab2, tab3, tab4 = st.tabs([
 ])
 
 # --- ВКЛАДКА 1: ВВОД ОЦЕНОК ---
-with tab1:
+with tab1, ahp_metrics.span("render.input_tab"):
     st.markdown('<h2 class="fade-in-base">Ввод Оценок (Единичный Эксперт)</h2>', unsafe_allow_html=True)
-    st.write("Используйте слайдеры для ввода оценок. Вы можете сохранить эту сессию (в боковой панели) как 'бюллетень' и отправить его администратору.")
+    st.write("Выберите матрицу и введите оценки слайдерами или таблицей. Вы можете сохранить эту сессию (в боковой панели) как 'бюллетень' и отправить его администратору.")
     criteria_list, alternatives_list = get_lists_from_state()
     if criteria_list and alternatives_list:
-        st.subheader("Сравнение Критериев")
-        with st.expander("Важность критериев", expanded=True):
-            if len(criteria_list) >= 2:
-                for pair in itertools.combinations(criteria_list, 2): create_comparison("crit", pair[0], pair[1])
-            else: st.info("У вас только один критерий.")
-        st.subheader("Сравнение Альтернатив")
-        if len(alternatives_list) >= 2:
-            for criterion in criteria_list:
-                with st.expander(f"Сравнение по '{criterion}'"):
-                    for pair in itertools.combinations(alternatives_list, 2): create_comparison(criterion, pair[0], pair[1])
-        else: st.info("У вас только одна альтернатива.")
+        if len(criteria_list) < 2: st.info("У вас только один критерий.")
+        if len(alternatives_list) < 2: st.info("У вас только одна альтернатива.")
+        store = get_store()
+        model_labels = {"AHP (иерархия)": "ahp", "ANP (сеть с взаимовлияниями)": "anp", "Нечеткий AHP (диапазоны оценок)": "fuzzy"}
+        col_model, col_dependence = st.columns([2, 1])
+        model_label = col_model.radio("Модель", list(model_labels), horizontal=True, key="ui_model",
+                                      index=list(model_labels.values()).index(store.model),
+                                      help="ANP учитывает влияние критериев друг на друга и обратную связь от альтернатив к критериям.")
+        store.model = model_labels[model_label]
+        if store.model == "anp":
+            if store.children: st.warning("Сеть ANP строится только для критериев без подкритериев.")
+            store.dependence_weight = col_dependence.slider(
+                "Доля взаимовлияния критериев", 0.1, 0.9, value=store.dependence_weight or ahp_network.DEPENDENCE_WEIGHT,
+                step=0.05, key="ui_anp_dependence", help="Какая часть веса критерия, зависящего от других критериев, приходится на них (остальное - на альтернативы).")
+        elif store.model == "fuzzy":
+            fuzzy_labels = {"Бакли (среднее геометрическое)": "buckley", "Анализ протяженности (Чанг)": "extent"}
+            fuzzy_label = col_dependence.selectbox("Метод", list(fuzzy_labels), key="ui_fuzzy_method",
+                                                   index=list(fuzzy_labels.values()).index(store.fuzzy_method or ahp_fuzzy.DEFAULT_METHOD),
+                                                   help="Анализ протяженности может дать критерию или альтернативе нулевой вес, если ее оценка целиком ниже других.")
+            store.fuzzy_method = fuzzy_labels[fuzzy_label]
+        render_comparisons(criteria_list, alternatives_list)
 
 # --- ВКЛАДКА 2: ГРУППОВОЙ АНАЛИЗ ---
-with tab2:
+with tab2, ahp_metrics.span("render.group_tab"):
     st.markdown('<h2 class="fade-in-base">Агрегация Групповых Решений</h2>', unsafe_allow_html=True)
     st.write("Загрузите несколько 'бюллетеней' (.json), заполненных разными экспертами. Система автоматически рассчитает средний (агрегированный) результат.")
 
-    expert_files = st.file_uploader("Загрузите 'бюллетени' (.json) от ваших экспертов", type="json", accept_multiple_files=True)
+    expert_files = st.file_uploader("Загрузите 'бюллетени' (.json) от ваших экспертов", type="json", accept_multiple_files=True,
+                                    help="Нечеткие бюллетени (диапазоны оценок) в AIJ агрегируются по каждой границе; AIP использует модальные оценки.")
 
     if expert_files:
         st.write(f"Загружено файлов от {len(expert_files)} экспертов.")
+        group_method = st.radio("Метод агрегации", ["AIJ (суждения)", "AIP (приоритеты)"], horizontal=True,
+                                help="AIJ усредняет оценки и решает одну иерархию; AIP решает иерархию каждого эксперта и усредняет итоговые веса.")
+        if group_method.startswith("AIP"):
+            inconsistent_labels = {"Учитывать все": "keep", "Снижать вес (CR > 0.10)": "downweight", "Исключать (CR > 0.10)": "exclude"}
+            inconsistent_mode = inconsistent_labels[st.selectbox("Несогласованные бюллетени", list(inconsistent_labels))]
         if st.button("🚀 Рассчитать Групповой Результат"):
-            aggregated_data = aggregate_expert_data(expert_files)
             st.session_state.last_calc_is_group = True
-            results = calculate_ahp(aggregated_data)
+            if group_method.startswith("AIP"):
+                results, expert_cr = calculate_aip(expert_files, inconsistent_mode)
+                st.session_state.last_results_inputs = None
+                if expert_cr is not None:
+                    expert_df = pd.DataFrame({'Эксперт': [f.name for f in expert_files], 'Макс. CR': expert_cr})
+                    st.dataframe(expert_df.style.format({'Макс. CR': '{:.4f}'}), use_container_width=True)
+            else:
+                aggregated_data = aggregate_expert_data(expert_files)
+                results = calculate_ahp(aggregated_data)
+                st.session_state.last_results_inputs = aggregated_data
             st.session_state.last_results = results
 
-            # Анимация успеха Lottie
-            placeholder = st.empty()
-            with placeholder.container():
-                st.success("✅ Групповой результат рассчитан!")
-                if lottie_success_json:
-                    st_lottie(lottie_success_json, height=200, width=200, speed=1, loop=False, quality='high', key="lottie_group_success")
-            time.sleep(3) # Показываем 3 секунды
-            placeholder.empty() # Очищаем
-            time.sleep(0.1) # <-- МИКРО-ПАУЗА
+            # Анимация успеха Lottie проигрывается в браузере, сервер ее не ждет
+            st.success("✅ Групповой результат рассчитан!")
+            if lottie_success_json and not st.session_state.ui_fast_mode:
+                st_lottie(lottie_success_json, height=200, width=200, speed=1, loop=False, quality='high', key="lottie_group_success")
 
 # --- ВКЛАДКА 3: РЕЗУЛЬТАТЫ ---
-with tab3:
+with tab3, ahp_metrics.span("render.results_tab"):
     st.markdown('<h2 class="fade-in-base">Итоговые Результаты и Аналитика</h2>', unsafe_allow_html=True)
 
     st.write("Нажмите кнопку, чтобы рассчитать результат на основе данных из вкладки 'Ввод Оценок'.")
@@ -274,16 +643,12 @@ with tab3:
         st.session_state.last_calc_is_group = False
         results = calculate_ahp(session_data)
         st.session_state.last_results = results
+        st.session_state.last_results_inputs = session_data
 
-        # Анимация успеха Lottie
-        placeholder = st.empty()
-        with placeholder.container():
-            st.success("✅ Единичный результат рассчитан!")
-            if lottie_success_json:
-                st_lottie(lottie_success_json, height=200, width=200, speed=1, loop=False, quality='high', key="lottie_single_success")
-        time.sleep(3) # Показываем 3 секунды
-        placeholder.empty() # Очищаем
-        time.sleep(0.1) # <-- МИКРО-ПАУЗА
+        # Анимация успеха Lottie проигрывается в браузере, сервер ее не ждет
+        st.success("✅ Единичный результат рассчитан!")
+        if lottie_success_json and not st.session_state.ui_fast_mode:
+            st_lottie(lottie_success_json, height=200, width=200, speed=1, loop=False, quality='high', key="lottie_single_success")
 
     st.divider()
 
@@ -299,7 +664,6 @@ with tab3:
         else:
             st.subheader("Показан ✍️ Единичный Результат")
         st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
 
         # --- Блок 2: Метрики ---
         col1, col2, col3 = st.columns(3)
@@ -309,19 +673,16 @@ with tab3:
             st.markdown('<div class="fade-in-base">', unsafe_allow_html=True) # Анимация 1
             if len(sorted_weights) > 0: col1.metric(label=f"🥇 1-е Место", value=sorted_weights[0][0], delta=f"{sorted_weights[0][1]:.2%}")
             st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
 
         with col2:
             st.markdown('<div class="fade-in-base">', unsafe_allow_html=True) # Анимация 2
             if len(sorted_weights) > 1: col2.metric(label=f"🥈 2-е Место", value=sorted_weights[1][0], delta=f"{sorted_weights[1][1]:.2%}")
             st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
         
         with col3:
             st.markdown('<div class="fade-in-base">', unsafe_allow_html=True) # Анимация 3
             if len(sorted_weights) > 2: col3.metric(label=f"🥉 3-е Место", value=sorted_weights[2][0], delta=f"{sorted_weights[2][1]:.2%}")
             st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
 
         st.divider()
 
@@ -339,10 +700,28 @@ with tab3:
                 fig = create_radar_chart(profiles, criteria_names)
                 st.plotly_chart(fig, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
 
         st.divider()
 
+        # Исходные суждения последнего расчета (нет для группового AIP)
+        last_inputs = st.session_state.get('last_results_inputs')
+
+        # --- Блок 3.1: Интервалы приоритетов нечеткого AHP ---
+        fuzzy_intervals = get_fuzzy_intervals(last_inputs) if last_inputs is not None and ahp_engine.is_fuzzy_session(last_inputs) else None
+        if fuzzy_intervals:
+            st.subheader("Интервалы Приоритетов (нечеткий AHP)")
+            col_fuzzy1, col_fuzzy2 = st.columns(2)
+            for col, title, intervals in ((col_fuzzy1, "Альтернативы", fuzzy_intervals["alternatives"]),
+                                          (col_fuzzy2, "Критерии", fuzzy_intervals["criteria"])):
+                names = sorted(intervals, key=lambda name: intervals[name][1])
+                low, mid, high = (np.array([intervals[name][c] for name in names]) for c in range(3))
+                fig_interval = go.Figure(go.Scatter(x=mid, y=names, mode='markers',
+                                                    error_x=dict(type='data', symmetric=False, array=high - mid, arrayminus=mid - low)))
+                fig_interval.update_layout(title=f"{title}: нечеткие оценки (l, m, u)", xaxis_title="Приоритет")
+                col.plotly_chart(fig_interval, use_container_width=True)
+            st.caption("Точка - модальное значение, отрезок - от нижней до верхней границы. Рейтинг выше - по дефаззифицированным оценкам.")
+            st.divider()
+
         # --- Блок 4: Таблицы ---
         st.markdown('<div class="fade-in-base">', unsafe_allow_html=True)
         st.subheader("Детальные таблицы")
@@ -355,18 +734,105 @@ with tab3:
             st.write("Проверка Согласованности (CR)")
             cr_df = pd.DataFrame.from_dict(cr_data, orient='index', columns=['CR'])
             def color_cr(val): return f'background-color: {"#ffc7ce" if val > 0.1 else "#c7ffce"}'
-            st.dataframe(cr_df.style.applymap(color_cr).format({'CR': '{:.4f}'}), use_container_width=True)
+            cr_style = cr_df.style.map(color_cr, subset=['CR']).format({'CR': '{:.4f}'})
+            # GCI - мера согласованности для весов по среднему геометрическому, со своими порогами
+            gci = get_gci(last_inputs) if last_inputs is not None else None
+            if gci and all(name in gci for name in cr_df.index):
+                cr_df['GCI'] = [gci[name][0] for name in cr_df.index]
+                gci_limits = [gci[name][1] for name in cr_df.index]
+                cr_style = cr_df.style.map(color_cr, subset=['CR']).format({'CR': '{:.4f}', 'GCI': '{:.4f}'}).apply(
+                    lambda col: [f'background-color: {"#ffc7ce" if v > limit else "#c7ffce"}' for v, limit in zip(col, gci_limits)], subset=['GCI'])
+            st.dataframe(cr_style, use_container_width=True)
+            if 'GCI' in cr_df: st.caption("GCI - геометрический индекс согласованности; пороги 0.31 (n=3), 0.35 (n=4), 0.37 (n>4).")
         st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(0.2) # <-- ПАУЗА
+
+        # --- Блок 4.1: Диагностика согласованности (реальные противоречия и исправление) ---
+        diagnostics = get_diagnostics(last_inputs) if last_inputs is not None else None
+        if diagnostics:
+            with st.expander("🩺 Диагностика Согласованности", expanded=any(cr > 0.1 for cr in cr_data.values())):
+                diag_names = sorted(diagnostics, key=lambda name: diagnostics[name]["cr"], reverse=True)
+                diag_name = st.selectbox("Матрица", diag_names, key="ui_diag_matrix")
+                report = diagnostics[diag_name]
+                col_diag1, col_diag2 = st.columns(2)
+                col_diag1.metric("CR", f"{report['cr']:.4f}")
+                if report["fix"]:
+                    fix = report["fix"]
+                    col_diag2.metric("CR после исправления", f"{fix['cr']:.4f}", delta=f"{fix['cr'] - report['cr']:.4f}", delta_color="inverse")
+                    st.info(f"Лучшее исправление одного суждения: **{fix['pair'][0]}** (A) vs **{fix['pair'][1]}** (B): "
+                            f"'{saaty_label(fix['old'])}' → '{saaty_label(fix['new'])}'.")
+                if report["triads"]:
+                    st.write("Самые противоречивые тройки (a_AB · a_BC ≠ a_AC)")
+                    triads_df = pd.DataFrame(report["triads"], columns=['A', 'B', 'C', 'Индекс Кочкодая'])
+                    st.dataframe(triads_df.style.format({'Индекс Кочкодая': '{:.3f}'}), use_container_width=True)
+                fig_dev = go.Figure(go.Heatmap(z=report["deviations"], x=report["items"], y=report["items"], colorscale="Reds", zmin=0,
+                                               texttemplate="%{z:.2f}"))
+                fig_dev.update_layout(title="Отклонение суждений от весов |ln(a_ij · w_j / w_i)|")
+                st.plotly_chart(fig_dev, use_container_width=True)
 
         st.divider()
 
-        # --- Блок 5: AI-Аналитик ---
+        # --- Блок 5: Развертка весов критериев (без пересчета собственных векторов) ---
+        st.markdown('<div class="fade-in-base">', unsafe_allow_html=True)
+        st.subheader("Чувствительность к Весам Критериев")
+        # Развертка пересчитывает рейтинг как веса критериев x профили - это верно только для синтеза четкой иерархии AHP
+        if last_inputs is None:
+            st.info("В групповом расчете AIP итоговые веса - среднее рейтингов экспертов, поэтому развертка весов не строится.")
+        elif ahp_engine.is_network_session(last_inputs):
+            st.info("Развертка весов предполагает независимые критерии (AHP); для сети ANP она не строится.")
+        elif ahp_engine.is_fuzzy_session(last_inputs):
+            st.info("В нечетком AHP рейтинг - дефаззифицированный нечеткий синтез, поэтому развертка весов не строится.")
+        else:
+            sweep_w, sweep_local, sweep_alts = ahp_sensitivity.sweep_from_results(criteria_w, profiles, criteria_names)
+            sweep_grid, sweep_curves = ahp_sensitivity.weight_sweep(sweep_w, sweep_local)
+            sweep_crit = st.selectbox("Критерий", criteria_names, key="sweep_criterion")
+            c_idx = criteria_names.index(sweep_crit)
+            st.plotly_chart(create_sweep_chart(sweep_crit, sweep_grid, sweep_curves[c_idx], sweep_alts, sweep_w[c_idx]), use_container_width=True)
+            cross_c, cross_a, cross_b, cross_t = ahp_sensitivity.crossover_points(sweep_w, sweep_local)
+            crossovers = [(sweep_alts[a], sweep_alts[b], t) for c, a, b, t in zip(cross_c, cross_a, cross_b, cross_t) if c == c_idx]
+            if crossovers:
+                st.write(f"Точки смены мест (текущий вес '{sweep_crit}': {sweep_w[c_idx]:.2%})")
+                cross_df = pd.DataFrame(crossovers, columns=['Альтернатива A', 'Альтернатива B', 'Вес критерия'])
+                st.dataframe(cross_df.sort_values(by='Вес критерия').style.format({'Вес критерия': '{:.2%}'}), use_container_width=True)
+            else:
+                st.info(f"При любом весе '{sweep_crit}' порядок альтернатив не меняется.")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # --- Блок 6: Устойчивость рейтинга (Монте-Карло) ---
+        with st.expander("🎲 Анализ Чувствительности (Монте-Карло)"):
+            if last_inputs is None:
+                st.info("Анализ чувствительности доступен для единичного расчета и группового расчета методом AIJ.")
+            elif (ahp_engine.parse_tree(last_inputs['criteria_input'])[1] or ahp_engine.is_network_session(last_inputs)
+                  or ahp_engine.is_fuzzy_session(last_inputs)):
+                st.info("Анализ Монте-Карло пока доступен только для иерархии AHP без подкритериев.")
+            else:
+                col_mc1, col_mc2 = st.columns(2)
+                mc_samples = col_mc1.select_slider("Число выборок", options=[1000, 5000, 10000, 50000, 100000], value=10000)
+                mc_mode_labels = {"±1 шаг шкалы Саати": "step", "Логнормальный шум": "lognormal"}
+                mc_mode = mc_mode_labels[col_mc2.selectbox("Возмущение суждений", list(mc_mode_labels))]
+                if st.button("🎲 Запустить анализ устойчивости"):
+                    with st.spinner("Решаем возмущенные иерархии..."):
+                        st.session_state.last_results_sensitivity = ahp_sensitivity.monte_carlo(last_inputs, n_samples=mc_samples, mode=mc_mode)
+                mc_report = st.session_state.get('last_results_sensitivity')
+                if mc_report is not None and mc_report["alternatives"] == list(profiles):
+                    st.metric("Вероятность смены лидера", f"{mc_report['winner_change_rate']:.1%}")
+                    places = [f"{r + 1}-е место" for r in range(len(mc_report["alternatives"]))]
+                    fig_mc = go.Figure(go.Heatmap(z=mc_report["rank_probabilities"], x=places, y=mc_report["alternatives"],
+                                                  colorscale="Blues", zmin=0, zmax=1, texttemplate="%{z:.1%}"))
+                    fig_mc.update_layout(title="Вероятности мест альтернатив")
+                    st.plotly_chart(fig_mc, use_container_width=True)
+                    if mc_report["drivers"]:
+                        st.write("Суждения, сильнее всего влияющие на смену лидера")
+                        drivers_df = pd.DataFrame(mc_report["drivers"], columns=['Суждение', 'Влияние'])
+                        st.dataframe(drivers_df.style.format({'Влияние': '{:.3f}'}), use_container_width=True)
+
+        # --- Блок 7: AI-Аналитик ---
         st.markdown('<div class="fade-in-base">', unsafe_allow_html=True)
         st.subheader("AI-Аналитик")
         if st.button("🤖 Попросить ИИ проанализировать результат"):
             # Печатная машинка запускается здесь
-            st.write_stream(get_ai_analysis_stream(final_w, criteria_w, cr_data))
+            with ahp_metrics.span("render.ai_stream"):
+                st.write_stream(get_ai_analysis_stream(final_w, criteria_w, cr_data, word_delay=0 if st.session_state.ui_fast_mode else 0.02,
+                                                       diagnostics=diagnostics))
         st.markdown('</div>', unsafe_allow_html=True)
 
     else:
@@ -378,6 +844,7 @@ with tab4:
     st.markdown("""
     **Метод Анализа Иерархий (AHP)** — это техника для принятия сложных решений, разработанная Томасом Саати в 1970-х годах. 
     Он помогает структурировать проблему в виде иерархии (Цель -> Критерии -> Альтернативы) и использовать математику для поиска лучшего варианта на основе субъективных суждений экспертов.
+    Критерии можно разбить на подкритерии любой глубины: вес подкритерия умножается на вес родителя, а альтернативы сравниваются по листьям дерева.
     
     ### Как это работает?
     1.  **Попарное Сравнение:** Вместо того чтобы ранжировать 10 критериев, вы сравниваете их попарно ("Что важнее: Цена или Качество?"). Это гораздо проще для человеческого мозга.
@@ -391,8 +858,53 @@ with tab4:
     3.  Рассчитывается **геометрическое среднее** (`(3 * 5) ^ (1/2) = 3.87`).
     4.  Итоговый расчет AHP проводится на этой "усредненной" матрице.
     
+    ### Сети (ANP)
+    Если критерии влияют друг на друга или альтернативы влияют на важность критериев, выберите модель **ANP**.
+    Из всех матриц сравнения собирается суперматрица, а итоговые веса берутся из ее предельной матрицы
+    (степени суперматрицы считаются повторным возведением в квадрат). Без взаимовлияний ANP дает тот же результат, что и AHP.
+    Если обратная связь задана не для всех альтернатив, для остальных важность критериев берется такой же, как относительно цели.
+    
+    ### Нечеткий AHP
+    Если точную оценку дать трудно ("важнее в 3-5 раз"), выберите модель **Нечеткий AHP** и задайте оценку диапазоном.
+    Суждение становится треугольным нечетким числом (нижняя граница, модальное значение, верхняя граница);
+    веса считаются методом Бакли (среднее геометрическое) или анализом протяженности Чанга, а результат показывается
+    вместе с интервалами приоритетов. Нечеткие бюллетени группы усредняются геометрически по каждой границе.
+
+    Также доступен **Метод Агрегирования Индивидуальных Приоритетов (AIP)**: иерархия каждого эксперта решается отдельно,
+    а итоговые веса усредняются (геометрически). Бюллетени с высоким CR можно исключить или учесть с меньшим весом.
+    
     ### Что такое Индекс Согласованности (CR)?
     Это **самая важная** метрика. Она показывает, не противоречил ли эксперт (или группа) сам себе.
     * **CR < 0.1 (или 10%)**: Отлично. Суждения логичны.
     * **CR > 0.1 (или 10%)**: Плохо. Суждения противоречивы, результатам доверять нельзя.
+    
+    CR = CI / RI, где RI — средний индекс согласованности случайных матриц того же размера. Значения RI для любого
+    числа элементов получены симуляцией Монте-Карло по полной шкале Саати. Дополнительно показывается
+    **геометрический индекс согласованности (GCI)**: мера для весов, посчитанных средним геометрическим.
     """)
+
+# --- 14. ПАНЕЛЬ ПРОИЗВОДИТЕЛЬНОСТИ ---
+# Время перезапуска скрипта учитывается до панели: она показывает замеры, накопленные к этому моменту
+script_span.stop()
+with st.sidebar:
+    with st.expander("⏱️ Производительность"):
+        if not ahp_metrics.ENABLED:
+            st.caption("Замеры отключены переменной окружения AHP_METRICS=0.")
+        else:
+            st.toggle("Собирать замеры", key="ui_perf_enabled", help="Время этапов (расчет, агрегация, отрисовка, ввод-вывод) и счетчики событий этой сессии.")
+            recorder = st.session_state.perf_recorder
+            summary = recorder.summary()
+            if summary:
+                perf_df = pd.DataFrame([(name, n, total * 1000, mean * 1000, peak * 1000, last * 1000)
+                                        for name, n, total, mean, peak, last in summary],
+                                       columns=['Этап', 'Вызовов', 'Сумма, мс', 'Среднее, мс', 'Макс, мс', 'Последний, мс'])
+                st.dataframe(perf_df.style.format({c: '{:.1f}' for c in perf_df.columns[2:]}), hide_index=True, use_container_width=True)
+            else:
+                st.caption("Замеров пока нет.")
+            if recorder.counters:
+                counters_df = pd.DataFrame(sorted(recorder.counters.items()), columns=['Счетчик', 'Значение'])
+                st.dataframe(counters_df, hide_index=True, use_container_width=True)
+            col_jsonl, col_prom = st.columns(2)
+            col_jsonl.download_button("JSONL", data=lambda: recorder.to_jsonl(), file_name="ahp_metrics.jsonl", mime="application/x-ndjson")
+            col_prom.download_button("Prometheus", data=lambda: recorder.to_prometheus(), file_name="ahp_metrics.prom", mime="text/plain")
+            st.button("Сбросить замеры", on_click=recorder.reset)